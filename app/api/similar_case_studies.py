@@ -1,19 +1,43 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from starlette.concurrency import iterate_in_threadpool
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
+import asyncio
 import csv
+import hashlib
+import io
+import json
+import logging
 import os
+import threading
+import zlib
 from datetime import datetime
+import numpy as np
 from app.deps import verify_key
-from app.supabase_client import get_all_case_studies
+from app.embedding_snapshot import CASE_STUDY_CORPUS, SHARED_SNAPSHOTS, EmbeddingSnapshot, SnapshotWatcher
+from app.metrics import timed_stage
+from app.response_cache import ResponseCache
+from app.supabase_client import (
+    CASE_STUDY_TEXT_FIELDS,
+    Snapshot,
+    case_studies_snapshot,
+    case_study_embeddings_snapshot,
+    get_case_study_embeddings,
+)
+from app.similarity_calculations.embedding_cache import cache_key, normalize_text
 from app.similarity_calculations.array_overlap import array_overlap_score
+from app.similarity_calculations.case_study_index import SCORE_COLUMNS, CaseStudyIndex
 from app.similarity_calculations.exact_match import exact_match_score
+from app.similarity_calculations.label_bitsets import DIAGNOSIS_HIERARCHY
 from app.similarity_calculations.numeric_closeness import age_proximity_score
-from app.similarity_calculations.text_similarity import text_similarity_score
+from app.similarity_calculations.text_similarity import EMBEDDING_MODEL, embed, embed_many, text_similarity_score
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 # Scoring weights
 WEIGHTS = {
     "state": 0.25, # 0 to 1, exact match
@@ -26,6 +50,23 @@ WEIGHTS = {
     "child_stage": 0.05, # Exact match --> Remove, overlaps with diagnoses too much, make sure "null" gets a match in diagnoses
 }
 
+# Opt-in: diagnoses in the same family (see DIAGNOSIS_HIERARCHY) get partial credit
+USE_DIAGNOSIS_HIERARCHY = os.getenv("DIAGNOSIS_HIERARCHY_MATCHING", "").lower() in ("1", "true", "yes")
+LABEL_HIERARCHIES = {"child_diagnoses": DIAGNOSIS_HIERARCHY} if USE_DIAGNOSIS_HIERARCHY else {}
+
+# Rows per chunk when streaming the scoring CSV
+EXPORT_CHUNK_ROWS = 500
+
+# Batch endpoint: families per request, and families scored per vectorized pass
+# (bounds the (chunk, corpus) score matrices held at once)
+MAX_BATCH_FAMILIES = int(os.getenv("SIMILAR_BATCH_MAX_FAMILIES", "500"))
+BATCH_SCORE_CHUNK = int(os.getenv("SIMILAR_BATCH_SCORE_CHUNK", "32"))
+
+# /similar responses cached per normalized request, for the current corpus and WEIGHTS
+# (0 for either disables the cache)
+SIMILAR_RESPONSE_CACHE_ITEMS = int(os.getenv("SIMILAR_RESPONSE_CACHE_ITEMS", "1024"))
+SIMILAR_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("SIMILAR_RESPONSE_CACHE_TTL_SECONDS", "600"))
+
 class CaseStudyRequest(BaseModel):
     state: str
     current_challenges: List[str]
@@ -36,10 +77,27 @@ class CaseStudyRequest(BaseModel):
     child_stage: str
     child_notes: str
     export_csv: Optional[bool] = True
+    # Optional hard pre-filters on the candidates (they change results, so off by default)
+    same_state_only: Optional[bool] = False
+    max_age_gap: Optional[int] = None
+
 
+# {field: embedding} for one side of a comparison
+FieldEmbeddings = Dict[str, Optional[list]]
 
-def calculate_case_similarity_detailed(input_case: CaseStudyRequest, case_study: Dict[str, Any]) -> Dict[str, float]:
-    """Calculate detailed similarity scores for each component."""
+def calculate_case_similarity_detailed(
+    input_case: CaseStudyRequest,
+    case_study: Dict[str, Any],
+    input_embeddings: Optional[FieldEmbeddings] = None,
+    case_embeddings: Optional[FieldEmbeddings] = None
+) -> Dict[str, float]:
+    """Calculate detailed similarity scores for each component.
+
+    Text components use the precomputed embeddings when provided and fall back to
+    embedding the raw text otherwise.
+    """
+    input_embeddings = input_embeddings or {}
+    case_embeddings = case_embeddings or {}
     
     # Individual component scores
     state_score = exact_match_score(input_case.state, case_study.get("state", ""))
@@ -49,11 +107,15 @@ def calculate_case_similarity_detailed(input_case: CaseStudyRequest, case_study:
     )
     session_notes_score = text_similarity_score(
         input_case.first_session_notes, 
-        case_study.get("first_session_notes", "")
+        case_study.get("first_session_notes", ""),
+        input_embeddings.get("first_session_notes"),
+        case_embeddings.get("first_session_notes")
     )
     additional_info_score = text_similarity_score(
         input_case.additional_info, 
-        case_study.get("additional_info", "")
+        case_study.get("additional_info", ""),
+        input_embeddings.get("additional_info"),
+        case_embeddings.get("additional_info")
     )
     age_score = age_proximity_score(
         input_case.child_age, 
@@ -61,7 +123,8 @@ def calculate_case_similarity_detailed(input_case: CaseStudyRequest, case_study:
     )
     diagnoses_score = array_overlap_score(
         input_case.child_diagnoses, 
-        case_study.get("child_diagnoses", [])
+        case_study.get("child_diagnoses", []),
+        LABEL_HIERARCHIES.get("child_diagnoses")
     )
     stage_score = exact_match_score(
         input_case.child_stage, 
@@ -69,7 +132,9 @@ def calculate_case_similarity_detailed(input_case: CaseStudyRequest, case_study:
     )
     child_notes_score = text_similarity_score(
         input_case.child_notes, 
-        case_study.get("child_notes", "")
+        case_study.get("child_notes", ""),
+        input_embeddings.get("child_notes"),
+        case_embeddings.get("child_notes")
     )
     
     # Calculate weighted total
@@ -97,95 +162,417 @@ def calculate_case_similarity_detailed(input_case: CaseStudyRequest, case_study:
         "weighted_total": round(total_score, 3)
     }
 
-def export_scoring_to_csv(input_case: CaseStudyRequest, all_case_studies: List[Dict[str, Any]]) -> str:
-    """Export detailed scoring results to CSV file."""
-    
-    # Create exports directory if it doesn't exist
-    exports_dir = "exports"
-    os.makedirs(exports_dir, exist_ok=True)
-    
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{exports_dir}/case_similarity_scores_{timestamp}.csv"
-    
-    # Calculate detailed scores for all cases
+EXPORT_FIELDNAMES = [
+    "case_id", "case_state", "case_current_challenges", "case_first_session_notes", 
+    "case_additional_info", "case_age", "case_child_diagnoses", "case_stage", "case_child_notes",
+    "state_score", "challenges_score", "session_notes_score", 
+    "additional_info_score", "age_score", "diagnoses_score", 
+    "stage_score", "child_notes_score", "weighted_total"
+]
+
+def detailed_scores_from_index(index: CaseStudyIndex, scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-case export rows built from an already computed CaseStudyIndex.score() result.
+
+    Rows carry the same keys and rounding as calculate_case_similarity_detailed(), plus
+    the case study info, sorted by weighted total (highest first).
+    """
     detailed_scores = []
-    for case_study in all_case_studies:
-        scores = calculate_case_similarity_detailed(input_case, case_study)
+    for row in index.top_k(scores, len(index)):
+        case_study = index.case_studies[row]
+        detailed = {"case_id": case_study.get("id", "")}
+        for column in SCORE_COLUMNS.values():
+            detailed[column] = round(float(scores[column][row]), 3)
+        detailed["weighted_total"] = round(float(scores["weighted_total"][row]), 3)
         # Add all case study info
-        scores.update({
+        detailed.update({
             "case_state": case_study.get("state", ""),
-            "case_current_challenges": ", ".join(case_study.get("current_challenges", [])),
+            "case_current_challenges": ", ".join(case_study.get("current_challenges") or []),
             "case_first_session_notes": case_study.get("first_session_notes", ""),
             "case_additional_info": case_study.get("additional_info", ""),
             "case_age": case_study.get("child_age", ""),
-            "case_child_diagnoses": ", ".join(case_study.get("child_diagnoses", [])),
+            "case_child_diagnoses": ", ".join(case_study.get("child_diagnoses") or []),
             "case_stage": case_study.get("child_stage", ""),
             "case_child_notes": case_study.get("child_notes", "")
         })
-        detailed_scores.append(scores)
+        detailed_scores.append(detailed)
+    return detailed_scores
+
+def iter_scoring_csv(detailed_scores: List[Dict[str, Any]], compress: bool = False) -> Iterator[bytes]:
+    """Yield the scoring CSV in chunks, optionally gzip-compressed."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDNAMES)
+    # wbits=31 produces a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def drain() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(chunk) if compressor else chunk
+
+    writer.writeheader()
+    for start in range(0, len(detailed_scores), EXPORT_CHUNK_ROWS):
+        writer.writerows(detailed_scores[start:start + EXPORT_CHUNK_ROWS])
+        chunk = drain()
+        if chunk:
+            yield chunk
+    tail = drain()
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+def export_scoring_to_csv(index: CaseStudyIndex, scores: Dict[str, Any]) -> str:
+    """Export detailed scoring results to CSV file."""
     
-    # Sort by weighted total (highest first)
-    detailed_scores.sort(key=lambda x: x["weighted_total"], reverse=True)
+    # Create exports directory if it doesn't exist
+    exports_dir = "exports"
+    os.makedirs(exports_dir, exist_ok=True)
     
-    # Write to CSV
-    fieldnames = [
-        "case_id", "case_state", "case_current_challenges", "case_first_session_notes", 
-        "case_additional_info", "case_age", "case_child_diagnoses", "case_stage", "case_child_notes",
-        "state_score", "challenges_score", "session_notes_score", 
-        "additional_info_score", "age_score", "diagnoses_score", 
-        "stage_score", "child_notes_score", "weighted_total"
-    ]
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{exports_dir}/case_similarity_scores_{timestamp}.csv"
     
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(detailed_scores)
+    with timed_stage("export"), open(filename, 'wb') as csvfile:
+        for chunk in iter_scoring_csv(detailed_scores_from_index(index, scores)):
+            csvfile.write(chunk)
     
     return filename
 
-def calculate_case_similarity(input_case: CaseStudyRequest, case_study: Dict[str, Any]) -> float:
+def embed_input_fields(input_case: CaseStudyRequest) -> FieldEmbeddings:
+    """Embed the request's free-text fields in a single batched call."""
+    texts = [getattr(input_case, field).strip() for field in CASE_STUDY_TEXT_FIELDS]
+    result = embed_many(texts)
+    return dict(zip(CASE_STUDY_TEXT_FIELDS, result.embeddings))
+
+def embed_batch_input_fields(input_cases: List[CaseStudyRequest]) -> List[FieldEmbeddings]:
+    """Embed the free-text fields of many requests with one deduplicated embed_many() call."""
+    texts = [getattr(input_case, field).strip() for input_case in input_cases for field in CASE_STUDY_TEXT_FIELDS]
+    result = embed_many(texts)
+    width = len(CASE_STUDY_TEXT_FIELDS)
+    return [
+        dict(zip(CASE_STUDY_TEXT_FIELDS, result.embeddings[start:start + width]))
+        for start in range(0, len(texts), width)
+    ]
+
+async def embed_input_fields_async(input_case: CaseStudyRequest) -> FieldEmbeddings:
+    """Embed the request's free-text fields concurrently without blocking the event loop."""
+    async def embed_field(field: str) -> Optional[list]:
+        text = getattr(input_case, field).strip()
+        if not text:
+            return None
+        return await asyncio.to_thread(embed, text)
+
+    with timed_stage("embed_input"):
+        embeddings = await asyncio.gather(*(embed_field(field) for field in CASE_STUDY_TEXT_FIELDS))
+    return dict(zip(CASE_STUDY_TEXT_FIELDS, embeddings))
+
+def resolve_case_embeddings(
+    all_case_studies: List[Dict[str, Any]],
+    stored: Optional[Dict[Any, Dict[str, Dict[str, Any]]]] = None
+) -> Dict[Any, FieldEmbeddings]:
+    """Stored per-field embeddings for the corpus, keyed by case study id.
+
+    A stored vector is only used when its content hash matches the case's current text.
+    Missing or stale fields (e.g. cases added since the last cron run) are embedded in
+    one batched call so a stale table never turns into per-case API calls. `stored` is
+    fetched with get_case_study_embeddings() when not passed in.
+    """
+    if stored is None:
+        stored = get_case_study_embeddings()
+    resolved: Dict[Any, FieldEmbeddings] = {}
+    missing = []
+    for case_study in all_case_studies:
+        case_fields = stored.get(case_study["id"], {})
+        resolved[case_study["id"]] = {}
+        for field in CASE_STUDY_TEXT_FIELDS:
+            text = (case_study.get(field) or "").strip()
+            if not text:
+                continue
+            entry = case_fields.get(field)
+            if entry and entry["content_hash"] == cache_key(EMBEDDING_MODEL, text):
+                resolved[case_study["id"]][field] = entry["embedding"]
+            else:
+                missing.append((case_study["id"], field, text))
+
+    if missing:
+        result = embed_many([text for _, _, text in missing])
+        for (case_id, field, _), embedding in zip(missing, result.embeddings):
+            resolved[case_id][field] = embedding
+    return resolved
+
+similar_response_cache = ResponseCache("similar", SIMILAR_RESPONSE_CACHE_ITEMS, SIMILAR_RESPONSE_CACHE_TTL_SECONDS)
+
+def similar_request_key(req: CaseStudyRequest) -> str:
+    """Canonical hash of everything in a request (and WEIGHTS) that affects /similar results.
+
+    Normalized only where the scorers already are: exact-match fields and labels ignore
+    case and surrounding whitespace, label lists are compared as sets, and free text
+    gets the embedding cache's whitespace normalization (it stays case-sensitive since
+    the embedding is). `export_csv` doesn't change the response and is left out.
+    """
+    def label(value: Optional[str]) -> str:
+        return (value or "").lower().strip()
+
+    def labels(values: List[str]) -> List[str]:
+        return sorted({label(value) for value in values if value and value.strip()})
+
+    canonical = {
+        "state": label(req.state),
+        "child_stage": label(req.child_stage),
+        "current_challenges": labels(req.current_challenges),
+        "child_diagnoses": labels(req.child_diagnoses),
+        "child_age": req.child_age,
+        "same_state_only": bool(req.same_state_only),
+        "max_age_gap": req.max_age_gap,
+        "weights": WEIGHTS,
+        "diagnosis_hierarchy": USE_DIAGNOSIS_HIERARCHY,
+    }
+    for field in CASE_STUDY_TEXT_FIELDS:
+        canonical[field] = normalize_text(getattr(req, field))
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+_case_study_index: Optional[Tuple[Tuple[Any, ...], CaseStudyIndex]] = None
+_case_study_index_lock = threading.Lock()
+_case_study_corpus = SnapshotWatcher(CASE_STUDY_CORPUS)
+# (case snapshot version, corpus version) -> shared index, or None if the corpus is stale
+_shared_case_study_index: Optional[Tuple[Tuple[Any, ...], Optional[CaseStudyIndex]]] = None
+
+def build_shared_case_study_index(all_case_studies: List[Dict[str, Any]], corpus: EmbeddingSnapshot) -> Optional[CaseStudyIndex]:
+    """An index whose text matrices are the published, memory-mapped case study corpus.
+
+    Only used when the corpus covers exactly the current cases with vectors of their
+    current texts (by content hash); otherwise returns None and the caller builds a
+    private index until the cron publishes a matching version.
+    """
+    by_id = {case_study["id"]: case_study for case_study in all_case_studies}
+    if len(by_id) != len(corpus.ids) or any(case_id not in by_id for case_id in corpus.ids):
+        return None
+    ordered = [by_id[case_id] for case_id in corpus.ids]
+    fields = [name.split(".", 1)[1] for name in corpus.columns if name.startswith("content_hash.")]
+    text_matrices = {}
+    for field in CASE_STUDY_TEXT_FIELDS:
+        if field not in fields:
+            return None
+        hashes = corpus.columns[f"content_hash.{field}"]
+        for case_study, content_hash in zip(ordered, hashes):
+            text = (case_study.get(field) or "").strip()
+            if content_hash != (cache_key(EMBEDDING_MODEL, text) if text else None):
+                return None
+        present = np.array([content_hash is not None for content_hash in hashes], dtype=bool)
+        text_matrices[field] = (corpus.matrix[fields.index(field)], present)
+    return CaseStudyIndex(ordered, hierarchies=LABEL_HIERARCHIES, text_matrices=text_matrices)
+
+def get_shared_case_study_index(cases: Snapshot) -> Optional[Tuple[Tuple[Any, ...], CaseStudyIndex]]:
+    """(versions, shared-corpus index) for this case snapshot, or None when it cannot be used."""
+    global _shared_case_study_index
+    corpus = _case_study_corpus.get()
+    if corpus is None:
+        return None
+    versions = (cases.version, corpus.version)
+    current = _shared_case_study_index
+    if current is None or current[0] != versions:
+        with _case_study_index_lock:
+            if _shared_case_study_index is None or _shared_case_study_index[0] != versions:
+                with timed_stage("build_index"):
+                    index = build_shared_case_study_index(list(cases.data), corpus)
+                if index is None:
+                    logger.warning("Shared case study corpus %s does not match the current cases; using a private index", corpus.version)
+                _shared_case_study_index = (versions, index)
+            current = _shared_case_study_index
+    return current if current[1] is not None else None
+
+def get_versioned_case_study_index() -> Tuple[Tuple[Any, ...], CaseStudyIndex]:
+    """get_case_study_index() together with the corpus versions the index was built from."""
+    global _case_study_index
+    cases = case_studies_snapshot.get()
+    if SHARED_SNAPSHOTS:
+        shared = get_shared_case_study_index(cases)
+        if shared is not None:
+            return shared
+    stored = case_study_embeddings_snapshot.get()
+    versions = (cases.version, stored.version)
+
+    current = _case_study_index
+    if current is not None and current[0] == versions:
+        return current
+    with _case_study_index_lock:
+        if _case_study_index is None or _case_study_index[0] != versions:
+            with timed_stage("build_index"):
+                all_case_studies = list(cases.data)
+                case_embeddings = resolve_case_embeddings(all_case_studies, stored.data)
+                _case_study_index = (versions, CaseStudyIndex(all_case_studies, case_embeddings, LABEL_HIERARCHIES))
+        return _case_study_index
+
+def get_case_study_index() -> CaseStudyIndex:
+    """Vectorized index over the current corpus snapshots, rebuilt only when they change.
+
+    With shared snapshots enabled the text matrices come from the published corpus that
+    all worker processes map, and the embeddings table is not fetched at all.
+    """
+    return get_versioned_case_study_index()[1]
+
+def calculate_case_similarity(
+    input_case: CaseStudyRequest,
+    case_study: Dict[str, Any],
+    input_embeddings: Optional[FieldEmbeddings] = None,
+    case_embeddings: Optional[FieldEmbeddings] = None
+) -> float:
     """Calculate overall similarity score between input and a case study."""
-    detailed = calculate_case_similarity_detailed(input_case, case_study)
+    detailed = calculate_case_similarity_detailed(input_case, case_study, input_embeddings, case_embeddings)
     return detailed["weighted_total"]
 
+def candidate_rows_for(index: CaseStudyIndex, req: CaseStudyRequest) -> Optional[Any]:
+    """Rows passing the request's pre-filters (None when it sets none)."""
+    return index.candidate_rows(
+        state=req.state if req.same_state_only else None,
+        age=req.child_age,
+        max_age_gap=req.max_age_gap
+    )
+
+async def score_request(
+    req: CaseStudyRequest,
+    full_scores: bool = True,
+    index: Optional[CaseStudyIndex] = None
+) -> Tuple[CaseStudyIndex, Optional[Dict[str, Any]], Any, Any, FieldEmbeddings]:
+    """Embed the request and score it against the corpus.
+
+    Returns (index, scores, top 5 rows, their totals, the input embeddings).
+
+    With `full_scores=False` only the top 5 are needed, so the index prunes cases that
+    cannot place instead of scoring all of them, and `scores` is None. The current
+    index is used unless one is passed in.
+    """
+    # The Supabase and OpenAI clients are synchronous, so run them in worker threads.
+    # The corpus comes from the in-memory snapshot; only the input fields are embedded.
+    if index is None:
+        index, input_embeddings = await asyncio.gather(
+            asyncio.to_thread(get_case_study_index),
+            embed_input_fields_async(req)
+        )
+    else:
+        input_embeddings = await embed_input_fields_async(req)
+    
+    def score_cases():
+        rows = candidate_rows_for(index, req)
+        if not full_scores:
+            with timed_stage("search"):
+                top_rows, top_totals = index.search(req, input_embeddings, WEIGHTS, 5, rows)
+            return None, top_rows, top_totals
+        # Score every case study in one vectorized pass and select the top 5
+        with timed_stage("score"):
+            scores = index.score(req, input_embeddings, WEIGHTS)
+        with timed_stage("sort"):
+            top_rows = index.top_k(scores, 5, rows)
+        return scores, top_rows, scores["weighted_total"][top_rows]
+
+    scores, top_rows, top_totals = await asyncio.to_thread(score_cases)
+    return index, scores, top_rows, top_totals, input_embeddings
+
+async def export_request_to_csv(req: CaseStudyRequest) -> None:
+    """Score a request against the current corpus and export it (for cached responses)."""
+    index, scores, _top_rows, _top_totals, _input_embeddings = await score_request(req)
+    await asyncio.to_thread(export_scoring_to_csv, index, scores)
+
 @router.post("/similar")
 async def get_similar_case_studies(
     req: CaseStudyRequest, 
+    background_tasks: BackgroundTasks,
     _: None = Depends(verify_key)
 ) -> Dict[str, Any]:
     
-    all_case_studies = get_all_case_studies()
+    # Repeat requests against an unchanged corpus are answered from the response cache
+    key = similar_request_key(req)
+    versions, index = await asyncio.to_thread(get_versioned_case_study_index)
+    cached = similar_response_cache.get(key, versions)
+    if cached is not None:
+        if req.export_csv:
+            background_tasks.add_task(export_request_to_csv, req)
+        return cached
+
+    # The CSV export needs every case's scores; otherwise only the top 5 are computed
+    index, scores, top_rows, top_totals, input_embeddings = await score_request(req, full_scores=bool(req.export_csv), index=index)
     
-    # Export to CSV if requested
-    csv_filename = None
+    # Export to CSV if requested, from the same scores, after the response is sent
     if req.export_csv:
-        csv_filename = export_scoring_to_csv(req, all_case_studies)
-    
-    # Calculate similarity scores for all case studies
-    scored_cases = []
-    for case_study in all_case_studies:
-        similarity_score = calculate_case_similarity(req, case_study)
-        scored_cases.append({
-            "case_study": case_study,
-            "similarity_score": similarity_score
-        })
-    
-    # Sort by similarity score (highest first)
-    scored_cases.sort(key=lambda x: x["similarity_score"], reverse=True)
-    
-    # Return top 5 most similar cases
-    top_cases = scored_cases[:5]
+        background_tasks.add_task(export_scoring_to_csv, index, scores)
     
     response = {
         "similar_cases": [
             {
-                "id": case["case_study"]["id"],
-                "similarity_score": round(case["similarity_score"], 3)
+                "id": index.ids[row],
+                "similarity_score": round(float(total), 3)
 
             }
-            for case in top_cases
+            for row, total in zip(top_rows, top_totals)
         ]
     }
+    # A failed input embedding scores as 0 instead of erroring; don't cache that result
+    if all(input_embeddings.get(field) is not None for field in CASE_STUDY_TEXT_FIELDS if getattr(req, field).strip()):
+        similar_response_cache.put(key, versions, response)
     
-    return response
\ No newline at end of file
+    return response
+
+@router.post("/similar/batch")
+async def get_similar_case_studies_batch(
+    reqs: List[CaseStudyRequest],
+    _: None = Depends(verify_key)
+) -> Dict[str, Any]:
+    """Top 5 similar cases for each family, in request order.
+
+    All families' text fields are embedded together and scored against the corpus in
+    chunks of matrix-matrix products. `export_csv` is ignored here; use /similar/export
+    for a single family's detailed scores.
+    """
+    if len(reqs) > MAX_BATCH_FAMILIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FAMILIES} families per batch")
+
+    def embed_families() -> List[FieldEmbeddings]:
+        with timed_stage("embed_input"):
+            return embed_batch_input_fields(reqs)
+
+    index, input_embeddings = await asyncio.gather(
+        asyncio.to_thread(get_case_study_index),
+        asyncio.to_thread(embed_families)
+    )
+
+    def score_families() -> List[Dict[str, Any]]:
+        results = []
+        for start in range(0, len(reqs), BATCH_SCORE_CHUNK):
+            end = start + BATCH_SCORE_CHUNK
+            with timed_stage("score"):
+                totals = index.score_batch(reqs[start:end], input_embeddings[start:end], WEIGHTS)["weighted_total"]
+            with timed_stage("sort"):
+                for req, total in zip(reqs[start:end], totals):
+                    rows = candidate_rows_for(index, req)
+                    results.append({
+                        "similar_cases": [
+                            {"id": index.ids[row], "similarity_score": round(float(total[row]), 3)}
+                            for row in index.top_k({"weighted_total": total}, 5, rows)
+                        ]
+                    })
+        return results
+
+    return {"results": await asyncio.to_thread(score_families)}
+
+@router.post("/similar/export")
+async def export_similar_case_studies(
+    req: CaseStudyRequest,
+    gzip: bool = False,
+    _: None = Depends(verify_key)
+) -> StreamingResponse:
+    """Stream the detailed per-case scores as a CSV download (optionally gzipped)."""
+    index, scores, _top_rows, _top_totals, _input_embeddings = await score_request(req)
+    def export_rows() -> List[Dict[str, Any]]:
+        with timed_stage("export"):
+            return detailed_scores_from_index(index, scores)
+
+    detailed_scores = await asyncio.to_thread(export_rows)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"case_similarity_scores_{timestamp}.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iterate_in_threadpool(iter_scoring_csv(detailed_scores, compress=gzip)),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
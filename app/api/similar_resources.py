@@ -1,34 +1,157 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Tuple
 
-import csv
+import asyncio
+import logging
 import os
-from datetime import datetime
+import threading
 from app.deps import verify_key
-from app.supabase_client import get_all_case_studies
-from app.similarity_calculations.array_overlap import array_overlap_score
-from app.similarity_calculations.exact_match import exact_match_score
-from app.similarity_calculations.numeric_closeness import age_proximity_score
-from app.similarity_calculations.text_similarity import text_similarity_score
+from app.metrics import timed_stage
 
-def get_similar_resources_for_next_step(text) -> List[Dict[str, Any]]:
-    from app.supabase_client import get_all_resources_with_embeddings
-    from app.similarity_calculations.text_similarity import cosine_similarity, embed
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# Where resource search runs, per deployment: "exact" (resident in-process index),
+# "rpc" (the match_resources database function) or "ann" (the IVF-PQ index file at
+# RESOURCE_ANN_INDEX_PATH). All three return the same response shape.
+RESOURCE_SEARCH_BACKENDS = ("exact", "rpc", "ann")
+RESOURCE_SEARCH_BACKEND = os.getenv("RESOURCE_SEARCH_BACKEND", "exact")
+if RESOURCE_SEARCH_BACKEND not in RESOURCE_SEARCH_BACKENDS:
+    raise ValueError(f"Unknown RESOURCE_SEARCH_BACKEND {RESOURCE_SEARCH_BACKEND!r}, expected one of {RESOURCE_SEARCH_BACKENDS}")
+
+MAX_RESOURCE_RESULTS = int(os.getenv("RESOURCE_SEARCH_MAX_RESULTS", "50"))
+
+class ResourceSearchRequest(BaseModel):
+    # Blank queries would still cost an embeddings call, so they are rejected with a 422
+    text: str = Field(..., min_length=1, pattern=r"\S")
+    k: int = Field(5, ge=1, le=MAX_RESOURCE_RESULTS)
+    # Drop matches below this cosine similarity (applied the same way on every backend)
+    min_similarity: Optional[float] = None
+
+# Each backend maps (query embedding, k) to [(cosine similarity, resource id)], best first
+Matches = List[Tuple[float, Any]]
+
+def _search_exact(embedding: list, k: int) -> Matches:
+    from app.similarity_calculations.resource_index import get_resource_index
+
+    # Resident, pre-normalized index: one matrix-vector product instead of a table scan
+    return [(score, resource["id"]) for score, resource in get_resource_index().search(embedding, k)]
+
+def _search_rpc(embedding: list, k: int) -> Matches:
+    from app.supabase_client import match_resources_by_embedding
+
+    # No threshold in the database; min_similarity is applied to all backends alike
+    rows = match_resources_by_embedding(embedding, match_count=k, match_threshold=-1.0)
+    return [(float(row["similarity"]), row["id"]) for row in rows]
+
+_ann_index: Optional[Tuple[float, Any]] = None
+_ann_lock = threading.Lock()
+
+def _get_ann_index():
+    """The persisted resource ANN index, reloaded when the cron replaces the file."""
+    global _ann_index
+    from app.similarity_calculations.ann_index import RESOURCE_ANN_INDEX_PATH, IVFPQIndex
+
+    if not RESOURCE_ANN_INDEX_PATH or not os.path.exists(RESOURCE_ANN_INDEX_PATH):
+        return None
+    modified = os.path.getmtime(RESOURCE_ANN_INDEX_PATH)
+    with _ann_lock:
+        if _ann_index is None or _ann_index[0] != modified:
+            _ann_index = (modified, IVFPQIndex.load(RESOURCE_ANN_INDEX_PATH))
+        return _ann_index[1]
 
-    resources = get_all_resources_with_embeddings()
-    input_embedding = embed(text)
+def _search_ann(embedding: list, k: int) -> Matches:
+    index = _get_ann_index()
+    if index is None:
+        logger.warning("No resource ANN index at RESOURCE_ANN_INDEX_PATH, using the exact index")
+        return _search_exact(embedding, k)
+    return index.search(embedding, k)
+
+SEARCH_BACKENDS = {"exact": _search_exact, "rpc": _search_rpc, "ann": _search_ann}
+
+_resources_by_id: Optional[Tuple[int, Dict[Any, Dict[str, Any]]]] = None
+
+def get_resources_by_id() -> Dict[Any, Dict[str, Any]]:
+    """{id: resource} over the resources snapshot, rebuilt once per snapshot version."""
+    global _resources_by_id
+    from app.supabase_client import resources_snapshot
+
+    snapshot = resources_snapshot.get()
+    current = _resources_by_id
+    if current is None or current[0] != snapshot.version:
+        current = _resources_by_id = (snapshot.version, {resource["id"]: resource for resource in snapshot.data})
+    return current[1]
+
+def search_resources(
+    text: str,
+    k: int = 5,
+    min_similarity: Optional[float] = None,
+    backend: str = RESOURCE_SEARCH_BACKEND
+) -> List[Dict[str, Any]]:
+    """The k resources most similar to `text`, each with its `similarity_score`.
+
+    The query embedding goes through embed() and so through the embedding cache;
+    repeated queries cost no API call. Resource fields come from the resources
+    snapshot whichever backend found them, so responses look the same.
+    """
+    from app.similarity_calculations.text_similarity import embed
+
+    with timed_stage("resource_embed"):
+        input_embedding = embed(text)
     if input_embedding is None:
         return []
 
-    scored_resources = []
-    for resource in resources:
-        resource_embedding = resource.get("embedding", {}).get("embedding")
-        if resource_embedding:
-            score = cosine_similarity(input_embedding, resource_embedding)
-            scored_resources.append((score, resource))
+    with timed_stage("resource_search"):
+        matches = SEARCH_BACKENDS[backend](input_embedding, k)
+
+    resources_by_id = get_resources_by_id()
+    results = []
+    for score, resource_id in matches:
+        if min_similarity is not None and score < min_similarity:
+            continue
+        resource = resources_by_id.get(resource_id)
+        # The backends can briefly know resources the snapshot hasn't picked up yet
+        if resource is None:
+            continue
+        results.append(dict(resource, similarity_score=round(float(score), 3)))
+    return results
+
+def get_similar_resources_for_next_step(text) -> List[Dict[str, Any]]:
+    return search_resources(text, 5)  # Return top 5 similar resources
+
+def get_recommended_resources_for_user(user_id: str, k: int = 5) -> List[Dict[str, Any]]:
+    """A user's precomputed top-k resources (see app.user_recommendations); [] if none yet."""
+    from app.user_recommendations import get_user_recommendations
+
+    recommendations = get_user_recommendations(user_id) or []
+    resources_by_id = get_resources_by_id()
+    top_resources = []
+    for recommendation in recommendations:
+        resource = resources_by_id.get(recommendation["resource_id"])
+        if resource is not None:
+            top_resources.append(dict(resource, similarity_score=round(float(recommendation["score"]), 3)))
+        if len(top_resources) == k:
+            break
+    return top_resources
 
-    scored_resources.sort(key=lambda x: x[0], reverse=True)
-    top_resources = [res for score, res in scored_resources[:5]]  # Return top 5 similar resources
+@router.post("/search")
+async def get_similar_resources(
+    req: ResourceSearchRequest,
+    _: None = Depends(verify_key)
+) -> Dict[str, Any]:
+    """Top k resources for a free-text query, from the configured search backend."""
+    # The Supabase and OpenAI clients are synchronous, so run them in a worker thread
+    resources = await asyncio.to_thread(search_resources, req.text, req.k, req.min_similarity)
+    return {"similar_resources": resources}
 
-    return top_resources
\ No newline at end of file
+@router.get("/users/{user_id}")
+async def get_user_recommended_resources(
+    user_id: str,
+    k: int = Query(5, ge=1, le=MAX_RESOURCE_RESULTS),
+    _: None = Depends(verify_key)
+) -> Dict[str, Any]:
+    """A user's precomputed recommendations, in the same shape as /search."""
+    resources = await asyncio.to_thread(get_recommended_resources_for_user, user_id, k)
+    return {"similar_resources": resources}
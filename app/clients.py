@@ -0,0 +1,53 @@
+import os
+import threading
+from typing import Any, Callable, Optional
+
+# Per-request timeout of the OpenAI client (the SDK default is 10 minutes)
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+
+
+class LazyClient:
+    """Stands in for an API client and constructs it on first use.
+
+    Attribute access is forwarded to the real client, so call sites keep using
+    `supabase.table(...)` / `client.embeddings.create(...)`. One instance (and with it
+    one HTTP connection pool) is shared by every thread in the process.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None
+
+    def get(self) -> Any:
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+def create_supabase_client():
+    from supabase import create_client
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set to use Supabase")
+    return create_client(url, key)
+
+
+def create_openai_client():
+    from openai import OpenAI
+
+    # Retries are handled by with_backoff() so rate limits are honored the same way everywhere
+    return OpenAI(max_retries=0, timeout=OPENAI_TIMEOUT_SECONDS)
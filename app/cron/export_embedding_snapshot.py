@@ -0,0 +1,13 @@
+from dotenv import load_dotenv
+
+# Load .env BEFORE importing any routers or deps
+load_dotenv()
+
+from app.embedding_snapshot import SNAPSHOT_DIR, export_embedding_snapshots
+
+if __name__ == "__main__":
+    print("Starting embedding snapshot export...")
+    versions = export_embedding_snapshots()
+    for name, version in versions.items():
+        print(f"Wrote {SNAPSHOT_DIR}/{name}.{version}.npy")
+    print("Embedding snapshot export completed.")
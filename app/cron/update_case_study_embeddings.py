@@ -0,0 +1,15 @@
+from dotenv import load_dotenv
+
+# Load .env BEFORE importing any routers or deps
+load_dotenv()
+
+from app.embedding_snapshot import CASE_STUDY_CORPUS, publish_shared_snapshots
+from app.supabase_client import add_embeddings_to_case_studies
+
+if __name__ == "__main__":
+    print("Starting case study embeddings update...")
+    add_embeddings_to_case_studies()
+    # Workers serving shared snapshots swap to the new version on their next check
+    for name, version in publish_shared_snapshots(CASE_STUDY_CORPUS).items():
+        print(f"Published shared snapshot {name} {version}")
+    print("Case study embeddings update completed.")
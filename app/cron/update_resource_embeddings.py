@@ -3,9 +3,13 @@ from dotenv import load_dotenv
 # Load .env BEFORE importing any routers or deps
 load_dotenv()
 
+from app.embedding_snapshot import publish_shared_snapshots
 from app.supabase_client import add_embeddings_to_resources
 
 if __name__ == "__main__":
     print("Starting resource embeddings update...")
     add_embeddings_to_resources()
+    # Workers serving shared snapshots swap to the new version on their next check
+    for name, version in publish_shared_snapshots("resources").items():
+        print(f"Published shared snapshot {name} {version}")
     print("Resource embeddings update completed.")
\ No newline at end of file
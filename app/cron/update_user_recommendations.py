@@ -0,0 +1,11 @@
+from dotenv import load_dotenv
+
+# Load .env BEFORE importing any routers or deps
+load_dotenv()
+
+from app.user_recommendations import update_user_recommendations
+
+if __name__ == "__main__":
+    print("Starting user recommendations update...")
+    update_user_recommendations()
+    print("User recommendations update completed.")
\ No newline at end of file
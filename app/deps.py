@@ -1,10 +1,12 @@
+import logging
 import os
 from fastapi import Header, HTTPException
 
 API_KEY = os.getenv("SIMILARITY_API_KEY")
-print("DEBUG EXPECTED KEY:", API_KEY)
+
+logger = logging.getLogger(__name__)
 
 def verify_key(x_api_key: str = Header(None)):
-    print("DEBUG RECEIVED KEY:", x_api_key)
     if x_api_key != API_KEY:
+        logger.debug("Rejected request with %s API key", "a wrong" if x_api_key else "no")
         raise HTTPException(status_code=401, detail="Unauthorized")
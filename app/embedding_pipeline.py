@@ -0,0 +1,134 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from app.retry import with_backoff
+from app.similarity_calculations.text_similarity import EmbeddingBatchResult, embed_many
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBEDDING_PIPELINE_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBEDDING_PIPELINE_CONCURRENCY", "4"))
+UPSERT_SIZE = int(os.getenv("EMBEDDING_UPSERT_SIZE", "500"))
+
+# A row to write (without its embedding) and the text to embed for it
+PipelineItem = Tuple[Dict[str, Any], str]
+
+
+@dataclass
+class PipelineStats:
+    embedded: int = 0
+    written: int = 0
+    failed: int = 0
+    api_calls: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+    failures: List[Tuple[Dict[str, Any], str]] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.written / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+def _chunks(items: Iterable[PipelineItem], size: int) -> Iterator[List[PipelineItem]]:
+    chunk: List[PipelineItem] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_embedding_pipeline(
+    items: Iterable[PipelineItem],
+    write_rows: Callable[[List[Dict[str, Any]]], Any],
+    embed_batch: Callable[[List[str]], EmbeddingBatchResult] = embed_many,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    upsert_size: int = UPSERT_SIZE,
+) -> PipelineStats:
+    """Embed items and write them out with embedding and database I/O overlapped.
+
+    Up to `concurrency` embedding batches are in flight at once. Finished batches are
+    handed to a single writer thread through a bounded queue, which buffers rows into
+    multi-row `write_rows()` calls of `upsert_size`. Writes are retried with backoff on
+    rate limits and server errors; embedding retries happen inside `embed_batch`.
+
+    Both `embed_batch` and `write_rows` are injectable so the pipeline can run against
+    local stand-ins for the embeddings endpoint and Supabase.
+    """
+    stats = PipelineStats()
+    # The writer thread and the calling thread both update stats
+    stats_lock = threading.Lock()
+    started = time.perf_counter()
+    # Bounded so a slow database applies backpressure to embedding instead of buffering
+    write_queue: "queue.Queue" = queue.Queue(maxsize=max(concurrency, 1) * 2)
+
+    def flush(rows: List[Dict[str, Any]]) -> None:
+        try:
+            with_backoff(lambda: write_rows(rows))
+            with stats_lock:
+                stats.written += len(rows)
+        except Exception as e:
+            with stats_lock:
+                stats.failed += len(rows)
+                stats.failures.extend((row, str(e)) for row in rows)
+
+    def writer() -> None:
+        buffer: List[Dict[str, Any]] = []
+        while True:
+            rows = write_queue.get()
+            if rows is None:
+                break
+            buffer.extend(rows)
+            while len(buffer) >= upsert_size:
+                flush(buffer[:upsert_size])
+                buffer = buffer[upsert_size:]
+        if buffer:
+            flush(buffer)
+
+    def embed_chunk(chunk: List[PipelineItem]) -> Tuple[List[PipelineItem], EmbeddingBatchResult]:
+        return chunk, embed_batch([text for _, text in chunk])
+
+    def collect(future: Future) -> None:
+        chunk, result = future.result()
+        rows = []
+        failures = []
+        for index, (row, _) in enumerate(chunk):
+            embedding = result.embeddings[index]
+            if embedding is None:
+                failures.append((row, result.errors.get(index, "no embedding returned")))
+                continue
+            rows.append({**row, "embedding": embedding})
+        with stats_lock:
+            stats.batches += 1
+            stats.api_calls += result.api_calls
+            stats.embedded += len(rows)
+            stats.failed += len(failures)
+            stats.failures.extend(failures)
+        if rows:
+            write_queue.put(rows)
+
+    writer_thread = threading.Thread(target=writer, name="embedding-writer", daemon=True)
+    writer_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+            in_flight = set()
+            for chunk in _chunks(items, batch_size):
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                in_flight.add(pool.submit(embed_chunk, chunk))
+            for future in wait(in_flight).done:
+                collect(future)
+    finally:
+        write_queue.put(None)
+        writer_thread.join()
+
+    stats.elapsed_seconds = time.perf_counter() - started
+    return stats
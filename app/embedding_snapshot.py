@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.similarity_calculations.vector_codec import decode_embeddings
+
+SNAPSHOT_DIR = os.getenv("EMBEDDING_SNAPSHOT_DIR", "snapshots")
+FORMAT_VERSION = 1
+
+# Serve the resident corpus from published snapshots that every worker process maps
+# read-only, instead of each worker fetching and holding its own copy. The embedding
+# crons publish a new version after each run.
+SHARED_SNAPSHOTS = os.getenv("SHARED_EMBEDDING_SNAPSHOTS", "").lower() in ("1", "true", "yes")
+SHARED_SNAPSHOT_CHECK_SECONDS = float(os.getenv("SHARED_SNAPSHOT_CHECK_SECONDS", "5"))
+
+# Row-aligned case study text embeddings: (field, case, dim), one pointer for all fields
+CASE_STUDY_CORPUS = "case_study_corpus"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmbeddingSnapshot:
+    """A read-only, memory-mapped embedding matrix with its id index."""
+    name: str
+    version: str
+    ids: List[Any]
+    matrix: np.ndarray
+    created_at: float
+    columns: Dict[str, List[Any]] = field(default_factory=dict)
+    id_index: Dict[Any, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.id_index:
+            self.id_index = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def vector(self, id_) -> np.ndarray:
+        return self.matrix[self.id_index[id_]]
+
+
+def _paths(directory: str, name: str, version: str):
+    base = os.path.join(directory, f"{name}.{version}")
+    return base + ".npy", base + ".json"
+
+
+def _pointer_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.current")
+
+
+def write_snapshot(
+    name: str,
+    ids: List[Any],
+    matrix: np.ndarray,
+    directory: str = SNAPSHOT_DIR,
+    columns: Optional[Dict[str, List[Any]]] = None,
+    row_axis: int = 0
+) -> str:
+    """Write a versioned snapshot and atomically make it the current one.
+
+    The matrix goes to `<name>.<version>.npy` (float32, C-contiguous so it can be
+    memory-mapped) and the header, id index and any per-row `columns` (e.g. content
+    hashes) to `<name>.<version>.json`. `<name>.current` is swapped to point at the new
+    version last, so readers never see a half-written snapshot. Returns the version.
+
+    `row_axis` is the matrix axis the ids index, for stacked matrices such as
+    (field, row, dim) where each field should stay contiguous.
+    """
+    if matrix.shape[row_axis] != len(ids):
+        raise ValueError(f"{len(ids)} ids for a matrix with {matrix.shape[row_axis]} rows")
+    os.makedirs(directory, exist_ok=True)
+    created_at = time.time()
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(created_at)) + f"{int(created_at * 1000) % 1000:03d}-{os.getpid()}"
+    matrix_path, manifest_path = _paths(directory, name, version)
+
+    np.save(matrix_path, np.ascontiguousarray(matrix, dtype=np.float32))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "name": name,
+            "version": version,
+            "created_at": created_at,
+            "count": int(matrix.shape[row_axis]),
+            "dim": int(matrix.shape[-1]) if matrix.ndim >= 2 else 0,
+            "row_axis": row_axis,
+            "dtype": "float32",
+            "ids": list(ids),
+            "columns": columns or {}
+        }, f)
+
+    pointer = _pointer_path(directory, name)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    return version
+
+
+def current_version(name: str, directory: str = SNAPSHOT_DIR) -> str:
+    with open(_pointer_path(directory, name), encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def open_snapshot(name: str, directory: str = SNAPSHOT_DIR, version: Optional[str] = None) -> EmbeddingSnapshot:
+    """Open the current (or given) snapshot version without parsing any vectors.
+
+    The matrix is memory-mapped read-only, so opening costs one small JSON read and
+    pages are loaded lazily and shared with every other process mapping the same file.
+    """
+    version = version or current_version(name, directory)
+    matrix_path, manifest_path = _paths(directory, name, version)
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')} in {manifest_path}")
+    matrix = np.load(matrix_path, mmap_mode="r")
+    rows = matrix.shape[manifest.get("row_axis", 0)]
+    if rows != manifest["count"]:
+        raise ValueError(f"Snapshot {name} {version} has {rows} rows, manifest says {manifest['count']}")
+    return EmbeddingSnapshot(
+        name=name,
+        version=version,
+        ids=manifest["ids"],
+        matrix=matrix,
+        created_at=manifest["created_at"],
+        columns=manifest.get("columns", {})
+    )
+
+
+def prune_snapshots(name: str, keep: int = 2, directory: str = SNAPSHOT_DIR) -> None:
+    """Delete all but the `keep` newest versions of a snapshot (never the current one)."""
+    current = current_version(name, directory)
+    prefix = f"{name}."
+    versions = sorted(
+        {f[len(prefix):-len(".json")] for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(".json")},
+        reverse=True
+    )
+    for version in versions[keep:]:
+        if version == current:
+            continue
+        for path in _paths(directory, name, version):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _decode_pages(pages: Iterable[List[Dict[str, Any]]], id_column: str) -> Tuple[List[Any], List[Optional[str]], np.ndarray]:
+    """(ids, content hashes, vectors) of the rows that have an embedding.
+
+    Pages are decoded as they arrive, so only one page of raw rows is held at a time.
+    """
+    ids: List[Any] = []
+    hashes: List[Optional[str]] = []
+    matrices = []
+    for page in pages:
+        matrix, present = decode_embeddings([row["embedding"] for row in page])
+        for row, has_embedding in zip(page, present):
+            if has_embedding:
+                ids.append(row[id_column])
+                hashes.append(row.get("content_hash"))
+        if present.any():
+            matrices.append(matrix[present])
+    matrix = np.concatenate(matrices) if matrices else np.zeros((0, 0), dtype=np.float32)
+    return ids, hashes, matrix
+
+
+def _case_study_field_vectors(text_field: str) -> Tuple[List[Any], List[Optional[str]], np.ndarray]:
+    from app.supabase_client import iter_table_pages
+
+    pages = iter_table_pages(
+        "case_study_embeddings", ("case_study_id", "content_hash", "embedding"),
+        key="case_study_id", filters={"field": text_field}
+    )
+    return _decode_pages(pages, "case_study_id")
+
+
+def export_resource_snapshot(directory: str = SNAPSHOT_DIR) -> str:
+    """Publish `resources`: row-normalized vectors keyed by resource id, with content hashes."""
+    from app.supabase_client import iter_resource_embedding_pages
+
+    ids, hashes, matrix = _decode_pages(iter_resource_embedding_pages(), "resource_id")
+    return write_snapshot("resources", ids, _normalize_rows(matrix), directory, columns={"content_hash": hashes})
+
+
+def export_case_study_corpus(
+    directory: str = SNAPSHOT_DIR,
+    field_vectors: Optional[Dict[str, Tuple[List[Any], List[Optional[str]], np.ndarray]]] = None
+) -> str:
+    """Publish the row-aligned case study corpus served by shared-snapshot workers.
+
+    One (field, case, dim) matrix of row-normalized vectors over every case study, in id
+    order, with a `content_hash.<field>` column per field (None where the case has no
+    current stored vector for that field). `field_vectors` are the stored
+    {field: (case ids, content hashes, vectors)} if already fetched. Returns the version.
+    """
+    from app.similarity_calculations.embedding_cache import cache_key
+    from app.similarity_calculations.text_similarity import EMBEDDING_MODEL
+    from app.supabase_client import CASE_STUDY_TEXT_FIELDS, get_all_case_studies
+
+    case_studies = get_all_case_studies()
+    ids = [case_study["id"] for case_study in case_studies]
+    if field_vectors is None:
+        field_vectors = {text_field: _case_study_field_vectors(text_field) for text_field in CASE_STUDY_TEXT_FIELDS}
+    dim = max((field_vectors[text_field][2].shape[1] for text_field in CASE_STUDY_TEXT_FIELDS), default=0)
+    stacked = np.zeros((len(CASE_STUDY_TEXT_FIELDS), len(ids), dim), dtype=np.float32)
+    columns: Dict[str, List[Any]] = {}
+    for position, text_field in enumerate(CASE_STUDY_TEXT_FIELDS):
+        stored_ids, stored_hashes, matrix = field_vectors[text_field]
+        stored_rows = {case_id: row for row, case_id in enumerate(stored_ids)}
+        hashes: List[Optional[str]] = []
+        for case_row, case_study in enumerate(case_studies):
+            text = (case_study.get(text_field) or "").strip()
+            row = stored_rows.get(case_study["id"])
+            # Only vectors of the case's current text; readers detect the gaps by hash
+            current = bool(text) and row is not None and stored_hashes[row] == cache_key(EMBEDDING_MODEL, text)
+            hashes.append(stored_hashes[row] if current else None)
+            if current:
+                stacked[position, case_row, :matrix.shape[1]] = matrix[row]
+        columns[f"content_hash.{text_field}"] = hashes
+    return write_snapshot(CASE_STUDY_CORPUS, ids, _normalize_rows(stacked), directory, columns, row_axis=1)
+
+
+def export_embedding_snapshots(directory: str = SNAPSHOT_DIR) -> Dict[str, str]:
+    """Export resource and case-study embeddings from Supabase to local snapshots.
+
+    Writes `resources` (row-normalized, keyed by resource id, with content hashes), one
+    `case_studies.<field>` snapshot per text field (keyed by case study id, with the
+    content hash of each vector) and the row-aligned `case_study_corpus`.
+    Returns {snapshot name: version}.
+    """
+    from app.supabase_client import CASE_STUDY_TEXT_FIELDS
+
+    versions = {}
+    versions["resources"] = export_resource_snapshot(directory)
+
+    field_vectors = {}
+    for text_field in CASE_STUDY_TEXT_FIELDS:
+        field_vectors[text_field] = ids, hashes, matrix = _case_study_field_vectors(text_field)
+        versions[f"case_studies.{text_field}"] = write_snapshot(
+            f"case_studies.{text_field}", ids, matrix, directory, columns={"content_hash": hashes}
+        )
+    versions[CASE_STUDY_CORPUS] = export_case_study_corpus(directory, field_vectors)
+
+    for name in versions:
+        prune_snapshots(name, directory=directory)
+    return versions
+
+
+def publish_shared_snapshots(*names: str, directory: str = SNAPSHOT_DIR) -> Dict[str, str]:
+    """Re-publish the snapshots shared-snapshot workers serve from, if that mode is on.
+
+    Called by the embedding crons after a run; `names` is any of "resources" and
+    CASE_STUDY_CORPUS. Returns {snapshot name: version} of what was written.
+    """
+    if not SHARED_SNAPSHOTS:
+        return {}
+    versions = {}
+    if "resources" in names:
+        versions["resources"] = export_resource_snapshot(directory)
+    if CASE_STUDY_CORPUS in names:
+        versions[CASE_STUDY_CORPUS] = export_case_study_corpus(directory)
+    for name in versions:
+        prune_snapshots(name, directory=directory)
+    return versions
+
+
+class SnapshotWatcher:
+    """The current version of a published snapshot, swapped when a new one is published.
+
+    Checking is a read of the small `<name>.current` pointer at most every
+    `check_interval` seconds. A new version is opened (memory-mapped, so every process
+    shares the same pages) and swapped in as one reference assignment; readers holding
+    the previous one keep a valid mapping even after it is pruned from disk.
+    """
+
+    def __init__(self, name: str, directory: str = SNAPSHOT_DIR, check_interval: float = SHARED_SNAPSHOT_CHECK_SECONDS):
+        self.name = name
+        self.directory = directory
+        self.check_interval = check_interval
+        self._snapshot: Optional[EmbeddingSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[EmbeddingSnapshot]:
+        """The current snapshot, or None while nothing has been published."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and time.time() - self._checked_at < self.check_interval:
+                return self._snapshot
+            self._checked_at = time.time()
+            try:
+                version = current_version(self.name, self.directory)
+                if self._snapshot is None or self._snapshot.version != version:
+                    self._snapshot = open_snapshot(self.name, self.directory, version)
+            except (OSError, ValueError) as e:
+                logger.warning("Cannot open shared snapshot %s: %s", self.name, e)
+            return self._snapshot
@@ -1,15 +1,56 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import time
 
 # Load .env BEFORE importing any routers or deps
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
 from app.api.similar_case_studies import router as case_study_router
+from app.api.similar_resources import router as similar_resource_router
+from app.metrics import Counter, Histogram, render_metrics
+from app.warmup import WARMUP_ON_STARTUP, warm_up
 # from app.api.recommended_resources import router as resource_router
 # from app.api.recommended_tasks import router as task_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load snapshots, indexes and caches before the server starts accepting requests,
+    # so the first callers after a deploy don't pay for it
+    if WARMUP_ON_STARTUP:
+        await asyncio.to_thread(warm_up)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(case_study_router, prefix="/similar-case-studies", tags=["similar-case-studies"])
+app.include_router(similar_resource_router, prefix="/similar-resources", tags=["similar-resources"])
 # app.include_router(resource_router, prefix="/recommended-resources", tags=["recommended-resources"])
 # app.include_router(task_router, prefix="/recommended-tasks", tags=["recommended-tasks"])
+
+http_requests = Counter("http_requests_total", "HTTP requests, by route and status code.", labels=("method", "route", "status"))
+http_request_seconds = Histogram("http_request_seconds", "HTTP request latency, by route.", labels=("method", "route"))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep the series bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    http_request_seconds.observe(time.perf_counter() - started, method=request.method, route=route)
+    http_requests.inc(method=request.method, route=route, status=str(response.status_code))
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    """Prometheus text exposition of the request, stage, embedding and snapshot metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
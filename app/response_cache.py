@@ -0,0 +1,99 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from app.metrics import Counter
+
+response_cache_events = Counter(
+    "response_cache_events_total",
+    "Response cache lookups (hit, miss, expired) and evictions (evicted, invalidated), per cache.",
+    labels=("cache", "event")
+)
+
+
+class ResponseCache:
+    """Bounded LRU of computed responses with a TTL, tied to one corpus version.
+
+    Entries are only valid for the `version` they were computed against: the first
+    lookup or insert with a new version drops the whole cache, so a corpus refresh
+    invalidates every response at once without a background sweep. Versions only move
+    forward: requests still holding a version the cache has moved past (during a
+    snapshot rollover) miss and don't store anything, instead of switching it back.
+    Values are copied in and out, so callers may mutate what they put or get.
+    """
+
+    # Superseded versions remembered to recognize stale requests
+    RETIRED_VERSIONS = 32
+
+    def __init__(self, name: str, max_items: int, ttl: float):
+        self.name = name
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._version: Any = None
+        self._retired: "OrderedDict[Any, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 and self.ttl > 0
+
+    def _switch_version(self, version: Any) -> bool:
+        """Make `version` current unless it has been superseded; False for a stale version."""
+        if version == self._version:
+            return True
+        if version in self._retired:
+            return False
+        if self._entries:
+            response_cache_events.inc(len(self._entries), cache=self.name, event="invalidated")
+        self._entries.clear()
+        if self._version is not None:
+            self._retired[self._version] = None
+            while len(self._retired) > self.RETIRED_VERSIONS:
+                self._retired.popitem(last=False)
+        self._version = version
+        return True
+
+    def get(self, key: Hashable, version: Any) -> Optional[Any]:
+        """The response stored for `key` under `version`, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key) if self._switch_version(version) else None
+            if entry is None:
+                event, value = "miss", None
+            elif time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                event, value = "expired", None
+            else:
+                self._entries.move_to_end(key)
+                event, value = "hit", entry[1]
+        response_cache_events.inc(cache=self.name, event=event)
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, version: Any, value: Any) -> None:
+        if not self.enabled:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if not self._switch_version(version):
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            response_cache_events.inc(evicted, cache=self.name, event="evicted")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._retired.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,65 @@
+import os
+import random
+import time
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))
+BASE_DELAY_SECONDS = float(os.getenv("API_RETRY_BASE_DELAY", "0.5"))
+MAX_DELAY_SECONDS = float(os.getenv("API_RETRY_MAX_DELAY", "30"))
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        # postgrest's APIError carries the HTTP status as a string code
+        code = getattr(error, "code", None)
+        if isinstance(code, str) and code.isdigit():
+            status = int(code)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and transport failures are worth retrying."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts from httpx / openai carry no status
+    return any(name in type(error).__name__ for name in ("Connection", "Timeout", "Transport", "Network"))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def with_backoff(
+    fn: Callable[[], T],
+    retries: int = MAX_RETRIES,
+    base_delay: float = BASE_DELAY_SECONDS,
+    max_delay: float = MAX_DELAY_SECONDS,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """Call fn, retrying retryable errors with jittered exponential backoff.
+
+    A Retry-After header on the error takes precedence over the computed delay.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            sleep(min(delay, max_delay))
+            attempt += 1
@@ -0,0 +1,120 @@
+import sys
+import os
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.similarity_calculations.ann_index import build_ivfpq_index
+from app.similarity_calculations.case_study_index import top_k_indices
+from app.similarity_calculations.resource_index import ResourceIndex
+
+# (n_lists, n_subvectors) index shapes, then (nprobe, rerank) query settings to compare
+INDEX_PARAMS = [(None, 48), (None, 96)]
+QUERY_PARAMS = [(4, 0), (16, 0), (32, 0), (16, 50), (32, 100)]
+
+# (storage, dims, rerank) settings for the compact exact-search index
+QUANTIZED_PARAMS = [
+    ("float32", 0, 0), ("float16", 0, 0), ("int8", 0, 0), ("int8", 0, 100),
+    ("float32", 512, 100), ("int8", 512, 0), ("int8", 512, 100), ("int8", 256, 100),
+]
+
+def load_resource_vectors(synthetic: int) -> Tuple[List, np.ndarray]:
+    """Resource embeddings from the local snapshot, Supabase, or a clustered synthetic set."""
+    if synthetic:
+        # Topics -> subtopics -> items, so neighborhoods have structure like real embeddings
+        rng = np.random.default_rng(0)
+        topics = rng.standard_normal((max(synthetic // 500, 8), 1536)).astype(np.float32)
+        subtopics = topics[rng.integers(0, topics.shape[0], max(synthetic // 20, 16))]
+        subtopics += 0.7 * rng.standard_normal(subtopics.shape).astype(np.float32)
+        vectors = subtopics[rng.integers(0, subtopics.shape[0], synthetic)]
+        vectors += 0.4 * rng.standard_normal(vectors.shape).astype(np.float32)
+        return list(range(synthetic)), vectors
+
+    try:
+        from app.embedding_snapshot import open_snapshot
+        snapshot = open_snapshot("resources")
+        print(f"Using local snapshot {snapshot.version}")
+        return snapshot.ids, np.asarray(snapshot.matrix)
+    except FileNotFoundError:
+        from app.supabase_client import get_resource_embeddings
+        from app.similarity_calculations.vector_codec import decode_embeddings
+        rows = get_resource_embeddings()
+        matrix, present = decode_embeddings([row["embedding"] for row in rows])
+        return [row["resource_id"] for row, ok in zip(rows, present) if ok], matrix[present]
+
+def make_queries(vectors: np.ndarray, queries: int) -> np.ndarray:
+    """Perturbed catalog vectors, like a user text close to a few resources."""
+    rng = np.random.default_rng(1)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = normalized[rng.integers(0, vectors.shape[0], queries)]
+    noise = rng.standard_normal(query_vectors.shape) * (0.3 / np.sqrt(vectors.shape[1]))
+    return (query_vectors + noise).astype(np.float32)
+
+def recall_report(ids: List, vectors: np.ndarray, queries: int = 200, k: int = 10) -> None:
+    """Print recall@k and per-query latency of the ANN index against exact search."""
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = make_queries(vectors, queries)
+
+    id_array = np.asarray(ids, dtype=object)
+    started = time.perf_counter()
+    truth = [set(id_array[top_k_indices(normalized @ q, k)]) for q in query_vectors]
+    exact_ms = (time.perf_counter() - started) / queries * 1000
+    print(f"{len(ids)} vectors, exact search: {exact_ms:.2f} ms/query\n")
+
+    print(f"{'n_lists':>8} {'subvec':>6} {'nprobe':>6} {'rerank':>6} {'recall@' + str(k):>10} {'ms/query':>9} {'bytes/vec':>9}")
+    for n_lists, n_subvectors in INDEX_PARAMS:
+        params = {"n_subvectors": n_subvectors}
+        if n_lists:
+            params["n_lists"] = n_lists
+        index = build_ivfpq_index(ids, vectors, keep_vectors=True, **params)
+        for nprobe, rerank in QUERY_PARAMS:
+            started = time.perf_counter()
+            results = [index.search(q, k, nprobe=nprobe, rerank=rerank) for q in query_vectors]
+            ms = (time.perf_counter() - started) / queries * 1000
+            recall = np.mean([len(truth[i] & {id_ for _, id_ in result}) / k for i, result in enumerate(results)])
+            print(f"{index.n_lists:>8} {n_subvectors:>6} {nprobe:>6} {rerank:>6} {recall:>10.3f} {ms:>9.2f} {n_subvectors:>9}")
+
+def quantization_report(ids: List, vectors: np.ndarray, queries: int = 200, k: int = 10) -> None:
+    """Print recall@k, exact top-k order agreement, latency and resident bytes per vector
+    of the compact ResourceIndex storage options against full-precision float32."""
+    resources = [{"id": id_, "embedding": vector} for id_, vector in zip(ids, vectors)]
+    query_vectors = make_queries(vectors, queries)
+    exact = ResourceIndex(resources, "float32", 0)
+    truth = [[resource["id"] for _, resource in exact.search(q, k)] for q in query_vectors]
+    full_bytes = exact.compact.nbytes / len(exact)
+
+    print(f"\n{'storage':>8} {'dims':>5} {'rerank':>6} {'recall@' + str(k):>10} {'same order':>10} {'ms/query':>9} {'bytes/vec':>9} {'smaller':>7}")
+    for storage, dims, rerank in QUANTIZED_PARAMS:
+        # rerank=0 ranks by the compact scores alone (k candidates, nothing re-scored)
+        index = ResourceIndex(resources, storage, dims, rerank)
+        started = time.perf_counter()
+        results = [[resource["id"] for _, resource in index.search(q, k)] for q in query_vectors]
+        ms = (time.perf_counter() - started) / queries * 1000
+        recall = np.mean([len(set(truth[i]) & set(result)) / k for i, result in enumerate(results)])
+        same_order = np.mean([truth[i] == result for i, result in enumerate(results)])
+        per_vector = index.compact.nbytes / len(index)
+        print(f"{storage:>8} {index.compact.dims:>5} {rerank:>6} {recall:>10.3f} {same_order:>10.3f} {ms:>9.2f} {per_vector:>9.0f} {full_bytes / per_vector:>6.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ANN recall@k and latency against exact search.")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N clustered synthetic vectors instead of real embeddings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--quantized", action="store_true", help="compare compact exact-search storage instead of the ANN index")
+    args = parser.parse_args()
+
+    ids, vectors = load_resource_vectors(args.synthetic)
+    if args.quantized:
+        print("Starting quantized storage comparison...")
+        quantization_report(ids, vectors, args.queries, args.k)
+    else:
+        print("Starting ANN recall comparison...\n")
+        recall_report(ids, vectors, args.queries, args.k)
@@ -3,7 +3,6 @@ import os
 from typing import List, Dict, Any
 import csv
 from datetime import datetime
-import json
 import numpy as np
 
 # Add the project root to Python path
@@ -13,8 +12,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.supabase_client import get_all_resources_with_embeddings
-from app.similarity_calculations.text_similarity import cosine_similarity, embed
-from app.supabase_client import get_user_profile_by_id, get_child_diagnoses_by_user_id
+from app.similarity_calculations.text_similarity import embed
+from app.similarity_calculations.vector_codec import decode_embeddings
+from app.supabase_client import get_user_profile_by_id, get_child_diagnoses_by_user_id, user_profile_text
 
 user_examples = [
     "fa26393b-bf47-4fb0-b3fd-01c13903d06b"
@@ -40,9 +40,14 @@ def calculate_resource_similarity_to_csv(test_cases: List[str]) -> str:
     for user_id in test_cases:
         user_profile = get_user_profile_by_id(user_id)
         child_diagnoses = get_child_diagnoses_by_user_id(user_id)
-        combined_text = f"{user_profile.get('current_challenges', '')} {user_profile.get('first_session_notes', '')} {user_profile.get('additional_info', '')} {' '.join(child_diagnoses)}"
+        combined_text = user_profile_text(user_profile, child_diagnoses)
         users_data.append((user_id, combined_text))
     
+    # Decode every resource embedding into one normalized float32 matrix up front
+    matrix, present = decode_embeddings([resource.get("embedding") for resource in resources])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+
     # Calculate scores for each test case
     all_rows = []
     for user_id, test_text in users_data:
@@ -52,53 +57,28 @@ def calculate_resource_similarity_to_csv(test_cases: List[str]) -> str:
         if input_embedding is None:
             print(f"  Warning: Could not generate embedding for '{test_text}'")
             continue
+
+        query = np.asarray(input_embedding, dtype=np.float32)
+        scores = matrix @ (query / np.linalg.norm(query))
         
-        for resource in resources:
-            # Handle the embedding structure - it's a list with a dict inside
-            embedding_data = resource.get("embedding", [])
-            resource_embedding = None
-            
-            if embedding_data and len(embedding_data) > 0:
-                raw_embedding = embedding_data[0].get("embedding")
-                
-                # Parse the embedding if it's a string
-                if isinstance(raw_embedding, str):
-                    try:
-                        # Try parsing as JSON first
-                        resource_embedding = json.loads(raw_embedding)
-                    except json.JSONDecodeError:
-                        # If that fails, it might be a numpy array string representation
-                        try:
-                            resource_embedding = eval(raw_embedding)
-                        except:
-                            print(f"  Warning: Could not parse embedding for resource {resource.get('id')}")
-                            continue
-                elif isinstance(raw_embedding, list):
-                    resource_embedding = raw_embedding
-                else:
-                    resource_embedding = raw_embedding
-            
-            if resource_embedding:
-                try:
-                    score = cosine_similarity(input_embedding, resource_embedding)
-                    
-                    all_rows.append({
-                        "test_case": test_text,
-                        "resource_id": resource.get("id", ""),
-                        "resource_title": resource.get("title", ""),
-                        "resource_description": resource.get("description", ""),
-                        "resource_type": resource.get("type", ""),
-                        "resource_source": resource.get("source", ""),
-                        "resource_category": resource.get("category", ""),
-                        "resource_topics": ", ".join(resource.get("topics", [])) if resource.get("topics") else "",
-                        "resource_recommend_if": resource.get("recommend_if", ""),
-                        "resource_state": resource.get("state", ""),
-                        "resource_organization": resource.get("organization", ""),
-                        "resource_default_navigator_note": resource.get("default_navigator_note", ""),
-                        "similarity_score": round(score, 4)
-                    })
-                except Exception as e:
-                    print(f"  Warning: Error calculating similarity for resource {resource.get('id')}: {e}")
+        for row, resource in enumerate(resources):
+            if not present[row]:
+                continue
+            all_rows.append({
+                "test_case": test_text,
+                "resource_id": resource.get("id", ""),
+                "resource_title": resource.get("title", ""),
+                "resource_description": resource.get("description", ""),
+                "resource_type": resource.get("type", ""),
+                "resource_source": resource.get("source", ""),
+                "resource_category": resource.get("category", ""),
+                "resource_topics": ", ".join(resource.get("topics", [])) if resource.get("topics") else "",
+                "resource_recommend_if": resource.get("recommend_if", ""),
+                "resource_state": resource.get("state", ""),
+                "resource_organization": resource.get("organization", ""),
+                "resource_default_navigator_note": resource.get("default_navigator_note", ""),
+                "similarity_score": round(float(scores[row]), 4)
+            })
     
     # Sort by test case, then by similarity score (highest first)
     all_rows.sort(key=lambda x: (x["test_case"], -x["similarity_score"]))
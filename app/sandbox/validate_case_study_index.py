@@ -0,0 +1,72 @@
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../tests')))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.api.similar_case_studies import (
+    LABEL_HIERARCHIES,
+    WEIGHTS,
+    CaseStudyRequest,
+    calculate_case_similarity_detailed,
+    embed_input_fields,
+    resolve_case_embeddings,
+)
+from app.similarity_calculations.case_study_index import CaseStudyIndex, SCORE_COLUMNS
+from app.supabase_client import get_all_case_studies
+from child_situation_examples import TEST_FAMILY_1, TEST_FAMILY_2, TEST_FAMILY_3
+
+# float32 embedding matrices vs float64 scalar cosine
+TOLERANCE = 1e-5
+
+def validate(families) -> int:
+    """Compare the vectorized scorer against the scalar one for every case and component."""
+    all_case_studies = get_all_case_studies()
+    case_embeddings = resolve_case_embeddings(all_case_studies)
+    index = CaseStudyIndex(all_case_studies, case_embeddings, LABEL_HIERARCHIES)
+
+    mismatches = 0
+    for family in families:
+        req = CaseStudyRequest(**family)
+        input_embeddings = embed_input_fields(req)
+        scores = index.score(req, input_embeddings, WEIGHTS)
+
+        for row, case_study in enumerate(all_case_studies):
+            expected = calculate_case_similarity_detailed(
+                req, case_study, input_embeddings, case_embeddings.get(case_study["id"])
+            )
+            for column in list(SCORE_COLUMNS.values()) + ["weighted_total"]:
+                actual = float(scores[column][row])
+                # The scalar scorer rounds to 3 places
+                if abs(round(actual, 3) - expected[column]) > 0.001 + TOLERANCE:
+                    mismatches += 1
+                    print(f"  Case {case_study['id']} {column}: scalar={expected[column]} vectorized={actual:.6f}")
+
+        scalar_ranking = sorted(
+            all_case_studies,
+            key=lambda case: calculate_case_similarity_detailed(
+                req, case, input_embeddings, case_embeddings.get(case["id"])
+            )["weighted_total"],
+            reverse=True
+        )[:5]
+        vectorized_ranking = [index.ids[row] for row in index.top_k(scores, 5)]
+        print(f"Scalar top 5:     {[case['id'] for case in scalar_ranking]}")
+        print(f"Vectorized top 5: {vectorized_ranking}")
+
+        # Pruned search must agree exactly with ranking the exhaustive scores
+        top_rows, top_totals = index.search(req, input_embeddings, WEIGHTS, 5)
+        expected_rows = index.top_k(scores, 5)
+        if list(top_rows) != list(expected_rows) or list(top_totals) != list(scores["weighted_total"][expected_rows]):
+            mismatches += 1
+            print(f"  Pruned search top 5 {[index.ids[row] for row in top_rows]} differs")
+
+    return mismatches
+
+if __name__ == "__main__":
+    print("Validating vectorized case study scoring...\n")
+    mismatches = validate([TEST_FAMILY_1, TEST_FAMILY_2, TEST_FAMILY_3])
+    print(f"\nCompleted with {mismatches} mismatching component score(s).")
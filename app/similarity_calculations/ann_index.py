@@ -0,0 +1,310 @@
+import os
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.similarity_calculations.case_study_index import top_k_indices
+
+RESOURCE_ANN_INDEX_PATH = os.getenv("RESOURCE_ANN_INDEX_PATH", "")
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# PQ codes alone give recall@10 around 0.6; re-ranking a shortlist at full precision
+# (which needs the vectors kept in the index) brings it to ~1.0
+DEFAULT_RERANK = int(os.getenv("ANN_RERANK", "100"))
+# Whether the persisted resource index stores full-precision vectors for re-ranking
+ANN_KEEP_VECTORS = os.getenv("ANN_KEEP_VECTORS", "true").lower() in ("1", "true", "yes")
+
+# Rows per chunk when computing distances, to bound temporary memory
+_CHUNK_ROWS = 8192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for every row of data."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(data.shape[0], dtype=np.int32)
+    for start in range(0, data.shape[0], _CHUNK_ROWS):
+        chunk = data[start:start + _CHUNK_ROWS]
+        # ||x - c||^2 without the constant ||x||^2 term
+        distances = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+        assignments[start:start + _CHUNK_ROWS] = np.argmin(distances, axis=1)
+    return assignments
+
+
+def _id_array(ids: Sequence[Any]) -> np.ndarray:
+    """Ids as an object array, so ints and uuid strings round-trip as Python values."""
+    array = np.empty(len(ids), dtype=object)
+    array[:] = list(ids)
+    return array
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        # Per-cluster sums via one sort + reduceat rather than a scatter-add
+        order = np.argsort(assignments, kind="stable")
+        starts = (np.cumsum(counts) - counts)[~empty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantized residuals, for cosine similarity.
+
+    Vectors are normalized, assigned to the nearest of `n_lists` coarse centroids and
+    their residuals encoded as `n_subvectors` one-byte codes. A query scans only the
+    `nprobe` closest lists using per-query lookup tables, so cost grows with
+    nprobe / n_lists of the catalog rather than all of it. Optionally the best
+    `rerank` candidates are rescored exactly against full-precision vectors.
+
+    Knobs: more lists -> faster scans and lower recall at a fixed nprobe; more
+    subvectors -> better approximations and more bytes per vector; nprobe and rerank
+    trade latency for recall at query time.
+    """
+
+    def __init__(self, dim: int, n_lists: int = 256, n_subvectors: int = 48, keep_vectors: bool = False):
+        if dim % n_subvectors:
+            raise ValueError(f"dim {dim} is not divisible by n_subvectors {n_subvectors}")
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.sub_dim = dim // n_subvectors
+        self.keep_vectors = keep_vectors
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self._list_ids: List[List[np.ndarray]] = []
+        self._list_codes: List[List[np.ndarray]] = []
+        self._list_vectors: List[List[np.ndarray]] = []
+        self._id_to_list = {}
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._id_to_list)
+
+    def train(self, vectors: np.ndarray, sample_size: int = 65536, seed: int = 0) -> None:
+        """Learn coarse centroids and PQ codebooks from (a sample of) the vectors."""
+        data = _normalize(vectors)
+        rng = np.random.default_rng(seed)
+        if data.shape[0] > sample_size:
+            data = data[rng.choice(data.shape[0], sample_size, replace=False)]
+
+        self.n_lists = min(self.n_lists, data.shape[0])
+        self.centroids = kmeans(data, self.n_lists, seed=seed)
+        residuals = data - self.centroids[_nearest(data, self.centroids)]
+
+        n_codes = min(256, residuals.shape[0])
+        self.codebooks = np.zeros((self.n_subvectors, 256, self.sub_dim), dtype=np.float32)
+        for m in range(self.n_subvectors):
+            sub = residuals[:, m * self.sub_dim:(m + 1) * self.sub_dim]
+            self.codebooks[m, :n_codes] = kmeans(sub, n_codes, iterations=15, seed=seed + m)
+
+        self._list_ids = [[] for _ in range(self.n_lists)]
+        self._list_codes = [[] for _ in range(self.n_lists)]
+        self._list_vectors = [[] for _ in range(self.n_lists)]
+        self._id_to_list = {}
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((residuals.shape[0], self.n_subvectors), dtype=np.uint8)
+        for m in range(self.n_subvectors):
+            sub = residuals[:, m * self.sub_dim:(m + 1) * self.sub_dim]
+            codes[:, m] = _nearest(sub, self.codebooks[m])
+        return codes
+
+    def add(self, ids: Sequence[Any], vectors: np.ndarray) -> None:
+        """Insert (or replace) vectors. Can be called at any time after train()."""
+        if not self.is_trained:
+            raise RuntimeError("IVFPQIndex must be trained before adding vectors")
+        self.remove([id_ for id_ in ids if id_ in self._id_to_list])
+        data = _normalize(vectors)
+        lists = _nearest(data, self.centroids)
+        codes = self._encode(data - self.centroids[lists])
+        ids_array = _id_array(ids)
+        for list_no in np.unique(lists):
+            rows = np.flatnonzero(lists == list_no)
+            self._list_ids[list_no].append(ids_array[rows])
+            self._list_codes[list_no].append(codes[rows])
+            if self.keep_vectors:
+                self._list_vectors[list_no].append(data[rows])
+        for id_, list_no in zip(ids, lists):
+            self._id_to_list[id_] = int(list_no)
+
+    def remove(self, ids: Iterable[Any]) -> None:
+        by_list = {}
+        for id_ in ids:
+            list_no = self._id_to_list.pop(id_, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, []).append(id_)
+        for list_no, removed in by_list.items():
+            self._compact(list_no)
+            removed_ids = set(removed)
+            keep = np.array([id_ not in removed_ids for id_ in self._list_ids[list_no][0]], dtype=bool)
+            self._list_ids[list_no] = [self._list_ids[list_no][0][keep]]
+            self._list_codes[list_no] = [self._list_codes[list_no][0][keep]]
+            if self.keep_vectors:
+                self._list_vectors[list_no] = [self._list_vectors[list_no][0][keep]]
+
+    def _compact(self, list_no: int) -> None:
+        """Merge a list's appended chunks into single arrays."""
+        if len(self._list_ids[list_no]) == 1:
+            return
+        if not self._list_ids[list_no]:
+            self._list_ids[list_no] = [np.empty(0, dtype=object)]
+            self._list_codes[list_no] = [np.empty((0, self.n_subvectors), dtype=np.uint8)]
+            if self.keep_vectors:
+                self._list_vectors[list_no] = [np.empty((0, self.dim), dtype=np.float32)]
+            return
+        self._list_ids[list_no] = [np.concatenate(self._list_ids[list_no])]
+        self._list_codes[list_no] = [np.concatenate(self._list_codes[list_no])]
+        if self.keep_vectors:
+            self._list_vectors[list_no] = [np.concatenate(self._list_vectors[list_no])]
+
+    def search(
+        self,
+        query,
+        k: int = 5,
+        nprobe: int = DEFAULT_NPROBE,
+        rerank: int = DEFAULT_RERANK,
+    ) -> List[Tuple[float, Any]]:
+        """Approximate top-k by cosine similarity as (score, id) pairs, best first."""
+        if not self.is_trained or len(self) == 0:
+            return []
+        q = _normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+        probe = top_k_indices(self.centroids @ q, min(nprobe, self.n_lists))
+
+        # Per-subspace inner products of the query with every codeword
+        tables = np.einsum("msd,md->ms", self.codebooks, q.reshape(self.n_subvectors, self.sub_dim))
+        subspaces = np.arange(self.n_subvectors)
+
+        candidate_ids, candidate_scores, candidate_vectors = [], [], []
+        for list_no in probe:
+            self._compact(list_no)
+            codes = self._list_codes[list_no][0]
+            if codes.shape[0] == 0:
+                continue
+            base = float(self.centroids[list_no] @ q)
+            candidate_scores.append(base + tables[subspaces, codes].sum(axis=1))
+            candidate_ids.append(self._list_ids[list_no][0])
+            if self.keep_vectors:
+                candidate_vectors.append(self._list_vectors[list_no][0])
+        if not candidate_ids:
+            return []
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if rerank and self.keep_vectors:
+            shortlist = top_k_indices(scores, max(rerank, k))
+            exact = np.concatenate(candidate_vectors)[shortlist] @ q
+            order = top_k_indices(exact, k)
+            return [(float(exact[i]), ids[shortlist[i]]) for i in order]
+        return [(float(scores[i]), ids[i]) for i in top_k_indices(scores, k)]
+
+    def save(self, path: str) -> None:
+        """Persist the index to a single .npz file (written atomically)."""
+        for list_no in range(self.n_lists):
+            self._compact(list_no)
+        lengths = np.array([ids[0].shape[0] for ids in self._list_ids], dtype=np.int64)
+        arrays = {
+            "meta": np.array([self.dim, self.n_lists, self.n_subvectors, int(self.keep_vectors)], dtype=np.int64),
+            "centroids": self.centroids,
+            "codebooks": self.codebooks,
+            "lengths": lengths,
+            "ids": np.concatenate([ids[0] for ids in self._list_ids]).astype(str),
+            "id_types": np.array(
+                [0 if isinstance(i, (int, np.integer)) else 1 for ids in self._list_ids for i in ids[0]],
+                dtype=np.uint8,
+            ),
+            "codes": np.concatenate([codes[0] for codes in self._list_codes]),
+        }
+        if self.keep_vectors:
+            arrays["vectors"] = np.concatenate([vectors[0] for vectors in self._list_vectors])
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        with np.load(path, allow_pickle=False) as arrays:
+            dim, n_lists, n_subvectors, keep_vectors = (int(v) for v in arrays["meta"])
+            index = cls(dim, n_lists, n_subvectors, bool(keep_vectors))
+            index.centroids = arrays["centroids"]
+            index.codebooks = arrays["codebooks"]
+            ids = [int(i) if t == 0 else str(i) for i, t in zip(arrays["ids"], arrays["id_types"])]
+            codes = arrays["codes"]
+            vectors = arrays["vectors"] if keep_vectors else None
+            offsets = np.concatenate([[0], np.cumsum(arrays["lengths"])])
+
+        index._list_ids, index._list_codes, index._list_vectors = [], [], []
+        for list_no in range(n_lists):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index._list_ids.append([_id_array(ids[start:end])])
+            index._list_codes.append([codes[start:end]])
+            index._list_vectors.append([vectors[start:end]] if keep_vectors else [])
+            for id_ in ids[start:end]:
+                index._id_to_list[id_] = list_no
+        return index
+
+
+def build_ivfpq_index(ids: Sequence[Any], vectors: np.ndarray, keep_vectors: bool = False, **params) -> IVFPQIndex:
+    """Train and fill an index, sizing n_lists to ~sqrt(N) unless given."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    params.setdefault("n_lists", max(1, int(np.sqrt(vectors.shape[0]))))
+    # 48 one-byte codes (32 dims each for text-embedding-3-small), or the nearest divisor
+    params.setdefault("n_subvectors", max(m for m in range(1, 49) if vectors.shape[1] % m == 0))
+    index = IVFPQIndex(vectors.shape[1], keep_vectors=keep_vectors, **params)
+    index.train(vectors)
+    index.add(ids, vectors)
+    return index
+
+
+def update_resource_ann_index(
+    upserted: Sequence[Tuple[Any, list]],
+    deleted: Sequence[Any],
+    path: str = RESOURCE_ANN_INDEX_PATH,
+) -> Optional[IVFPQIndex]:
+    """Apply an embedding cron run to the persisted resource ANN index.
+
+    New and changed vectors are inserted incrementally and deleted resources removed.
+    If no index exists yet, or it doesn't match ANN_KEEP_VECTORS, it is built from the
+    full resource_embeddings table. Centroids and codebooks are only trained on that
+    full build and never retrained afterwards; delete the file to retrain on the current
+    catalog. Does nothing when RESOURCE_ANN_INDEX_PATH is not configured.
+    """
+    if not path:
+        return None
+    index = IVFPQIndex.load(path) if os.path.exists(path) else None
+    if index is not None and index.keep_vectors == ANN_KEEP_VECTORS:
+        index.remove(deleted)
+        if upserted:
+            index.add([id_ for id_, _ in upserted], np.asarray([v for _, v in upserted], dtype=np.float32))
+    else:
+        from app.supabase_client import get_resource_embeddings
+        from app.similarity_calculations.vector_codec import decode_embeddings
+
+        rows = get_resource_embeddings()
+        matrix, present = decode_embeddings([row["embedding"] for row in rows])
+        ids = [row["resource_id"] for row, has_embedding in zip(rows, present) if has_embedding]
+        if not ids:
+            return None
+        index = build_ivfpq_index(ids, matrix[present], keep_vectors=ANN_KEEP_VECTORS)
+    index.save(path)
+    return index
@@ -1,7 +1,12 @@
-from typing import List
+from typing import Dict, List, Optional
 
-def array_overlap_score(input_array: List[str], case_array: List[str]) -> float:
-    """Jaccard similarity: |A ∩ B| / |A ∪ B|. Scales from 0 to 1."""
+from app.similarity_calculations.label_bitsets import expand_labels
+
+def array_overlap_score(input_array: List[str], case_array: List[str], hierarchy: Optional[Dict[str, str]] = None) -> float:
+    """Jaccard similarity: |A ∩ B| / |A ∪ B|. Scales from 0 to 1.
+
+    With a `hierarchy` (label -> parent), both sets include their labels' ancestors.
+    """
     if not input_array or not case_array:
         return 0.0
 
@@ -12,6 +17,9 @@ def array_overlap_score(input_array: List[str], case_array: List[str]) -> float:
     if not input_set:
         return 0.0
 
+    input_set = expand_labels(input_set, hierarchy)
+    case_set = expand_labels(case_set, hierarchy)
+
     intersection = len(input_set & case_set)
     union = len(input_set | case_set)
 
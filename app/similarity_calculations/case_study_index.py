@@ -0,0 +1,350 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.similarity_calculations.label_bitsets import LabelBitsets
+
+# Field groups of navigator_simulations, by the scorer that applies to them
+EXACT_MATCH_FIELDS = ["state", "child_stage"]
+ARRAY_OVERLAP_FIELDS = ["current_challenges", "child_diagnoses"]
+TEXT_FIELDS = ["first_session_notes", "additional_info", "child_notes"]
+
+# Component column name for each WEIGHTS key, matching calculate_case_similarity_detailed()
+SCORE_COLUMNS = {
+    "state": "state_score",
+    "current_challenges": "challenges_score",
+    "first_session_notes": "session_notes_score",
+    "additional_info": "additional_info_score",
+    "child_age": "age_score",
+    "child_diagnoses": "diagnoses_score",
+    "child_stage": "stage_score",
+    "child_notes": "child_notes_score",
+}
+
+
+# Non-text components; with known weights they bound a case's total before text scoring
+CHEAP_FIELDS = ["state", "current_challenges", "child_age", "child_diagnoses", "child_stage"]
+
+# search(): cases text-scored up front (by best bound), and float slack on the bound
+PRUNE_FIRST_BLOCK = 256
+BOUND_SLACK = 1e-5
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first.
+
+    Uses a partial selection instead of a full sort. Ties are broken by position, which
+    matches a stable `sort(reverse=True)` over the original order.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        candidates = np.arange(n)
+    else:
+        kth = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - above.shape[0]]
+        candidates = np.concatenate([above, ties])
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+class CaseStudyIndex:
+    """Columnar, in-memory view of the case-study corpus for vectorized scoring.
+
+    Exact-match fields are interned to integer codes, label arrays packed bitsets (see
+    LabelBitsets, optionally expanded with a label hierarchy per field), ages a float vector (NaN for missing) and each text field a row-normalized
+    float32 embedding matrix. `score()` reproduces calculate_case_similarity_detailed()
+    for every case at once; `search()` returns the same top k while skipping the text
+    scoring of cases that cannot place.
+
+    `text_matrices` ({field: (row-normalized matrix, present mask)}, aligned with
+    `case_studies`) replaces `case_embeddings`; the matrices are used as given, e.g.
+    read-only memory maps shared between processes.
+    """
+
+    def __init__(
+        self,
+        case_studies: List[Dict[str, Any]],
+        case_embeddings: Optional[Dict[Any, Dict[str, Optional[list]]]] = None,
+        hierarchies: Optional[Dict[str, Dict[str, str]]] = None,
+        text_matrices: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None,
+    ):
+        case_embeddings = case_embeddings or {}
+        self.case_studies = case_studies
+        self.case_embeddings = case_embeddings
+        self.ids = [case_study.get("id") for case_study in case_studies]
+        n = len(case_studies)
+
+        self.codes: Dict[str, np.ndarray] = {}
+        self.vocabularies: Dict[str, Dict[str, int]] = {}
+        for field in EXACT_MATCH_FIELDS:
+            vocabulary: Dict[str, int] = {}
+            codes = np.full(n, -1, dtype=np.int32)
+            for row, case_study in enumerate(case_studies):
+                value = case_study.get(field, "")
+                if value:
+                    codes[row] = vocabulary.setdefault(value.lower().strip(), len(vocabulary))
+            self.codes[field] = codes
+            self.vocabularies[field] = vocabulary
+
+        hierarchies = hierarchies or {}
+        self.label_bitsets: Dict[str, LabelBitsets] = {}
+        for field in ARRAY_OVERLAP_FIELDS:
+            bitsets = LabelBitsets([case_study.get(field, []) for case_study in case_studies], hierarchies.get(field))
+            self.label_bitsets[field] = bitsets
+            self.vocabularies[field] = bitsets.vocabulary
+
+        self.ages = np.array(
+            [np.nan if case_study.get("child_age", 0) is None else case_study.get("child_age", 0)
+             for case_study in case_studies],
+            dtype=np.float64,
+        )
+
+        self.text_matrices: Dict[str, np.ndarray] = {}
+        self.text_present: Dict[str, np.ndarray] = {}
+        for field in TEXT_FIELDS:
+            if text_matrices is not None:
+                self.text_matrices[field], self.text_present[field] = text_matrices[field]
+                continue
+            vectors = []
+            for case_study in case_studies:
+                text = case_study.get(field, "")
+                embedding = case_embeddings.get(case_study.get("id"), {}).get(field)
+                vectors.append(embedding if text and text.strip() and embedding is not None else None)
+            dim = next((len(v) for v in vectors if v is not None), 0)
+            matrix = np.zeros((n, dim), dtype=np.float32)
+            present = np.zeros(n, dtype=bool)
+            for row, vector in enumerate(vectors):
+                if vector is not None:
+                    matrix[row] = vector
+                    present[row] = True
+            norms = np.linalg.norm(matrix, axis=1)
+            # Zero vectors score 0 like cosine_similarity() does, so leave them unscaled
+            np.divide(matrix, norms[:, None], out=matrix, where=norms[:, None] > 0)
+            self.text_matrices[field] = matrix
+            self.text_present[field] = present & (norms > 0)
+
+        # Pre-filter indexes: rows per state code, and rows with an age sorted by age
+        self.rows_by_state: Dict[int, np.ndarray] = {}
+        state_codes = self.codes["state"]
+        order = np.argsort(state_codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(state_codes[order])) + 1
+        for group in np.split(order, boundaries):
+            if group.shape[0] and state_codes[group[0]] >= 0:
+                self.rows_by_state[int(state_codes[group[0]])] = group
+        has_age = np.flatnonzero(~np.isnan(self.ages))
+        self.age_order = has_age[np.argsort(self.ages[has_age], kind="stable")]
+        self.sorted_ages = self.ages[self.age_order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _exact_match(self, field: str, values: List[Optional[str]]) -> np.ndarray:
+        vocabulary = self.vocabularies[field]
+        # -2 never matches a case code (missing case values are -1)
+        query_codes = np.array(
+            [vocabulary.get(value.lower().strip(), -2) if value else -2 for value in values],
+            dtype=np.int32,
+        )
+        return (query_codes[:, None] == self.codes[field][None, :]).astype(np.float64)
+
+    def _array_overlap(self, field: str, values: List[Optional[List[str]]]) -> np.ndarray:
+        bitsets = self.label_bitsets[field]
+        scores = np.zeros((len(values), len(self)), dtype=np.float64)
+        for row, labels in enumerate(values):
+            scores[row] = bitsets.jaccard(labels)
+        return scores
+
+    def _age_proximity(self, ages: List[Optional[int]]) -> np.ndarray:
+        query_ages = np.array([np.nan if age is None else age for age in ages], dtype=np.float64)[:, None]
+        with np.errstate(invalid="ignore"):
+            scale = np.maximum(np.minimum(self.ages[None, :], query_ages), 1)
+            scores = np.maximum(1.0 - np.abs(self.ages[None, :] - query_ages) / scale, 0.0)
+        return np.where(np.isnan(self.ages[None, :]) | np.isnan(query_ages), 0.0, scores)
+
+    def _text_similarity(
+        self,
+        field: str,
+        texts: List[Optional[str]],
+        embeddings: List[Optional[list]],
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        matrix = self.text_matrices[field]
+        present = self.text_present[field]
+        if rows is not None:
+            matrix, present = matrix[rows], present[rows]
+        scores = np.zeros((len(texts), matrix.shape[0]), dtype=np.float64)
+        if matrix.shape[1] == 0:
+            return scores
+        query_rows = [
+            row for row, (text, embedding) in enumerate(zip(texts, embeddings))
+            if text and text.strip() and embedding is not None
+        ]
+        if not query_rows:
+            return scores
+        queries = np.asarray([embeddings[row] for row in query_rows], dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        np.divide(queries, norms, out=queries, where=norms > 0)
+        if len(query_rows) == 1:
+            # A row-wise product gives each case the same value whichever other rows are
+            # scored alongside it (BLAS gemv does not), so pruned search matches score()
+            products = np.einsum("ij,j->i", matrix, queries[0])[None, :]
+        else:
+            # One matrix-matrix product for the whole batch
+            products = queries @ matrix.T
+        scores[query_rows] = np.where(present[None, :], products, 0.0)
+        return scores
+
+    def _cheap_components(self, input_cases: List[Any]) -> Dict[str, np.ndarray]:
+        """The non-text components, shape (len(input_cases), len(self)) each."""
+        def values(field: str) -> list:
+            return [getattr(input_case, field) for input_case in input_cases]
+
+        return {
+            "state": self._exact_match("state", values("state")),
+            "current_challenges": self._array_overlap("current_challenges", values("current_challenges")),
+            "child_age": self._age_proximity(values("child_age")),
+            "child_diagnoses": self._array_overlap("child_diagnoses", values("child_diagnoses")),
+            "child_stage": self._exact_match("child_stage", values("child_stage")),
+        }
+
+    def _text_components(
+        self,
+        input_cases: List[Any],
+        input_embeddings: List[Dict[str, Optional[list]]],
+        rows: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        return {
+            field: self._text_similarity(
+                field,
+                [getattr(input_case, field) for input_case in input_cases],
+                [embeddings.get(field) for embeddings in input_embeddings],
+                rows,
+            )
+            for field in TEXT_FIELDS
+        }
+
+    @staticmethod
+    def _weighted_total(components: Dict[str, np.ndarray], weights: Dict[str, float]) -> np.ndarray:
+        # Accumulate in the same order as the scalar scorer
+        total = np.zeros_like(components["state"])
+        for field in SCORE_COLUMNS:
+            total = total + components[field] * weights[field]
+        return total
+
+    def score_batch(
+        self,
+        input_cases: List[Any],
+        input_embeddings: List[Dict[str, Optional[list]]],
+        weights: Dict[str, float],
+        rows: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Score every case (or only `rows`) against each of `input_cases`.
+
+        `input_cases` are objects with CaseStudyRequest fields. Returns one float64 array
+        of shape (len(input_cases), number of cases scored) per component, keyed like
+        calculate_case_similarity_detailed(), plus the unrounded "weighted_total".
+        """
+        components = self._cheap_components(input_cases)
+        if rows is not None:
+            components = {field: values[:, rows] for field, values in components.items()}
+        components.update(self._text_components(input_cases, input_embeddings, rows))
+
+        scores = {SCORE_COLUMNS[field]: components[field] for field in SCORE_COLUMNS}
+        scores["weighted_total"] = self._weighted_total(components, weights)
+        return scores
+
+    def score(
+        self,
+        input_case: Any,
+        input_embeddings: Dict[str, Optional[list]],
+        weights: Dict[str, float],
+    ) -> Dict[str, np.ndarray]:
+        """Score every case against a single `input_case`; see score_batch()."""
+        return {column: values[0] for column, values in self.score_batch([input_case], [input_embeddings], weights).items()}
+
+    def top_k(self, scores: Dict[str, np.ndarray], k: int = 5, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Row indices of the k best cases, ranked like the scalar endpoint (rounded total).
+
+        `rows` (ascending, e.g. from candidate_rows()) restricts the ranking to those cases.
+        """
+        total = np.round(scores["weighted_total"], 3)
+        if rows is None:
+            return top_k_indices(total, k)
+        return rows[top_k_indices(total[rows], k)]
+
+    def candidate_rows(
+        self,
+        state: Optional[str] = None,
+        age: Optional[int] = None,
+        max_age_gap: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        """Ascending rows passing the hard pre-filters, or None when no filter applies.
+
+        `state` keeps only cases in that state (normalized like the exact-match scorer);
+        `age` with `max_age_gap` keeps cases whose age is within that many years. Cases
+        missing the filtered value never pass.
+        """
+        rows = None
+        if state and state.strip():
+            code = self.vocabularies["state"].get(state.lower().strip())
+            rows = self.rows_by_state.get(code, np.empty(0, dtype=np.intp))
+        if age is not None and max_age_gap is not None:
+            start = np.searchsorted(self.sorted_ages, age - max_age_gap, side="left")
+            end = np.searchsorted(self.sorted_ages, age + max_age_gap, side="right")
+            in_bracket = np.sort(self.age_order[start:end])
+            rows = in_bracket if rows is None else np.intersect1d(rows, in_bracket, assume_unique=True)
+        return rows
+
+    def search(
+        self,
+        input_case: Any,
+        input_embeddings: Dict[str, Optional[list]],
+        weights: Dict[str, float],
+        k: int = 5,
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k rows and their weighted totals, text-scoring only cases that can place.
+
+        The cheap components are computed for every candidate; their weighted sum plus the
+        most the text fields could add (a cosine of 1) bounds each case's total. Cases are
+        text-scored best bound first, then every case whose rounded bound cannot reach the
+        current k-th best is skipped. Returns exactly what top_k(score(...), k, rows) and
+        the corresponding totals would.
+        """
+        candidates = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+        if k <= 0 or candidates.shape[0] == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        cheap = {field: values[0, candidates] for field, values in self._cheap_components([input_case]).items()}
+        bound = sum(cheap[field] * weights[field] for field in CHEAP_FIELDS)
+        for field in TEXT_FIELDS:
+            text = getattr(input_case, field)
+            if text and text.strip() and input_embeddings.get(field) is not None:
+                bound = bound + abs(weights[field]) * self.text_present[field][candidates]
+        # Slack for float32 cosines slightly above 1 and summation order
+        bound = np.round(bound + BOUND_SLACK, 3)
+
+        def totals_for(positions: np.ndarray) -> np.ndarray:
+            components = {field: values[positions] for field, values in cheap.items()}
+            text = self._text_components([input_case], [input_embeddings], candidates[positions])
+            components.update({field: values[0] for field, values in text.items()})
+            return self._weighted_total(components, weights)
+
+        order = np.argsort(-bound, kind="stable")
+        scored = np.sort(order[:PRUNE_FIRST_BLOCK])
+        totals = totals_for(scored)
+        if order.shape[0] > PRUNE_FIRST_BLOCK and scored.shape[0] >= k:
+            kth = np.partition(np.round(totals, 3), scored.shape[0] - k)[scored.shape[0] - k]
+            rest = order[PRUNE_FIRST_BLOCK:]
+            rest = np.sort(rest[bound[rest] >= kth])
+            if rest.shape[0]:
+                scored = np.concatenate([scored, rest])
+                totals = np.concatenate([totals, totals_for(rest)])
+                by_row = np.argsort(scored, kind="stable")
+                scored, totals = scored[by_row], totals[by_row]
+
+        best = top_k_indices(np.round(totals, 3), k)
+        return candidates[scored[best]], totals[best]
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+DEFAULT_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "20000"))
+DEFAULT_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# Rows kept in the SQLite tier (about 6 KB each at 1536 dimensions); 0 means no limit
+DEFAULT_DISK_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ITEMS", "100000"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so trivially different inputs share an entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address for an embedding: sha256 over the model and normalized text."""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: a bounded in-process LRU in front of a SQLite store.
+
+    Vectors are held as float32 in both tiers. The disk tier survives restarts and
+    is shared by every process pointing at the same path. It is pruned to its newest
+    `disk_max_items` rows, checked every 1% of that many writes.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        disk_max_items: int = DEFAULT_DISK_MAX_ITEMS,
+    ):
+        self.path = path
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_max_items = disk_max_items
+        self._writes_since_prune = 0
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "writes": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+    def _count(self, event: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[event] += amount
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads, so keep one per thread.
+        # The file is opened on first use, so constructing a cache touches no disk.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous.nbytes
+            self._memory[key] = vector
+            self._memory_bytes += vector.nbytes
+            while self._memory and (
+                len(self._memory) > self.max_items or self._memory_bytes > self.max_bytes
+            ):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached float32 vector for (model, text), or None on a miss."""
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector
+
+        if self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+                self._count("disk_errors")
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                self._count("disk_hits")
+                return vector
+
+        self._count("misses")
+        return None
+
+    def put(self, model: str, text: str, embedding) -> np.ndarray:
+        """Store an embedding in both tiers and return it as a float32 array."""
+        key = cache_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        self._remember(key, vector)
+        if self.path:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                    (key, model, int(vector.shape[0]), vector.tobytes()),
+                )
+                conn.commit()
+                self._maybe_prune(conn)
+            except sqlite3.Error:
+                self._count("disk_errors")
+        self._count("writes")
+        return vector
+
+    def _maybe_prune(self, conn: sqlite3.Connection) -> None:
+        """Delete the oldest disk rows beyond `disk_max_items`, every 1% of that many writes."""
+        if self.disk_max_items <= 0:
+            return
+        with self._lock:
+            self._writes_since_prune += 1
+            if self._writes_since_prune < max(1, self.disk_max_items // 100):
+                return
+            self._writes_since_prune = 0
+        # INSERT OR REPLACE gives every write a new, larger rowid, so rowid order is write order
+        deleted = conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_items,),
+        ).rowcount
+        conn.commit()
+        if deleted > 0:
+            self._count("disk_evictions", deleted)
+
+    def preload(self, limit: Optional[int] = None) -> int:
+        """Load the most recently written disk entries into the memory tier.
+
+        Reads at most `limit` (default: the memory tier's item limit) rows, stopping early
+        at the byte limit, and returns how many were loaded.
+        """
+        if not self.path:
+            return 0
+        limit = self.max_items if limit is None else min(limit, self.max_items)
+        try:
+            rows = self._connection().execute(
+                "SELECT key, vector FROM embeddings ORDER BY rowid DESC LIMIT ?", (limit,)
+            ).fetchall()
+        except sqlite3.Error:
+            self._count("disk_errors")
+            return 0
+        selected = []
+        budget = self.max_bytes
+        for key, blob in rows:
+            if len(blob) > budget:
+                break
+            budget -= len(blob)
+            selected.append((key, blob))
+        # Oldest first, so the newest entries end up most recently used
+        for key, blob in reversed(selected):
+            self._remember(key, np.frombuffer(blob, dtype=np.float32))
+        return len(selected)
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        return stats
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
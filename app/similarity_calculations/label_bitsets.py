@@ -0,0 +1,98 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# Diagnosis families for hierarchy-aware matching: label -> parent (normalized labels).
+# Two diagnoses in the same family share the family bit, so e.g. ADHD vs Autism (ASD)
+# scores 1/3 instead of 0. Parents may have parents of their own.
+DIAGNOSIS_HIERARCHY = {
+    "autism (asd)": "family:neurodevelopmental",
+    "adhd": "family:neurodevelopmental",
+    "communication disorder": "family:neurodevelopmental",
+    "learning disability": "family:neurodevelopmental",
+    "intellectual disability": "family:neurodevelopmental",
+    "anxiety": "family:anxiety and related",
+    "ocd": "family:anxiety and related",
+    "ptsd": "family:anxiety and related",
+    "depression": "family:mood",
+}
+
+_WORD_BITS = 64
+
+
+def normalize_labels(values: Optional[Iterable[str]]) -> Set[str]:
+    """Same cleaning as array_overlap_score(): lowercase, strip, drop blanks."""
+    if not values:
+        return set()
+    return {v.lower().strip() for v in values if v and v.strip()}
+
+
+def expand_labels(labels: Set[str], hierarchy: Optional[Dict[str, str]] = None) -> Set[str]:
+    """`labels` plus all of their ancestors in `hierarchy`."""
+    if not hierarchy:
+        return labels
+    expanded = set(labels)
+    for label in labels:
+        parent = hierarchy.get(label)
+        while parent is not None and parent not in expanded:
+            expanded.add(parent)
+            parent = hierarchy.get(parent)
+    return expanded
+
+
+class LabelBitsets:
+    """Label arrays of a corpus as packed uint64 bitsets over an interned vocabulary.
+
+    Each distinct (normalized) label gets a bit; each row becomes ceil(vocabulary / 64)
+    words, so Jaccard against every row is an AND plus a popcount. With a `hierarchy`,
+    rows are stored ancestor-expanded at build time and queries are expanded the same
+    way, so hierarchy-aware matching costs the same per query as flat matching.
+    """
+
+    def __init__(self, rows: Sequence[Optional[Iterable[str]]], hierarchy: Optional[Dict[str, str]] = None):
+        self.hierarchy = hierarchy
+        self.vocabulary: Dict[str, int] = {}
+        expanded = [expand_labels(normalize_labels(labels), hierarchy) for labels in rows]
+        row_ids: List[int] = []
+        positions: List[int] = []
+        for row, labels in enumerate(expanded):
+            for label in sorted(labels):
+                row_ids.append(row)
+                positions.append(self.vocabulary.setdefault(label, len(self.vocabulary)))
+
+        self.words = max(1, -(-len(self.vocabulary) // _WORD_BITS))
+        self.bits = np.zeros((len(expanded), self.words), dtype=np.uint64)
+        if positions:
+            position_array = np.asarray(positions, dtype=np.uint64)
+            np.bitwise_or.at(
+                self.bits,
+                (np.asarray(row_ids, dtype=np.intp), (position_array // _WORD_BITS).astype(np.intp)),
+                np.left_shift(np.uint64(1), position_array % np.uint64(_WORD_BITS)),
+            )
+        self.counts = np.bitwise_count(self.bits).sum(axis=1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.bits.shape[0]
+
+    def encode(self, labels: Optional[Iterable[str]]) -> Tuple[np.ndarray, int]:
+        """(query bitset, query set size); labels missing from the vocabulary still count."""
+        expanded = expand_labels(normalize_labels(labels), self.hierarchy)
+        query = np.zeros(self.words, dtype=np.uint64)
+        for label in expanded:
+            position = self.vocabulary.get(label)
+            if position is not None:
+                query[position // _WORD_BITS] |= np.uint64(1) << np.uint64(position % _WORD_BITS)
+        return query, len(expanded)
+
+    def jaccard(self, labels: Optional[Iterable[str]], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """|A ∩ B| / |A ∪ B| of `labels` against every row (or `rows`), as float64.
+
+        Matches array_overlap_score(): 0 when either side has no labels.
+        """
+        bits, counts = (self.bits, self.counts) if rows is None else (self.bits[rows], self.counts[rows])
+        query, size = self.encode(labels)
+        if size == 0:
+            return np.zeros(bits.shape[0], dtype=np.float64)
+        intersection = np.bitwise_count(bits & query).sum(axis=1, dtype=np.int64)
+        union = size + counts - intersection
+        return intersection / union
@@ -0,0 +1,103 @@
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+STORAGE_FORMATS = ("float32", "float16", "int8")
+
+# Values converted to float32 per step when scanning compact storage; small enough for
+# the conversion buffer to stay in cache, which is what keeps int8 scans fast
+_SCAN_CHUNK_VALUES = 1 << 18
+
+
+def truncate_embeddings(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """Keep the first `dims` dimensions of each row and re-normalize.
+
+    text-embedding-3 models are trained so a prefix of the vector is itself a usable
+    embedding (what the API's `dimensions` parameter returns), so this is equivalent
+    to requesting shortened embeddings.
+    """
+    reduced = np.array(matrix[..., :dims], dtype=np.float32)
+    norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+    np.divide(reduced, norms, out=reduced, where=norms > 0)
+    return reduced
+
+
+def spill_to_disk(matrix: np.ndarray, directory: Optional[str] = None) -> np.ndarray:
+    """A read-only memory-mapped copy of `matrix` backed by an anonymous temporary file.
+
+    The file is unlinked as soon as it is created, so it disappears with the mapping;
+    its pages live in the OS page cache rather than the process heap.
+    """
+    with tempfile.TemporaryFile(dir=directory) as f:
+        f.truncate(matrix.nbytes)
+        mapped = np.memmap(f, dtype=matrix.dtype, mode="r+", shape=matrix.shape)
+        mapped[:] = matrix
+        mapped.flush()
+        return np.memmap(f, dtype=matrix.dtype, mode="r", shape=matrix.shape)
+
+
+class QuantizedMatrix:
+    """Row-normalized embeddings stored compactly for approximate dot-product scans.
+
+    `storage` is float32 (no quantization), float16, or int8 with one float32 scale per
+    row; `dims` optionally truncates each row first (0 keeps all dimensions). Bytes per
+    1536-d vector: 6144 (float32), 3072 (float16), 1540 (int8); truncating to 512 divides
+    those by 3. int8 scans about as fast as float32; NumPy's float16 conversion is not
+    vectorized on most CPUs, so float16 only saves memory.
+    """
+
+    def __init__(self, matrix: np.ndarray, storage: str = "float32", dims: int = 0):
+        if storage not in STORAGE_FORMATS:
+            raise ValueError(f"Unknown embedding storage {storage!r}, expected one of {STORAGE_FORMATS}")
+        full_dims = matrix.shape[1]
+        self.storage = storage
+        self.dims = dims if 0 < dims < full_dims else full_dims
+        self.truncated = self.dims < full_dims
+
+        reduced = truncate_embeddings(matrix, self.dims) if self.truncated else np.asarray(matrix, dtype=np.float32)
+        self.scale: Optional[np.ndarray] = None
+        if storage == "int8":
+            scale = np.abs(reduced).max(axis=1) / 127.0 if reduced.shape[0] else np.zeros(0, dtype=np.float32)
+            scale[scale == 0] = 1.0
+            self.data = np.round(reduced / scale[:, None]).astype(np.int8)
+            self.scale = scale.astype(np.float32)
+        elif storage == "float16":
+            self.data = reduced.astype(np.float16)
+        else:
+            self.data = np.ascontiguousarray(reduced)
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def exact(self) -> bool:
+        """True when scans return full-precision scores (no quantization or truncation)."""
+        return self.storage == "float32" and not self.truncated
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32)
+        return truncate_embeddings(query, self.dims) if self.truncated else query
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate dot products of a (normalized) full-length query with every row."""
+        query = self.prepare_query(query)
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float32)
+        if self.data.dtype == np.float32:
+            return self.data @ query
+        out = np.empty(len(self), dtype=np.float32)
+        chunk_rows = max(1, _SCAN_CHUNK_VALUES // self.dims)
+        buffer = np.empty((chunk_rows, self.dims), dtype=np.float32)
+        for start in range(0, len(self), chunk_rows):
+            chunk = self.data[start:start + chunk_rows]
+            converted = buffer[:chunk.shape[0]]
+            np.copyto(converted, chunk)
+            out[start:start + chunk.shape[0]] = converted @ query
+        if self.scale is not None:
+            out *= self.scale
+        return out
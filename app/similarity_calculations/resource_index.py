@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.embedding_snapshot import SHARED_SNAPSHOTS, SnapshotWatcher
+from app.metrics import timed_stage
+from app.similarity_calculations.case_study_index import top_k_indices
+from app.similarity_calculations.embedding_cache import cache_key
+from app.similarity_calculations.quantization import QuantizedMatrix, spill_to_disk
+from app.similarity_calculations.text_similarity import EMBEDDING_MODEL
+from app.similarity_calculations.vector_codec import decode_embeddings
+
+# Compact resident storage: float32 | float16 | int8, optionally truncated to fewer
+# dimensions (0 = all). Anything but full float32 scans the compact vectors and
+# re-ranks the best RESOURCE_INDEX_RERANK at full precision.
+RESOURCE_INDEX_STORAGE = os.getenv("RESOURCE_INDEX_STORAGE", "float32")
+RESOURCE_INDEX_DIMS = int(os.getenv("RESOURCE_INDEX_DIMS", "0"))
+RESOURCE_INDEX_RERANK = int(os.getenv("RESOURCE_INDEX_RERANK", "100"))
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceIndex:
+    """Resident exact-search index over resource embeddings.
+
+    Vectors are stored as one row-normalized float32 matrix next to an id list and the
+    resource metadata, so a query is a single matrix-vector product plus a partial sort.
+
+    With a compact `storage` or `dims` (see QuantizedMatrix) the resident copy is the
+    compact one; the full-precision matrix is spilled to a memory-mapped temporary file
+    and only read for the `rerank` best candidates of each query.
+    """
+
+    def __init__(
+        self,
+        resources: List[Dict[str, Any]],
+        storage: str = RESOURCE_INDEX_STORAGE,
+        dims: int = RESOURCE_INDEX_DIMS,
+        rerank: int = RESOURCE_INDEX_RERANK
+    ):
+        matrix, present = decode_embeddings([resource.get("embedding") for resource in resources])
+        self.ids: List[Any] = []
+        self.resources: List[Dict[str, Any]] = []
+        for resource, has_embedding in zip(resources, present):
+            if has_embedding:
+                self.ids.append(resource.get("id"))
+                self.resources.append({k: v for k, v in resource.items() if k != "embedding"})
+
+        matrix = np.ascontiguousarray(matrix[present])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+        self.compact = QuantizedMatrix(matrix, storage, dims)
+        self.rerank = rerank
+        # Exact storage is searched directly; otherwise full precision stays off-heap
+        self.matrix = self.compact.data if self.compact.exact else spill_to_disk(matrix)
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        snapshot,
+        resources_by_id: Dict[Any, Dict[str, Any]],
+        storage: str = RESOURCE_INDEX_STORAGE,
+        dims: int = RESOURCE_INDEX_DIMS,
+        rerank: int = RESOURCE_INDEX_RERANK
+    ) -> "ResourceIndex":
+        """An index over a published, row-normalized `resources` EmbeddingSnapshot.
+
+        The full-precision matrix is the snapshot's read-only memory map, shared with
+        every other process serving it; only a compact copy (if configured) is private.
+        """
+        index = cls.__new__(cls)
+        index.ids = list(snapshot.ids)
+        index.resources = [resources_by_id.get(id_, {"id": id_}) for id_ in index.ids]
+        index.compact = QuantizedMatrix(snapshot.matrix, storage, dims)
+        index.rerank = rerank
+        index.matrix = snapshot.matrix
+        index.loaded_at = time.time()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, embedding, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return the k most similar resources as (cosine similarity, resource) pairs."""
+        if len(self) == 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+        if self.compact.exact:
+            scores = self.matrix @ query
+            return [(float(scores[row]), self.resources[row]) for row in top_k_indices(scores, k)]
+
+        # Scan the compact vectors, then re-rank the short list at full precision
+        shortlist = np.sort(top_k_indices(self.compact.scores(query), max(k, self.rerank)))
+        scores = self.matrix[shortlist] @ query
+        return [(float(scores[i]), self.resources[shortlist[i]]) for i in top_k_indices(scores, k)]
+
+    def search_many(self, embeddings: np.ndarray, k: int = 5, chunk: int = 256) -> List[List[Tuple[float, Dict[str, Any]]]]:
+        """search() for many queries: one matrix product per `chunk` queries.
+
+        Zero-length queries get an empty result. Compact storage falls back to one
+        re-ranked search() per query.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if not self.compact.exact:
+            return [self.search(query, k) for query in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+
+        results: List[List[Tuple[float, Dict[str, Any]]]] = []
+        for start in range(0, queries.shape[0], chunk):
+            block = queries[start:start + chunk]
+            scores = block @ self.matrix.T if len(self) else np.empty((block.shape[0], 0), dtype=np.float32)
+            for i in range(block.shape[0]):
+                if norms[start + i, 0] == 0:
+                    results.append([])
+                    continue
+                row_scores = scores[i]
+                results.append([(float(row_scores[row]), self.resources[row]) for row in top_k_indices(row_scores, k)])
+        return results
+
+
+_index: Optional[Tuple[int, ResourceIndex]] = None
+_index_lock = threading.Lock()
+_snapshot_watcher = SnapshotWatcher("resources")
+# (published version, metadata version) -> shared index, or None if the snapshot is stale
+_shared_index: Optional[Tuple[Tuple[str, int], Optional[ResourceIndex]]] = None
+
+
+def _shared_resource_index() -> Optional[ResourceIndex]:
+    """Index over the published `resources` snapshot, or None if it is missing or stale.
+
+    Stale means a published vector belongs to a resource that was deleted or whose
+    embedded text changed since; the caller then falls back to a private index.
+    """
+    global _shared_index
+    from app.supabase_client import resource_embedding_text, resources_snapshot
+
+    published = _snapshot_watcher.get()
+    if published is None:
+        return None
+    metadata = resources_snapshot.get()
+    key = (published.version, metadata.version)
+    current = _shared_index
+    if current is not None and current[0] == key:
+        return current[1]
+    with _index_lock:
+        if _shared_index is None or _shared_index[0] != key:
+            with timed_stage("build_resource_index"):
+                resources_by_id = {resource["id"]: resource for resource in metadata.data}
+                hashes = published.columns.get("content_hash") or [None] * len(published.ids)
+                stale = any(
+                    id_ not in resources_by_id
+                    or content_hash != cache_key(EMBEDDING_MODEL, resource_embedding_text(resources_by_id[id_]))
+                    for id_, content_hash in zip(published.ids, hashes)
+                )
+                index = None if stale else ResourceIndex.from_snapshot(published, resources_by_id)
+            if stale:
+                logger.warning("Shared resources snapshot %s is stale; using a private index", published.version)
+            _shared_index = (key, index)
+        return _shared_index[1]
+
+
+def get_resource_index() -> ResourceIndex:
+    """The resident index over the current resources snapshot.
+
+    The snapshot (see app.supabase_client.SnapshotCache) refreshes itself in the
+    background when the tables change; the index is rebuilt once per new version.
+    With shared snapshots enabled the published, memory-mapped `resources` snapshot is
+    served instead, and resource embeddings are not fetched by the worker at all.
+    """
+    global _index
+    from app.supabase_client import resources_with_embeddings_snapshot
+
+    if SHARED_SNAPSHOTS:
+        shared = _shared_resource_index()
+        if shared is not None:
+            return shared
+
+    snapshot = resources_with_embeddings_snapshot.get()
+    current = _index
+    if current is not None and current[0] == snapshot.version:
+        return current[1]
+    with _index_lock:
+        if _index is None or _index[0] != snapshot.version:
+            with timed_stage("build_resource_index"):
+                _index = (snapshot.version, ResourceIndex(list(snapshot.data)))
+        return _index[1]
+
+
+def refresh_resource_index() -> ResourceIndex:
+    """Force a reload of the resources snapshot and rebuild the index from it."""
+    from app.supabase_client import resources_with_embeddings_snapshot
+
+    resources_with_embeddings_snapshot.refresh()
+    return get_resource_index()
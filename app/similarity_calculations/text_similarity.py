@@ -1,8 +1,78 @@
-from typing import Optional
-from openai import OpenAI
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+import logging
+import os
+import threading
 import numpy as np
 
-client = OpenAI()
+from app.clients import OPENAI_TIMEOUT_SECONDS, LazyClient, create_openai_client
+from app.metrics import Counter, Gauge, Histogram
+from app.retry import with_backoff
+from app.similarity_calculations.embedding_cache import EmbeddingCache, cache_key
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Limits of the embeddings endpoint, with some headroom on the token side since
+# token counts are estimated rather than computed with the model's tokenizer.
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 250_000
+MAX_INPUT_TOKENS = 8191
+
+# embed() calls for uncached texts arriving within this window while another request is
+# in flight are sent as one batched request, and concurrent calls for the same text share
+# one result. 0 disables both.
+EMBEDDING_COALESCE_WINDOW_MS = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "5"))
+EMBEDDING_COALESCE_MAX_BATCH = int(os.getenv("EMBEDDING_COALESCE_MAX_BATCH", "256"))
+# How long embed() waits on a coalesced request before embedding the text itself
+EMBEDDING_DISPATCH_TIMEOUT_SECONDS = EMBEDDING_COALESCE_WINDOW_MS / 1000 + OPENAI_TIMEOUT_SECONDS
+
+# Created on first use; the openai package is only imported then
+client = LazyClient(create_openai_client)
+embedding_cache = EmbeddingCache()
+
+logger = logging.getLogger(__name__)
+
+embedding_api_calls = Counter(
+    "embedding_api_calls_total",
+    "Embedding API requests (after retries), by mode (single or batch) and outcome.",
+    labels=("mode", "outcome")
+)
+embedding_api_inputs = Counter("embedding_api_inputs_total", "Texts embedded by the embedding API.")
+embedding_api_seconds = Histogram(
+    "embedding_api_seconds",
+    "Embedding API request latency, including retries.",
+    labels=("mode",)
+)
+embedding_cache_events = Counter(
+    "embedding_cache_events_total",
+    "Embedding cache hits (memory, disk), misses, evictions (memory, disk), writes and disk errors.",
+    labels=("event",),
+    collect=lambda: {
+        (event,): value for event, value in embedding_cache.snapshot_stats().items()
+        if event not in ("memory_items", "memory_bytes")
+    }
+)
+embedding_cache_memory = Gauge(
+    "embedding_cache_memory",
+    "Size of the in-memory embedding cache tier.",
+    labels=("measure",),
+    collect=lambda: {
+        (measure,): embedding_cache.snapshot_stats()[f"memory_{measure}"] for measure in ("items", "bytes")
+    }
+)
+
+def _create_embeddings(texts: Union[str, List[str]], mode: str):
+    """One embeddings request (with backoff), recorded in the embedding_api_* metrics."""
+    with embedding_api_seconds.time(mode=mode):
+        try:
+            res = with_backoff(lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=texts))
+        except Exception:
+            embedding_api_calls.inc(mode=mode, outcome="error")
+            raise
+    embedding_api_calls.inc(mode=mode, outcome="ok")
+    embedding_api_inputs.inc(1 if isinstance(texts, str) else len(texts))
+    return res
 
 def cosine_similarity(a, b) -> float:
     a = np.array(a)
@@ -13,18 +83,261 @@ def cosine_similarity(a, b) -> float:
     return float(np.dot(a, b) / denom)
 
 def embed(text: str) -> Optional[list]:
+    cached = embedding_cache.get(EMBEDDING_MODEL, text)
+    if cached is not None:
+        return cached.tolist()
+
+    if dispatcher is not None:
+        future = dispatcher.submit(text)
+        try:
+            return future.result(timeout=EMBEDDING_DISPATCH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # A stuck batch must not hold the request thread; later callers start afresh
+            dispatcher.abandon(text, future)
+            logger.warning("Coalesced embedding request timed out after %.0fs, embedding directly", EMBEDDING_DISPATCH_TIMEOUT_SECONDS)
+        except Exception:
+            return None
+
     try:
-        res = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return res.data[0].embedding
+        res = _create_embeddings(text, "single")
+        embedding = res.data[0].embedding
     except Exception:
         return None
 
+    embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+
+@dataclass
+class EmbeddingBatchResult:
+    """Result of embed_many(): one slot per input, in input order."""
+    embeddings: List[Optional[list]]
+    errors: Dict[int, str] = field(default_factory=dict)
+    api_calls: int = 0
+
+    @property
+    def failed(self) -> int:
+        return len(self.errors)
+
+
+def estimate_tokens(text: str) -> int:
+    """Conservative token estimate (~3 bytes per token; English averages closer to 4)."""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def plan_batches(texts: List[str]) -> List[List[int]]:
+    """Split texts into index batches bounded by input count and estimated tokens."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = min(estimate_tokens(text), MAX_INPUT_TOKENS)
+        if current and (len(current) >= MAX_BATCH_INPUTS or current_tokens + tokens > MAX_BATCH_TOKENS):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _request_embeddings(texts: List[str], result: EmbeddingBatchResult, mode: str = "batch") -> List[list]:
+    result.api_calls += 1
+    res = _create_embeddings(texts, mode)
+    # Each item carries the index of its input; don't rely on response ordering
+    return [item.embedding for item in sorted(res.data, key=lambda item: item.index)]
+
+
+def _embed_batch(texts: List[str], result: EmbeddingBatchResult, mode: str = "batch") -> Tuple[List[Optional[list]], Dict[int, str]]:
+    """Embed one batch, bisecting a rejected batch to isolate the offending inputs."""
+    from openai import BadRequestError
+
+    try:
+        return _request_embeddings(texts, result, mode), {}
+    except BadRequestError as e:
+        if len(texts) == 1:
+            return [None], {0: str(e)}
+        middle = len(texts) // 2
+        left, left_errors = _embed_batch(texts[:middle], result, mode)
+        right, right_errors = _embed_batch(texts[middle:], result, mode)
+        errors = dict(left_errors)
+        errors.update({middle + i: message for i, message in right_errors.items()})
+        return left + right, errors
+    except Exception as e:
+        return [None] * len(texts), {i: str(e) for i in range(len(texts))}
+
+
+def embed_many(texts: List[str]) -> EmbeddingBatchResult:
+    """Embed a list of texts with as few API requests as possible.
+
+    Identical (normalized) inputs are embedded once, cached vectors are reused, and the
+    rest is sent in count- and token-bounded batches. Failures are reported per input in
+    `errors` instead of collapsing the whole call to None.
+    """
+    result = EmbeddingBatchResult(embeddings=[None] * len(texts))
+
+    # Group input positions by content address so duplicates are embedded once
+    slots: Dict[str, List[int]] = {}
+    unique: List[Tuple[str, str]] = []
+    for index, text in enumerate(texts):
+        if not text or not text.strip():
+            result.errors[index] = "empty input"
+            continue
+        key = cache_key(EMBEDDING_MODEL, text)
+        if key not in slots:
+            slots[key] = []
+            unique.append((key, text))
+        slots[key].append(index)
+
+    misses: List[Tuple[str, str]] = []
+    for key, text in unique:
+        cached = embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is None:
+            misses.append((key, text))
+            continue
+        embedding = cached.tolist()
+        for index in slots[key]:
+            result.embeddings[index] = embedding
+
+    miss_texts = [text for _, text in misses]
+    for batch in plan_batches(miss_texts):
+        embeddings, errors = _embed_batch([miss_texts[i] for i in batch], result)
+        for position, i in enumerate(batch):
+            key, text = misses[i]
+            if position in errors:
+                for index in slots[key]:
+                    result.errors[index] = errors[position]
+                continue
+            embedding_cache.put(EMBEDDING_MODEL, text, embeddings[position])
+            for index in slots[key]:
+                result.embeddings[index] = embeddings[position]
+
+    return result
+
+
+embedding_dispatch_inputs = Counter(
+    "embedding_dispatch_inputs_total",
+    "Uncached embed() calls, by whether they joined an in-flight request or were dispatched.",
+    labels=("path",)
+)
+embedding_dispatch_batch_size = Histogram(
+    "embedding_dispatch_batch_size",
+    "Texts per coalesced embeddings request.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+)
+
+
+class EmbeddingDispatcher:
+    """Coalesces concurrent embed() calls into batched embeddings requests.
+
+    Single-flight: callers asking for a text (by content address) that is already
+    pending or in flight get the same future. Micro-batching: a text submitted while
+    nothing else is pending or in flight is sent right away; otherwise the first waiting
+    text starts a `window`-second timer and everything submitted before it fires (or
+    until `max_batch` texts are waiting) goes out as one request. Each caller's future is
+    resolved individually, so one rejected input only fails its own callers.
+    """
+
+    def __init__(self, window: float, max_batch: int = EMBEDDING_COALESCE_MAX_BATCH):
+        self.window = window
+        self.max_batch = min(max(max_batch, 1), MAX_BATCH_INPUTS)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._pending: List[Tuple[str, str, Future]] = []
+        self._timer: Optional[threading.Timer] = None
+        # Batches taken from the queue and not yet resolved
+        self._sending = 0
+
+    def submit(self, text: str) -> Future:
+        """A future for the embedding of `text` (raises if embedding it failed)."""
+        key = cache_key(EMBEDDING_MODEL, text)
+        batch = None
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                embedding_dispatch_inputs.inc(path="joined")
+                return future
+            future = self._in_flight[key] = Future()
+            self._pending.append((key, text, future))
+            if len(self._pending) >= self.max_batch or not self._sending:
+                # Nothing in flight to wait for, so don't make the caller sit out the window
+                batch = self._take_pending()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        embedding_dispatch_inputs.inc(path="dispatched")
+        if batch:
+            # An immediate or full batch goes out right away, on the submitting thread
+            self._send(batch)
+        return future
+
+    def abandon(self, text: str, future: Future) -> None:
+        """Forget a caller's request that is taking too long, so later callers don't join it."""
+        key = cache_key(EMBEDDING_MODEL, text)
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            self._pending = [entry for entry in self._pending if entry[2] is not future]
+
+    def _take_pending(self) -> List[Tuple[str, str, Future]]:
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if batch:
+            self._sending += 1
+        return batch
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch: List[Tuple[str, str, Future]]) -> None:
+        texts = [text for _, text, _ in batch]
+        result = EmbeddingBatchResult(embeddings=[])
+        try:
+            # Long texts can still exceed the per-request token limit, so plan as embed_many() does
+            for indices in plan_batches(texts):
+                embedding_dispatch_batch_size.observe(len(indices))
+                embeddings, errors = _embed_batch([texts[i] for i in indices], result, "coalesced")
+                for position, i in enumerate(indices):
+                    key, text, future = batch[i]
+                    if position in errors:
+                        future.set_exception(RuntimeError(errors[position]))
+                    else:
+                        # Cache before leaving the in-flight table so later callers hit the cache
+                        embedding_cache.put(EMBEDDING_MODEL, text, embeddings[position])
+                        future.set_result(embeddings[position])
+                    with self._lock:
+                        if self._in_flight.get(key) is future:
+                            del self._in_flight[key]
+        except Exception as e:
+            # Never leave a caller waiting on a future nobody will resolve
+            with self._lock:
+                for key, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                        if self._in_flight.get(key) is future:
+                            del self._in_flight[key]
+        finally:
+            with self._lock:
+                self._sending -= 1
+
+dispatcher = EmbeddingDispatcher(EMBEDDING_COALESCE_WINDOW_MS / 1000) if EMBEDDING_COALESCE_WINDOW_MS > 0 else None
+
 
-def text_similarity_score(input_text: str, case_text: str) -> float:
-    print("Calculating similarity score")
+def text_similarity_score(
+    input_text: str,
+    case_text: str,
+    input_embedding: Optional[list] = None,
+    case_embedding: Optional[list] = None
+) -> float:
+    """Cosine similarity of two texts. Precomputed embeddings are used when given."""
+    logger.debug("Calculating similarity score")
     if not input_text or not case_text:
         return 0.0
 
@@ -34,13 +347,13 @@ def text_similarity_score(input_text: str, case_text: str) -> float:
     if not a or not b:
         return 0.0
 
-    print("Generating embeddings for input text")
-    emb_a = embed(a)
-    print("Generating embeddings for case text")
-    emb_b = embed(b)
+    logger.debug("Generating embeddings for input text")
+    emb_a = input_embedding if input_embedding is not None else embed(a)
+    logger.debug("Generating embeddings for case text")
+    emb_b = case_embedding if case_embedding is not None else embed(b)
 
     if emb_a is None or emb_b is None:
         return 0.0
 
-    print("Calculating cosine similarity")
+    logger.debug("Calculating cosine similarity")
     return cosine_similarity(emb_a, emb_b)
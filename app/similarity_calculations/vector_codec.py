@@ -0,0 +1,96 @@
+import json
+import struct
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# pgvector binary format: int16 dim, int16 unused, then dim big-endian float4 values
+_PGVECTOR_HEADER = struct.Struct(">hh")
+_PGVECTOR_FLOAT = np.dtype(">f4")
+
+
+def unwrap_embedding(value: Any) -> Any:
+    """Strip the wrappers PostgREST joins put around a vector.
+
+    Depending on how resource_embeddings is selected, the value is the vector itself, a
+    {"embedding": ...} dict or a one-element list of such dicts.
+    """
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        value = value[0]
+    if isinstance(value, dict):
+        value = value.get("embedding")
+    return value
+
+
+def decode_pgvector_binary(payload: bytes) -> np.ndarray:
+    """Decode one pgvector binary (send/recv) payload into a float32 array."""
+    dim, _ = _PGVECTOR_HEADER.unpack_from(payload, 0)
+    return np.frombuffer(payload, dtype=_PGVECTOR_FLOAT, count=dim, offset=_PGVECTOR_HEADER.size).astype(np.float32)
+
+
+def decode_pgvector_text(text: str) -> np.ndarray:
+    """Decode one pgvector text value ('[0.1,0.2,...]') into a float32 array."""
+    return np.fromstring(text.strip()[1:-1], dtype=np.float32, sep=",")
+
+
+def _decode_one(value: Any) -> Optional[np.ndarray]:
+    value = unwrap_embedding(value)
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decode_pgvector_binary(bytes(value))
+    if isinstance(value, str):
+        return decode_pgvector_text(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def decode_embeddings(values: Sequence[Any], dim: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode a column of embeddings into one contiguous float32 matrix.
+
+    Accepts pgvector text, pgvector binary, lists/arrays, or the PostgREST join
+    wrappers around any of those; None marks a missing vector. Returns
+    (matrix of shape (n, dim), boolean mask of rows that had a vector). Missing rows
+    are left as zeros.
+
+    When every value is pgvector text (the usual PostgREST payload) the whole column is
+    parsed with a single NumPy call rather than one json.loads() per row.
+    """
+    values = [unwrap_embedding(value) for value in values]
+    present = np.array([value is not None for value in values], dtype=bool)
+    texts = [value for value in values if value is not None]
+
+    if texts and all(isinstance(value, str) for value in texts):
+        # Only reshape when every row has the same number of components: a total that
+        # merely divides evenly would otherwise be split into wrong rows
+        widths = {value.count(",") + 1 for value in texts}
+        row_dim = next(iter(widths))
+        if len(widths) == 1 and dim in (None, row_dim):
+            flat = np.fromstring(",".join(value.strip()[1:-1] for value in texts), dtype=np.float32, sep=",")
+            if flat.shape[0] == row_dim * len(texts):
+                matrix = np.zeros((len(values), row_dim), dtype=np.float32)
+                matrix[present] = flat.reshape(len(texts), row_dim)
+                return matrix, present
+        # Mixed dimensions; fall through and report them row by row
+
+    rows: List[Optional[np.ndarray]] = [_decode_one(value) for value in values]
+    if dim is None:
+        dim = next((row.shape[0] for row in rows if row is not None), 0)
+    matrix = np.zeros((len(values), dim), dtype=np.float32)
+    for index, row in enumerate(rows):
+        if row is None:
+            continue
+        if row.shape[0] != dim:
+            raise ValueError(f"Embedding at row {index} has {row.shape[0]} dimensions, expected {dim}")
+        matrix[index] = row
+    return matrix, present
+
+
+def parse_embedding(value: Any) -> Optional[list]:
+    """Decode a single embedding into a plain list (None if missing)."""
+    value = unwrap_embedding(value)
+    if isinstance(value, str):
+        return json.loads(value)
+    if value is None or isinstance(value, list):
+        return value
+    decoded = _decode_one(value)
+    return decoded.tolist() if decoded is not None else None
@@ -1,65 +1,456 @@
+import logging
 import os
-from app.similarity_calculations.text_similarity import embed
-from supabase import create_client
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.clients import LazyClient, create_supabase_client
+from app.embedding_pipeline import run_embedding_pipeline
+from app.metrics import Counter, Histogram
+from app.retry import with_backoff
+from app.similarity_calculations.ann_index import update_resource_ann_index
+from app.similarity_calculations.embedding_cache import cache_key
+from app.similarity_calculations.text_similarity import EMBEDDING_MODEL, embed
+from app.similarity_calculations.vector_codec import parse_embedding
 
-url = os.environ["SUPABASE_URL"]
-key = os.environ["SUPABASE_KEY"]
+# Created on first use, so importing this module needs neither credentials nor the SDK
+supabase = LazyClient(create_supabase_client)
 
-supabase = create_client(url, key)
+# Free-text fields of navigator_simulations that get a stored embedding
+CASE_STUDY_TEXT_FIELDS = ["first_session_notes", "additional_info", "child_notes"]
+
+CASE_STUDY_COLUMNS = ("id", "state", "current_challenges", "first_session_notes", "additional_info", "child_age", "child_diagnoses", "child_stage", "child_notes")
+RESOURCE_COLUMNS = ("id", "title", "description", "type", "source", "category", "topics", "recommend_if", "state", "organization", "default_navigator_note")
+TASK_COLUMNS = ("id", "title", "description", "state", "category", "why", "what", "who", "diagnoses", "states", "insurance", "milestone", "age_min", "age_max")
+
+# Rows per request when reading whole tables. Keep it at or below the PostgREST
+# max-rows setting (1000 by default); larger pages still read correctly, just in more
+# requests. Up to SUPABASE_PAGE_WORKERS pages are fetched concurrently.
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+SUPABASE_PAGE_WORKERS = int(os.getenv("SUPABASE_PAGE_WORKERS", "4"))
+# Values per `in` filter: they go in the query string, and 500 UUIDs (~19.5 KB) risk a
+# 414 from the gateway
+SUPABASE_IN_FILTER_SIZE = int(os.getenv("SUPABASE_IN_FILTER_SIZE", "100"))
+
+def _select_page(
+    table: str,
+    columns: Sequence[str],
+    key: str,
+    filters: Dict[str, Any],
+    page_size: int,
+    after: Any = None,
+    first: Any = None,
+    last: Any = None
+) -> List[Dict[str, Any]]:
+    """One page of rows in `key` order with after < key (or first <= key) and key <= last.
+
+    The query is built from scratch on every attempt: postgrest builders change in
+    place, so a retried builder would send its params twice.
+    """
+    def request():
+        query = supabase.table(table).select(*columns)
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        if after is not None:
+            query = query.gt(key, after)
+        elif first is not None:
+            query = query.gte(key, first)
+        if last is not None:
+            query = query.lte(key, last)
+        return query.order(key).limit(page_size).execute()
+
+    return with_backoff(request).data
+
+def _key_ranges(table: str, key: str, filters: Dict[str, Any], page_size: int) -> Iterator[Tuple[Any, Any]]:
+    """(first, last) key of each page of `table`, scanning only the key column."""
+    last = None
+    while True:
+        page = _select_page(table, (key,), key, filters, page_size, after=last)
+        # Stop on an empty page, not a short one: the server may cap pages below page_size
+        if not page:
+            return
+        yield page[0][key], page[-1][key]
+        last = page[-1][key]
+
+def _fetch_range(
+    table: str,
+    columns: Sequence[str],
+    key: str,
+    filters: Dict[str, Any],
+    first: Any,
+    last: Any,
+    page_size: int
+) -> List[Dict[str, Any]]:
+    """All rows with first <= key <= last, continuing past any server-side row cap."""
+    rows: List[Dict[str, Any]] = []
+    while not rows or rows[-1][key] != last:
+        after = rows[-1][key] if rows else None
+        page = _select_page(table, columns, key, filters, page_size, after=after, first=first, last=last)
+        # The last key may have been deleted since the key scan
+        if not page:
+            break
+        rows.extend(page)
+    return rows
+
+def iter_table_pages(
+    table: str,
+    columns: Sequence[str],
+    key: str = "id",
+    filters: Optional[Dict[str, Any]] = None,
+    page_size: int = SUPABASE_PAGE_SIZE,
+    workers: int = SUPABASE_PAGE_WORKERS
+) -> Iterator[List[Dict[str, Any]]]:
+    """Read a whole table as pages of rows, in `key` order, using keyset pagination.
+
+    `key` must be unique (within `filters`, which are equality filters). A key-only scan
+    finds each page's key range and the selected `columns` of up to `workers` ranges are
+    fetched concurrently, so at most that many pages are held at once however large
+    the table is. Every request is bounded, so the PostgREST row cap never truncates
+    the result.
+    """
+    filters = filters or {}
+    columns = tuple(columns) if key in columns else (key, *columns)
+    ranges = _key_ranges(table, key, filters, page_size)
+    if workers <= 1:
+        for first, last in ranges:
+            yield _fetch_range(table, columns, key, filters, first, last, page_size)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"read-{table}")
+    try:
+        pending = deque()
+        for first, last in ranges:
+            pending.append(pool.submit(_fetch_range, table, columns, key, filters, first, last, page_size))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # A consumer that stops early doesn't wait for pages it will never read
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_table(table: str, columns: Sequence[str], key: str = "id", filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Rows of a whole table, streamed page by page (see iter_table_pages)."""
+    for page in iter_table_pages(table, columns, key, filters):
+        yield from page
+
+def iter_case_study_embedding_rows(columns: Sequence[str], fields: Sequence[str] = CASE_STUDY_TEXT_FIELDS) -> Iterator[Dict[str, Any]]:
+    """case_study_embeddings rows, one text field at a time.
+
+    The table's key is (case_study_id, field), so each field is read separately with
+    case_study_id as its unique paging key.
+    """
+    columns = tuple(columns) if "field" in columns else (*columns, "field")
+    for field in fields:
+        yield from iter_table("case_study_embeddings", columns, key="case_study_id", filters={"field": field})
 
 def get_all_case_studies():
-    res = supabase.table("navigator_simulations").select("id", "state", "current_challenges", "first_session_notes", "additional_info", "child_age", "child_diagnoses", "child_stage", "child_notes").execute()
-    return res.data
+    return list(iter_table("navigator_simulations", CASE_STUDY_COLUMNS))
 
 def get_all_resources():
-    res = supabase.table("resources").select("id", "title", "description", "type", "source", "category", "topics", "recommend_if", "topics", "state", "organization", "default_navigator_note").execute()
-    return res.data
+    return list(iter_table("resources", RESOURCE_COLUMNS))
 
 def get_all_tasks():
-    res = supabase.table("roadmap_tasks").select("id", "title", "description", "state", "category", "why", "what", "who", "diagnoses", "states", "insurance", "milestone", "age_min", "age_max").execute()
-    return res.data
+    return list(iter_table("roadmap_tasks", TASK_COLUMNS))
+
+def resource_embedding_text(resource):
+    """The exact text a resource's embedding is computed from."""
+    return f"{resource['title']} {resource['description']} {resource['category']} {resource['topics']} {resource['recommend_if']} {resource['organization']} {resource['default_navigator_note']}"
 
 def add_embeddings_to_resources():
-    resources = get_all_resources()
-    for resource in resources:
-        text_to_embed = f"{resource['title']} {resource['description']} {resource['category']} {resource['topics']} {resource['recommend_if']} {resource['organization']} {resource['default_navigator_note']}"
-        embedding = embed(text_to_embed)
-        if embedding:
-            supabase.table("resource_embeddings").upsert({
-                "resource_id": resource["id"], 
-                "embedding": embedding
-            }).execute()
-        print("Added embedding for resource ID:", resource["id"])
+    """Bring resource_embeddings in line with the resources table.
+
+    Only resources whose embedded text changed (by content hash) are re-embedded, and
+    embeddings of deleted resources are removed. Prints a summary of the run.
+    """
+    started = time.perf_counter()
+    stored_hashes = {
+        row["resource_id"]: row.get("content_hash")
+        for row in iter_table("resource_embeddings", ("resource_id", "content_hash"), key="resource_id")
+    }
+
+    # Resources are streamed straight into the pipeline; only their ids are kept
+    resource_ids = set()
+    skipped = 0
+    def changed():
+        nonlocal skipped
+        for resource in iter_table("resources", RESOURCE_COLUMNS):
+            resource_ids.add(resource["id"])
+            text = resource_embedding_text(resource)
+            content_hash = cache_key(EMBEDDING_MODEL, text)
+            if stored_hashes.get(resource["id"]) == content_hash:
+                skipped += 1
+                continue
+            yield {"resource_id": resource["id"], "content_hash": content_hash}, text
+
+    upserted = []
+    def write_rows(rows):
+        supabase.table("resource_embeddings").upsert(rows, on_conflict="resource_id").execute()
+        upserted.extend((row["resource_id"], row["embedding"]) for row in rows)
+
+    stats = run_embedding_pipeline(changed(), write_rows)
+    for row, error in stats.failures:
+        print("Failed to embed resource ID:", row["resource_id"], "-", error)
+
+    orphaned = [resource_id for resource_id in stored_hashes if resource_id not in resource_ids]
+    for start in range(0, len(orphaned), SUPABASE_IN_FILTER_SIZE):
+        supabase.table("resource_embeddings").delete().in_("resource_id", orphaned[start:start + SUPABASE_IN_FILTER_SIZE]).execute()
+
+    # Keep the persisted ANN index (if configured) in step without a full rebuild
+    update_resource_ann_index(upserted, orphaned)
+
+    print(
+        f"Resource embeddings: {stats.written} changed, "
+        f"{skipped} skipped, {len(orphaned)} deleted, {stats.failed} failed "
+        f"({stats.api_calls} API call(s), {stats.rows_per_second:.1f} rows/s, {time.perf_counter() - started:.1f}s)"
+    )
+
+def add_embeddings_to_case_studies():
+    """Embed the free-text fields of every case study into case_study_embeddings.
+
+    Each row stores the content hash of the text it was computed from, so unchanged
+    fields are skipped and the scorer can tell when a stored vector is stale.
+    """
+    stored_hashes = {
+        (row["case_study_id"], row["field"]): row["content_hash"]
+        for row in iter_case_study_embedding_rows(("case_study_id", "field", "content_hash"))
+    }
+
+    # Case studies are streamed straight into the pipeline
+    pending = 0
+    def changed():
+        nonlocal pending
+        for case_study in iter_table("navigator_simulations", CASE_STUDY_COLUMNS):
+            for field in CASE_STUDY_TEXT_FIELDS:
+                text = (case_study.get(field) or "").strip()
+                if not text:
+                    continue
+                content_hash = cache_key(EMBEDDING_MODEL, text)
+                if stored_hashes.get((case_study["id"], field)) == content_hash:
+                    continue
+                pending += 1
+                yield {"case_study_id": case_study["id"], "field": field, "content_hash": content_hash}, text
+
+    stats = run_embedding_pipeline(
+        changed(),
+        lambda rows: supabase.table("case_study_embeddings").upsert(rows, on_conflict="case_study_id,field").execute()
+    )
+    for row, error in stats.failures:
+        print(f"Failed to embed case study {row['case_study_id']} {row['field']}: {error}")
+    print(
+        f"Case study embeddings: {stats.written}/{pending} changed fields written "
+        f"({stats.api_calls} API call(s), {stats.rows_per_second:.1f} rows/s)"
+    )
+
+def get_case_study_embedding_rows():
+    return list(iter_case_study_embedding_rows(("case_study_id", "field", "content_hash", "embedding")))
+
+def get_case_study_embeddings():
+    """Return {case_study_id: {field: {"embedding": [...], "content_hash": str}}}."""
+    embeddings = {}
+    for row in iter_case_study_embedding_rows(("case_study_id", "field", "content_hash", "embedding")):
+        embeddings.setdefault(row["case_study_id"], {})[row["field"]] = {
+            "embedding": parse_embedding(row["embedding"]),
+            "content_hash": row["content_hash"]
+        }
+    return embeddings
+
+def iter_resource_embedding_pages(columns: Sequence[str] = ("resource_id", "content_hash", "embedding")) -> Iterator[List[Dict[str, Any]]]:
+    return iter_table_pages("resource_embeddings", columns, key="resource_id")
+
+def get_resource_embeddings():
+    return [row for page in iter_resource_embedding_pages() for row in page]
 
 def get_all_resources_with_embeddings():
     # Fetch resources and their embeddings separately, then join in Python
-    resources = supabase.table("resources").select("*").execute()
-    embeddings = supabase.table("resource_embeddings").select("resource_id", "embedding").execute()
+    resources = get_all_resources()
     
-    # Create a lookup dict for embeddings
-    embedding_map = {e["resource_id"]: e["embedding"] for e in embeddings.data}
+    # Create a lookup dict for embeddings, streamed so only one copy is held
+    embedding_map = {}
+    for page in iter_resource_embedding_pages(("resource_id", "embedding")):
+        embedding_map.update((e["resource_id"], e["embedding"]) for e in page)
     
     # Attach embeddings to resources
-    for resource in resources.data:
+    for resource in resources:
         resource["embedding"] = embedding_map.get(resource["id"])
     
-    return resources.data
+    return resources
 
-def match_similar_resources(query_text: str, match_count: int = 20, match_threshold: float = 0.5):
-    """Use database vector search to find similar resources."""
-    query_embedding = embed(query_text)
-    if not query_embedding:
-        return []
-    
+def match_resources_by_embedding(query_embedding, match_count: int = 20, match_threshold: float = 0.5):
+    """Database vector search: rows of the match_resources RPC (id, ..., similarity), best first."""
     # Use RPC call to database function for vector similarity search
     result = supabase.rpc('match_resources', {
         'query_embedding': query_embedding,
         'match_threshold': match_threshold,
         'match_count': match_count
     }).execute()
-    
+
     return result.data
 
+def match_similar_resources(query_text: str, match_count: int = 20, match_threshold: float = 0.5):
+    """Use database vector search to find similar resources."""
+    query_embedding = embed(query_text)
+    if not query_embedding:
+        return []
+
+    return match_resources_by_embedding(query_embedding, match_count, match_threshold)
+
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "600"))
+SNAPSHOT_PROBE_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_PROBE_INTERVAL_SECONDS", "30"))
+WATERMARK_COLUMN = os.getenv("SNAPSHOT_WATERMARK_COLUMN", "updated_at")
+
+logger = logging.getLogger(__name__)
+
+snapshot_refresh_seconds = Histogram(
+    "corpus_snapshot_refresh_seconds",
+    "Time to fetch a corpus snapshot from Supabase.",
+    labels=("snapshot",)
+)
+snapshot_errors = Counter(
+    "corpus_snapshot_errors_total",
+    "Failed snapshot watermark probes and background refreshes.",
+    labels=("snapshot", "operation")
+)
+
+@dataclass(frozen=True)
+class Snapshot:
+    """An immutable, versioned copy of a table (or derived structure) held in memory."""
+    version: int
+    watermark: Any
+    fetched_at: float
+    data: Any
+
+class SnapshotCache:
+    """Holds the last-fetched snapshot and refreshes it off the request path.
+
+    Readers get the current Snapshot reference without locking. Every
+    `probe_interval` seconds a reader kicks off a background check: `probe()` returns a
+    cheap watermark (row count / max updated_at) and the data is reloaded when the
+    watermark moved or the snapshot is older than `ttl`. Only the very first `get()`
+    waits on a load.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        probe: Optional[Callable[[], Any]] = None,
+        ttl: float = SNAPSHOT_TTL_SECONDS,
+        probe_interval: float = SNAPSHOT_PROBE_INTERVAL_SECONDS
+    ):
+        self.name = name
+        self.loader = loader
+        self.probe = probe
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self._snapshot: Optional[Snapshot] = None
+        self._last_check = 0.0
+        self._load_lock = threading.RLock()
+        self._checking = threading.Lock()
+
+    def _probe(self) -> Any:
+        if self.probe is None:
+            return None
+        try:
+            return self.probe()
+        except Exception as e:
+            snapshot_errors.inc(snapshot=self.name, operation="probe")
+            logger.warning("Snapshot probe for %s failed: %s", self.name, e)
+            return None
+
+    def refresh(self, watermark: Any = None) -> Snapshot:
+        """Load fresh data and atomically swap it in."""
+        with self._load_lock:
+            if watermark is None:
+                watermark = self._probe()
+            with snapshot_refresh_seconds.time(snapshot=self.name):
+                data = self.loader()
+            previous = self._snapshot
+            snapshot = Snapshot(
+                version=previous.version + 1 if previous else 1,
+                watermark=watermark,
+                fetched_at=time.time(),
+                data=data
+            )
+            self._snapshot = snapshot
+            self._last_check = snapshot.fetched_at
+            return snapshot
+
+    def _check(self) -> None:
+        try:
+            snapshot = self._snapshot
+            watermark = self._probe()
+            expired = time.time() - snapshot.fetched_at > self.ttl
+            changed = watermark is not None and watermark != snapshot.watermark
+            if expired or changed:
+                self.refresh(watermark)
+        except Exception as e:
+            snapshot_errors.inc(snapshot=self.name, operation="refresh")
+            logger.warning("Snapshot refresh for %s failed: %s", self.name, e)
+        finally:
+            self._last_check = time.time()
+            self._checking.release()
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                return self._snapshot or self.refresh()
+
+        if time.time() - self._last_check > self.probe_interval and self._checking.acquire(blocking=False):
+            threading.Thread(target=self._check, name=f"snapshot-{self.name}", daemon=True).start()
+        return snapshot
+
+_watermark_unsupported = set()
+# Fallback watermark column for tables without an "id" primary key
+TABLE_KEY_COLUMNS = {"case_study_embeddings": "case_study_id", "resource_embeddings": "resource_id"}
+
+def _is_missing_column(error: Exception) -> bool:
+    """Whether PostgREST rejected a query because a column doesn't exist (SQLSTATE 42703)."""
+    return getattr(error, "code", None) == "42703" or "does not exist" in str(getattr(error, "message", None) or error)
+
+def table_watermark(*tables: str) -> Callable[[], Any]:
+    """Probe returning (row count, max updated_at) per table.
+
+    Tables without the watermark column fall back to (row count, max key), which misses
+    in-place edits; the snapshot TTL bounds how long those go unnoticed.
+    """
+    def probe():
+        watermark = []
+        for table in tables:
+            key_column = TABLE_KEY_COLUMNS.get(table, "id")
+            column = key_column if table in _watermark_unsupported else WATERMARK_COLUMN
+            try:
+                res = supabase.table(table).select(column, count="exact").order(column, desc=True, nullsfirst=False).limit(1).execute()
+            except Exception as e:
+                # Anything but a missing column (timeouts, 5xx) is left to the caller, which
+                # logs it; falling back for good would lose updated_at tracking for no reason
+                if column == key_column or not _is_missing_column(e):
+                    raise
+                _watermark_unsupported.add(table)
+                column = key_column
+                res = supabase.table(table).select(column, count="exact").order(column, desc=True).limit(1).execute()
+            watermark.append((res.count, res.data[0][column] if res.data else None))
+        return tuple(watermark)
+    return probe
+
+case_studies_snapshot = SnapshotCache(
+    "case_studies", lambda: tuple(iter_table("navigator_simulations", CASE_STUDY_COLUMNS)), table_watermark("navigator_simulations")
+)
+case_study_embeddings_snapshot = SnapshotCache(
+    "case_study_embeddings", get_case_study_embeddings, table_watermark("case_study_embeddings")
+)
+resources_snapshot = SnapshotCache(
+    "resources", lambda: tuple(iter_table("resources", RESOURCE_COLUMNS)), table_watermark("resources")
+)
+resources_with_embeddings_snapshot = SnapshotCache(
+    "resources_with_embeddings",
+    lambda: tuple(get_all_resources_with_embeddings()),
+    table_watermark("resources", "resource_embeddings")
+)
+
 def get_user_profile_by_id(user_id: str):
     res = supabase.table("users").select("*").eq("user_id", user_id).single().execute()
     return res.data
@@ -74,4 +465,21 @@ def get_child_diagnoses_by_user_id(user_id: str):
         if isinstance(diagnoses, list):
             all_diagnoses.extend(diagnoses)
 
-    return all_diagnoses
\ No newline at end of file
+    return all_diagnoses
+
+def get_all_users():
+    return list(iter_table("users", ("user_id", "current_challenges", "first_session_notes", "additional_info"), key="user_id"))
+
+def get_all_child_diagnoses():
+    """Return {user_id: [diagnosis, ...]} over all children."""
+    diagnoses_by_user = {}
+    for child in iter_table("user_childs", ("id", "user_id", "diagnoses")):
+        diagnoses = child.get("diagnoses", [])
+        all_diagnoses = diagnoses_by_user.setdefault(child["user_id"], [])
+        if isinstance(diagnoses, list):
+            all_diagnoses.extend(diagnoses)
+    return diagnoses_by_user
+
+def user_profile_text(user_profile, child_diagnoses):
+    """The text a user's profile embedding is computed from."""
+    return f"{user_profile.get('current_challenges', '')} {user_profile.get('first_session_notes', '')} {user_profile.get('additional_info', '')} {' '.join(child_diagnoses)}"
\ No newline at end of file
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.embedding_pipeline import UPSERT_SIZE
+from app.retry import with_backoff
+from app.similarity_calculations.embedding_cache import cache_key
+from app.similarity_calculations.resource_index import ResourceIndex
+from app.similarity_calculations.text_similarity import EMBEDDING_MODEL, embed_many
+from app.similarity_calculations.vector_codec import parse_embedding
+
+RECOMMENDATIONS_TABLE = "user_resource_recommendations"
+# Resources stored per user; changing it invalidates every stored row
+USER_RECOMMENDATIONS_K = int(os.getenv("USER_RECOMMENDATIONS_K", "20"))
+
+
+def catalog_version(resource_hashes: Dict[Any, Optional[str]], k: int) -> str:
+    """Fingerprint of the resource catalog as embedded: ids, content hashes and k.
+
+    Any added, removed or re-embedded resource changes it, which makes every user's
+    stored top-k stale.
+    """
+    digest = hashlib.sha256(f"k={k}".encode("utf-8"))
+    for resource_id, content_hash in sorted(resource_hashes.items(), key=lambda item: str(item[0])):
+        digest.update(f"\n{resource_id}:{content_hash}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stored_embeddings(user_ids: List[Any]) -> Dict[Any, Optional[list]]:
+    from app.supabase_client import SUPABASE_IN_FILTER_SIZE, supabase
+
+    embeddings = {}
+    for start in range(0, len(user_ids), SUPABASE_IN_FILTER_SIZE):
+        res = supabase.table(RECOMMENDATIONS_TABLE).select("user_id", "embedding").in_("user_id", user_ids[start:start + SUPABASE_IN_FILTER_SIZE]).execute()
+        embeddings.update({row["user_id"]: parse_embedding(row["embedding"]) for row in res.data})
+    return embeddings
+
+
+def update_user_recommendations(k: int = USER_RECOMMENDATIONS_K) -> None:
+    """Store every user's top-k resources in user_resource_recommendations.
+
+    Users, children and stored rows are each read in one paginated pass. A user is
+    recomputed only when their profile text (by content hash) or the resource catalog changed;
+    changed profiles are embedded in batches, unchanged ones reuse the stored profile
+    embedding, and all of them are scored against the catalog with one matrix product
+    per chunk. Rows of deleted users are removed. Prints a summary of the run.
+    """
+    from app.supabase_client import (
+        SUPABASE_IN_FILTER_SIZE,
+        get_all_child_diagnoses,
+        get_all_resources_with_embeddings,
+        get_all_users,
+        iter_table,
+        supabase,
+        user_profile_text,
+    )
+
+    started = time.perf_counter()
+    users = get_all_users()
+    diagnoses_by_user = get_all_child_diagnoses()
+    catalog = iter_table("resource_embeddings", ("resource_id", "content_hash"), key="resource_id")
+    version = catalog_version({row["resource_id"]: row.get("content_hash") for row in catalog}, k)
+    stored = iter_table(RECOMMENDATIONS_TABLE, ("user_id", "profile_hash", "catalog_hash"), key="user_id")
+    stored_rows = {row["user_id"]: row for row in stored}
+
+    changed_profiles = []  # (user_id, text, profile_hash): needs a new embedding
+    changed_catalog = []  # (user_id, profile_hash): stored embedding is still valid
+    for user in users:
+        text = user_profile_text(user, diagnoses_by_user.get(user["user_id"], []))
+        profile_hash = cache_key(EMBEDDING_MODEL, text)
+        previous = stored_rows.get(user["user_id"])
+        if previous is None or previous.get("profile_hash") != profile_hash:
+            changed_profiles.append((user["user_id"], text, profile_hash))
+        elif previous.get("catalog_hash") != version:
+            changed_catalog.append((user["user_id"], profile_hash))
+
+    pending = []  # (user_id, profile_hash, embedding)
+    batch = embed_many([text for _, text, _ in changed_profiles])
+    for i, (user_id, _, profile_hash) in enumerate(changed_profiles):
+        if i in batch.errors:
+            print("Failed to embed profile of user ID:", user_id, "-", batch.errors[i])
+            continue
+        pending.append((user_id, profile_hash, batch.embeddings[i]))
+    profile_updates = len(pending)
+
+    stored_embeddings = _stored_embeddings([user_id for user_id, _ in changed_catalog])
+    for user_id, profile_hash in changed_catalog:
+        embedding = stored_embeddings.get(user_id)
+        if embedding is None:
+            print("Missing stored profile embedding for user ID:", user_id)
+            continue
+        pending.append((user_id, profile_hash, embedding))
+
+    if pending:
+        index = ResourceIndex(get_all_resources_with_embeddings(), storage="float32", dims=0)
+        queries = np.asarray([embedding for _, _, embedding in pending], dtype=np.float32)
+        results = index.search_many(queries, k)
+
+        rows = [
+            {
+                "user_id": user_id,
+                "profile_hash": profile_hash,
+                "catalog_hash": version,
+                "embedding": embedding,
+                "recommendations": [{"resource_id": resource["id"], "score": round(score, 6)} for score, resource in top],
+            }
+            for (user_id, profile_hash, embedding), top in zip(pending, results)
+        ]
+        for start in range(0, len(rows), UPSERT_SIZE):
+            chunk = rows[start:start + UPSERT_SIZE]
+            with_backoff(lambda: supabase.table(RECOMMENDATIONS_TABLE).upsert(chunk, on_conflict="user_id").execute())
+
+    user_ids = {user["user_id"] for user in users}
+    orphaned = [user_id for user_id in stored_rows if user_id not in user_ids]
+    for start in range(0, len(orphaned), SUPABASE_IN_FILTER_SIZE):
+        supabase.table(RECOMMENDATIONS_TABLE).delete().in_("user_id", orphaned[start:start + SUPABASE_IN_FILTER_SIZE]).execute()
+
+    print(
+        f"User recommendations: {profile_updates} profile(s) and {len(pending) - profile_updates} catalog-only recomputed, "
+        f"{len(users) - len(changed_profiles) - len(changed_catalog)} skipped, {len(orphaned)} deleted, "
+        f"{len(changed_profiles) + len(changed_catalog) - len(pending)} failed "
+        f"({batch.api_calls} API call(s), {time.perf_counter() - started:.1f}s)"
+    )
+
+
+def get_user_recommendations(user_id: str) -> Optional[List[Dict[str, Any]]]:
+    """A user's stored [{"resource_id", "score"}, ...], best first; None if not computed yet."""
+    from app.supabase_client import supabase
+
+    res = supabase.table(RECOMMENDATIONS_TABLE).select("recommendations").eq("user_id", user_id).limit(1).execute()
+    return res.data[0]["recommendations"] if res.data else None
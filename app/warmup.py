@@ -0,0 +1,91 @@
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from app.metrics import Gauge
+
+# Preload corpora, indexes and caches before the worker reports ready
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Most recent disk-cache embeddings loaded into memory at startup (0 skips the stage)
+EMBEDDING_CACHE_PRELOAD_ITEMS = int(os.getenv("EMBEDDING_CACHE_PRELOAD_ITEMS", "5000"))
+
+logger = logging.getLogger(__name__)
+
+startup_stage_seconds = Gauge(
+    "startup_stage_seconds",
+    "Time spent in each warm-up stage of the last startup.",
+    labels=("stage",)
+)
+
+
+def _construct_clients() -> None:
+    import app.supabase_client as supabase_client
+    import app.similarity_calculations.text_similarity as text_similarity
+    from app.clients import LazyClient
+
+    for client in (supabase_client.supabase, text_similarity.client):
+        # Clients swapped in by tests or benchmarks are already constructed
+        if isinstance(client, LazyClient):
+            client.get()
+
+
+def _preload_embedding_cache() -> None:
+    from app.similarity_calculations.text_similarity import embedding_cache
+
+    if EMBEDDING_CACHE_PRELOAD_ITEMS > 0:
+        embedding_cache.preload(EMBEDDING_CACHE_PRELOAD_ITEMS)
+
+
+def _load_resource_search() -> None:
+    from app.api.similar_resources import RESOURCE_SEARCH_BACKEND, _get_ann_index
+    from app.similarity_calculations.resource_index import get_resource_index
+
+    if RESOURCE_SEARCH_BACKEND == "exact" or (RESOURCE_SEARCH_BACKEND == "ann" and _get_ann_index() is None):
+        get_resource_index()
+
+
+def warmup_stages() -> List[Tuple[str, Callable[[], object]]]:
+    """(stage, callable) pairs run by warm_up(), in order."""
+    from app.api.similar_case_studies import get_case_study_index
+    from app.api.similar_resources import get_resources_by_id
+    from app.embedding_snapshot import SHARED_SNAPSHOTS
+    from app.supabase_client import case_studies_snapshot, case_study_embeddings_snapshot
+
+    stages = [
+        ("clients", _construct_clients),
+        ("embedding_cache", _preload_embedding_cache),
+        ("case_studies_snapshot", case_studies_snapshot.get),
+    ]
+    # Shared-snapshot workers map the published vectors instead of fetching them
+    if not SHARED_SNAPSHOTS:
+        stages.append(("case_study_embeddings_snapshot", case_study_embeddings_snapshot.get))
+    return stages + [
+        ("case_study_index", get_case_study_index),
+        ("resources_snapshot", get_resources_by_id),
+        ("resource_index", _load_resource_search),
+    ]
+
+
+def warm_up() -> Dict[str, float]:
+    """Run every warm-up stage and return {stage: seconds}.
+
+    A failing stage (e.g. Supabase unreachable) is logged and skipped rather than
+    blocking startup; its work then happens lazily on the first request instead.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    for stage, run in warmup_stages():
+        stage_started = time.perf_counter()
+        try:
+            run()
+        except Exception as e:
+            logger.warning("Warm-up stage %s failed: %s", stage, e)
+        timings[stage] = time.perf_counter() - stage_started
+        startup_stage_seconds.set(timings[stage], stage=stage)
+    timings["total"] = time.perf_counter() - started
+    startup_stage_seconds.set(timings["total"], stage="total")
+    logger.info("Warm-up finished in %.2fs (%s)", timings["total"], ", ".join(
+        f"{stage} {seconds:.2f}s" for stage, seconds in timings.items() if stage != "total"
+    ))
+    return timings
@@ -0,0 +1,227 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for `OpenAI().embeddings`.
+
+    Each text maps to a fixed unit-variance vector seeded from its hash, so repeated runs
+    (and repeated texts) produce identical embeddings. Counts calls and inputs, and can
+    add a fixed per-call latency to model the network round trip.
+    """
+
+    def __init__(self, dim: int = 1536, latency_seconds: float = 0.0):
+        self.dim = dim
+        self.latency_seconds = latency_seconds
+        self.calls = 0
+        self.inputs = 0
+        self._lock = threading.Lock()
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32).tolist()
+
+    def create(self, model: str, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.calls += 1
+            self.inputs += len(texts)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return _Result(data=[_EmbeddingItem(index=i, embedding=self.vector(text)) for i, text in enumerate(texts)])
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.inputs = 0
+
+
+class FakeOpenAI:
+    """Just enough of the OpenAI client for app.similarity_calculations.text_similarity."""
+
+    def __init__(self, dim: int = 1536, latency_seconds: float = 0.0):
+        self.embeddings = FakeEmbeddings(dim, latency_seconds)
+
+
+@dataclass
+class _EmbeddingItem:
+    index: int
+    embedding: List[float]
+
+
+@dataclass
+class _Result:
+    data: Any
+    count: Optional[int] = None
+
+
+def to_pgvector(values) -> str:
+    """Render a vector the way PostgREST returns a pgvector column."""
+    return "[" + ",".join(f"{v:.8g}" for v in values) + "]"
+
+
+# Unique key of each table, used by upserts without on_conflict
+PRIMARY_KEYS = {
+    "resource_embeddings": ("resource_id",),
+    "case_study_embeddings": ("case_study_id", "field"),
+}
+VECTOR_COLUMNS = {"embedding"}
+
+
+class FakeTable:
+    """Rows of one table plus a unique index on its upsert key."""
+
+    def __init__(self, name: str, rows: Optional[List[Dict[str, Any]]] = None):
+        self.name = name
+        self.rows: List[Dict[str, Any]] = []
+        self._keys: Dict[Tuple[str, ...], Dict[tuple, int]] = {}
+        for row in rows or []:
+            self.rows.append(dict(row))
+
+    def _index(self, columns: Tuple[str, ...]) -> Dict[tuple, int]:
+        index = self._keys.get(columns)
+        if index is None:
+            index = {tuple(row.get(c) for c in columns): i for i, row in enumerate(self.rows)}
+            self._keys[columns] = index
+        return index
+
+    def upsert(self, payload: List[Dict[str, Any]], columns: Tuple[str, ...]) -> None:
+        index = self._index(columns)
+        now = time.time()
+        for values in payload:
+            values = {
+                column: to_pgvector(value) if column in VECTOR_COLUMNS and isinstance(value, list) else value
+                for column, value in values.items()
+            }
+            values["updated_at"] = now
+            key = tuple(values.get(c) for c in columns)
+            if key in index:
+                self.rows[index[key]].update(values)
+            else:
+                index[key] = len(self.rows)
+                self.rows.append(values)
+
+    def delete(self, predicate) -> None:
+        self.rows = [row for row in self.rows if not predicate(row)]
+        self._keys.clear()
+
+
+class FakeQuery:
+    """A PostgREST query builder over a FakeTable (select/upsert/delete with filters)."""
+
+    def __init__(self, table: FakeTable, max_rows: Optional[int] = None):
+        self.table = table
+        self.max_rows = max_rows
+        self.operation = "select"
+        self.columns: Tuple[str, ...] = ()
+        self.count = None
+        self.filters = []
+        self.ordering = None
+        self.row_limit = None
+        self.single_row = False
+        self.payload: List[Dict[str, Any]] = []
+        self.on_conflict: Optional[str] = None
+
+    def select(self, *columns, count=None):
+        self.operation = "select"
+        self.columns = columns
+        self.count = count
+        return self
+
+    def upsert(self, payload, on_conflict: Optional[str] = None, **kwargs):
+        self.operation = "upsert"
+        self.payload = payload if isinstance(payload, list) else [payload]
+        self.on_conflict = on_conflict
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def order(self, column, desc: bool = False, nullsfirst: Optional[bool] = None, **kwargs):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, size: int):
+        self.row_limit = size
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def _matches(self, row) -> bool:
+        return all(f(row) for f in self.filters)
+
+    def execute(self) -> _Result:
+        if self.operation == "upsert":
+            columns = tuple(self.on_conflict.split(",")) if self.on_conflict else PRIMARY_KEYS.get(self.table.name, ("id",))
+            self.table.upsert(self.payload, columns)
+            return _Result(data=self.payload)
+        if self.operation == "delete":
+            self.table.delete(self._matches)
+            return _Result(data=[])
+
+        rows = [row for row in self.table.rows if self._matches(row)] if self.filters else self.table.rows
+        total = len(rows)
+        if self.ordering:
+            column, desc = self.ordering
+            if rows and column not in rows[0]:
+                raise Exception(f'column {self.table.name}.{column} does not exist')
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            rows = sorted(present, key=lambda row: row[column], reverse=desc) + missing
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        # PostgREST silently caps every response at max-rows
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        if self.columns and self.columns != ("*",):
+            data = [{column: row.get(column) for column in self.columns} for row in rows]
+        else:
+            data = [dict(row) for row in rows]
+        if self.single_row:
+            data = data[0] if data else None
+        return _Result(data=data, count=total if self.count else None)
+
+
+@dataclass
+class FakeSupabase:
+    """In-memory stand-in for the Supabase client used by app.supabase_client."""
+    tables: Dict[str, FakeTable] = field(default_factory=dict)
+    # PostgREST's default db-max-rows
+    max_rows: Optional[int] = 1000
+
+    def load(self, name: str, rows: List[Dict[str, Any]]) -> None:
+        self.tables[name] = FakeTable(name, rows)
+
+    def table(self, name: str) -> FakeQuery:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return FakeQuery(self.tables[name], self.max_rows)
@@ -0,0 +1,288 @@
+"""Offline benchmarks for the similarity endpoint, resource search and the embedding crons.
+
+OpenAI and Supabase are replaced by the in-process fakes in benchmarks/fakes.py, so runs
+need no network or credentials and are repeatable. Each (size, scenario) runs in its own
+subprocess so resident memory and caches never leak between measurements.
+
+    python benchmarks/run.py --sizes 1000,10000 --output bench.json
+    python benchmarks/run.py --sizes 1000,10000 --compare bench.json
+"""
+import sys
+import os
+import argparse
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+SCENARIOS = ["cron", "case_studies", "resource_search"]
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+def configure_environment() -> None:
+    """Settings that must be in place before any app module is imported."""
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["SIMILARITY_API_KEY"] = "benchmark"
+    os.environ["LOG_LEVEL"] = "WARNING"
+    # No disk cache or ANN index, and no background snapshot refreshes mid-run
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["RESOURCE_ANN_INDEX_PATH"] = ""
+    os.environ["SNAPSHOT_PROBE_INTERVAL_SECONDS"] = "86400"
+    os.environ["SNAPSHOT_TTL_SECONDS"] = "86400"
+
+
+def install_fakes(dim: int, latency_ms: float):
+    """Point the app's Supabase and OpenAI clients at in-memory fakes."""
+    from benchmarks.fakes import FakeOpenAI, FakeSupabase
+    import app.supabase_client as supabase_client
+    import app.similarity_calculations.text_similarity as text_similarity
+
+    fake_supabase = FakeSupabase()
+    fake_openai = FakeOpenAI(dim, latency_ms / 1000)
+    supabase_client.supabase = fake_supabase
+    text_similarity.client = fake_openai
+    return fake_supabase, fake_openai.embeddings
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+# Set by --no-memory; tracing makes the traced runs several times slower
+TRACE_MEMORY = True
+
+
+def traced_peak_mb(fn: Callable[[], Any]) -> Optional[float]:
+    """Peak Python/NumPy memory allocated while fn runs, in MiB (None when not traced)."""
+    if not TRACE_MEMORY:
+        return None
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def quiet(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """fn with the crons' progress prints swallowed."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def bench_cron(size: int, args, fake_supabase, embeddings) -> Dict[str, Any]:
+    from benchmarks.synthetic import generate_case_studies, generate_resources
+    from app.supabase_client import add_embeddings_to_case_studies, add_embeddings_to_resources
+    from app.similarity_calculations.text_similarity import embedding_cache
+
+    fake_supabase.load("navigator_simulations", generate_case_studies(size))
+    fake_supabase.load("resources", generate_resources(size))
+    run_crons = quiet(lambda: (add_embeddings_to_resources(), add_embeddings_to_case_studies()))
+
+    full_ms = timed(run_crons)
+    full_calls, full_inputs = embeddings.calls, embeddings.inputs
+    embeddings.reset_counts()
+    noop_ms = timed(run_crons)
+    noop_calls = embeddings.calls
+
+    # Memory of a full run, from empty embedding tables and a cold cache
+    fake_supabase.load("resource_embeddings", [])
+    fake_supabase.load("case_study_embeddings", [])
+    embedding_cache.clear_memory()
+    peak_mb = traced_peak_mb(run_crons)
+
+    return {
+        "full_run_ms": round(full_ms, 1),
+        "full_run_rows_per_s": round(full_inputs / (full_ms / 1000), 1) if full_ms else 0.0,
+        "full_run_embedding_calls": full_calls,
+        "full_run_embedded_texts": full_inputs,
+        "noop_run_ms": round(noop_ms, 1),
+        "noop_run_embedding_calls": noop_calls,
+        "peak_traced_mb": peak_mb,
+    }
+
+
+def bench_case_studies(size: int, args, fake_supabase, embeddings) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    from benchmarks.synthetic import generate_case_studies, generate_requests
+    from app.main import app
+    from app.supabase_client import add_embeddings_to_case_studies, case_studies_snapshot, case_study_embeddings_snapshot
+
+    fake_supabase.load("navigator_simulations", generate_case_studies(size))
+    quiet(add_embeddings_to_case_studies)()
+    embeddings.reset_counts()
+
+    client = TestClient(app)
+    headers = {"x-api-key": os.environ["SIMILARITY_API_KEY"]}
+    requests = generate_requests(args.queries + 3)
+
+    def post(body):
+        response = client.post("/similar-case-studies/similar", json=body, headers=headers)
+        response.raise_for_status()
+
+    # First request loads the snapshots and builds the index
+    cold_ms = timed(quiet(lambda: post(requests[0])))
+    embeddings.reset_counts()
+    samples = [timed(quiet(lambda body=body: post(body))) for body in requests[1:args.queries + 1]]
+    calls = embeddings.calls
+
+    def rebuild():
+        case_studies_snapshot.refresh()
+        case_study_embeddings_snapshot.refresh()
+        post(requests[-2])
+
+    cold_peak_mb = traced_peak_mb(quiet(rebuild))
+    warm_peak_mb = traced_peak_mb(quiet(lambda: post(requests[-1])))
+
+    return dict(
+        cold_ms=round(cold_ms, 1),
+        **percentiles(samples),
+        embedding_calls_per_request=round(calls / len(samples), 2),
+        cold_peak_traced_mb=cold_peak_mb,
+        request_peak_traced_mb=warm_peak_mb,
+    )
+
+
+def bench_resource_search(size: int, args, fake_supabase, embeddings) -> Dict[str, Any]:
+    from benchmarks.synthetic import generate_queries, generate_resources
+    from app.api.similar_resources import get_similar_resources_for_next_step
+    from app.supabase_client import add_embeddings_to_resources, resources_with_embeddings_snapshot
+
+    fake_supabase.load("resources", generate_resources(size))
+    quiet(add_embeddings_to_resources)()
+    embeddings.reset_counts()
+    queries = generate_queries(args.queries + 3)
+
+    cold_ms = timed(lambda: get_similar_resources_for_next_step(queries[0]))
+    embeddings.reset_counts()
+    samples = [timed(lambda text=text: get_similar_resources_for_next_step(text)) for text in queries[1:args.queries + 1]]
+    calls = embeddings.calls
+
+    def rebuild():
+        resources_with_embeddings_snapshot.refresh()
+        get_similar_resources_for_next_step(queries[-2])
+
+    cold_peak_mb = traced_peak_mb(rebuild)
+    warm_peak_mb = traced_peak_mb(lambda: get_similar_resources_for_next_step(queries[-1]))
+
+    return dict(
+        cold_ms=round(cold_ms, 1),
+        **percentiles(samples),
+        embedding_calls_per_request=round(calls / len(samples), 2),
+        cold_peak_traced_mb=cold_peak_mb,
+        request_peak_traced_mb=warm_peak_mb,
+    )
+
+
+BENCHMARKS = {
+    "cron": bench_cron,
+    "case_studies": bench_case_studies,
+    "resource_search": bench_resource_search,
+}
+
+
+def run_worker(args) -> None:
+    """Run one (size, scenario) in this process and print its result as one JSON line."""
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+    configure_environment()
+    fake_supabase, embeddings = install_fakes(args.dim, args.embed_latency_ms)
+    result = BENCHMARKS[args.worker](args.size, args, fake_supabase, embeddings)
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except OSError:
+        return "unknown"
+
+
+def run_all(args) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for size in args.sizes:
+        for scenario in args.scenarios:
+            command = [
+                sys.executable, os.path.abspath(__file__), "--worker", scenario, "--size", str(size),
+                "--queries", str(args.queries), "--dim", str(args.dim), "--embed-latency-ms", str(args.embed_latency_ms),
+            ] + (["--no-memory"] if args.no_memory else [])
+            completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+            lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+            if completed.returncode != 0 or not lines:
+                print(completed.stdout + completed.stderr, file=sys.stderr)
+                raise SystemExit(f"Benchmark {scenario} at {size} rows failed")
+            result = json.loads(lines[-1][len(RESULT_PREFIX):])
+            results.setdefault(scenario, {})[str(size)] = result
+            print(f"{scenario} @ {size}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+    return {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"queries": args.queries, "dim": args.dim, "embed_latency_ms": args.embed_latency_ms, "memory": not args.no_memory},
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print every metric present in both runs with its relative change."""
+    print(f"\n{'metric':<60} {baseline['revision']:>14} {current['revision']:>14} {'change':>8}")
+    for scenario, sizes in current["results"].items():
+        for size, metrics in sizes.items():
+            before = baseline["results"].get(scenario, {}).get(size, {})
+            for metric, value in metrics.items():
+                if metric not in before or value is None or before[metric] is None:
+                    continue
+                old = before[metric]
+                change = f"{(value - old) / old * 100:+.1f}%" if old else ""
+                print(f"{scenario + ' @ ' + size + ' ' + metric:<60} {old:>14} {value:>14} {change:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes (rows)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--queries", type=int, default=200, help="timed requests per latency scenario")
+    parser.add_argument("--dim", type=int, default=1536, help="fake embedding dimensions")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embedding API call")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory runs")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        raise SystemExit(0)
+
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.scenarios = args.scenarios.split(",")
+    report = run_all(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
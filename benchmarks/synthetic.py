@@ -0,0 +1,139 @@
+import random
+from typing import Any, Dict, List
+
+# Value pools shaped like tests/child_situation_examples.py
+STATES = ["Maine", "Massachusetts", "New Hampshire", "Vermont", "Connecticut", "Rhode Island", "New York"]
+CHALLENGES = [
+    "Advocating for my child at school",
+    "Working on my child's resilience and behavior",
+    "Maintaining my well-being while supporting my child",
+    "Getting access to treatment / therapists",
+    "Improving my understanding of Mental and Behavioral Health",
+    "Optimizing my insurance coverage or finances",
+    "Navigating a new diagnosis",
+    "Finding community and peer support",
+]
+DIAGNOSES = [
+    "Autism (ASD)", "Anxiety", "Depression", "ADHD", "OCD", "PTSD",
+    "Communication Disorder", "Learning Disability", "Intellectual Disability",
+]
+STAGES = ["Diagnosed in past 0-2 years", "Pursuing an Evaluation", "Diagnosed >2 years ago"]
+
+SESSION_NOTES = [
+    "Struggling with school avoidance and morning anxiety.",
+    "Emotional outbursts and trouble with transitions at school.",
+    "Challenges with focus and completing tasks at home.",
+    "Difficulty sleeping and frequent worries at bedtime.",
+    "Withdrawn from friends and activities over the past months.",
+    "Repetitive checking behaviors that delay leaving the house.",
+    "Aggressive behavior toward siblings when frustrated.",
+    "Refusing to attend therapy appointments.",
+]
+ADDITIONAL_INFO = [
+    "Family has tried several interventions without success.",
+    "Teachers are cooperative but need guidance.",
+    "Waiting list for ABA therapy.",
+    "Parents report homework taking 3+ hours nightly.",
+    "Considering medication options.",
+    "Insurance denied the last evaluation request.",
+    "Recently moved and changed schools.",
+    "Grandparents help with after-school care.",
+]
+CHILD_NOTES = [
+    "Very articulate about feelings but becomes overwhelmed easily during transitions.",
+    "Prefers routine and becomes distressed with unexpected changes.",
+    "Strong in math and science.",
+    "Bright child who gets frustrated when unable to focus.",
+    "Loves creative activities.",
+    "Enjoys sports but struggles with team dynamics.",
+    "Sensitive to loud noises and crowded places.",
+    "",
+]
+
+RESOURCE_TYPES = ["Article", "Video", "Worksheet", "Support group", "Program", "Guide"]
+RESOURCE_CATEGORIES = ["School", "Therapy", "Insurance", "Parenting", "Self-care", "Diagnosis"]
+RESOURCE_TOPICS = ["IEP", "504 plan", "anxiety", "sleep", "transitions", "medication", "ABA", "advocacy", "burnout", "routines"]
+ORGANIZATIONS = ["NAMI", "Child Mind Institute", "Understood", "CHADD", "Autism Speaks", "State Parent Network"]
+
+
+def _sentences(rnd: random.Random, pool: List[str], count: int) -> str:
+    return " ".join(rnd.sample(pool, count))
+
+
+def _make_unique(row: Dict[str, Any], marker: str) -> None:
+    # Real notes are free text, so give every family its own strings (no accidental dedup)
+    for field in ("first_session_notes", "additional_info", "child_notes"):
+        if row[field]:
+            row[field] = f"{row[field]} ({marker})"
+
+
+def generate_case_study(rnd: random.Random) -> Dict[str, Any]:
+    """One navigator_simulations-style family (without id)."""
+    return {
+        "state": rnd.choice(STATES),
+        "current_challenges": rnd.sample(CHALLENGES, rnd.randint(1, 3)),
+        "first_session_notes": _sentences(rnd, SESSION_NOTES, rnd.randint(1, 2)),
+        "additional_info": _sentences(rnd, ADDITIONAL_INFO, rnd.randint(1, 3)),
+        "child_age": rnd.randint(3, 18),
+        "child_diagnoses": rnd.sample(DIAGNOSES, rnd.randint(1, 2)),
+        "child_stage": rnd.choice(STAGES),
+        "child_notes": _sentences(rnd, CHILD_NOTES, rnd.randint(1, 2)).strip(),
+    }
+
+
+def generate_case_studies(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """`count` navigator_simulations rows with ids 1..count; some optional fields are missing."""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = generate_case_study(rnd)
+        row["id"] = i + 1
+        row["updated_at"] = 0.0
+        _make_unique(row, f"case {i + 1}")
+        if rnd.random() < 0.05:
+            row["child_age"] = None
+        if rnd.random() < 0.05:
+            row["state"] = None
+        rows.append(row)
+    return rows
+
+
+def generate_requests(count: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Request bodies for /similar-case-studies/similar (a different seed than the corpus)."""
+    rnd = random.Random(seed)
+    requests = []
+    for i in range(count):
+        request = dict(generate_case_study(rnd), export_csv=False)
+        _make_unique(request, f"request {i + 1}")
+        requests.append(request)
+    return requests
+
+
+def generate_resources(count: int, seed: int = 2) -> List[Dict[str, Any]]:
+    """`count` resources rows with ids 1..count."""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        topics = rnd.sample(RESOURCE_TOPICS, rnd.randint(1, 3))
+        category = rnd.choice(RESOURCE_CATEGORIES)
+        rows.append({
+            "id": i + 1,
+            "title": f"{' and '.join(topics).capitalize()} {rnd.choice(RESOURCE_TYPES).lower()} #{i + 1}",
+            "description": _sentences(rnd, SESSION_NOTES + ADDITIONAL_INFO, 2),
+            "type": rnd.choice(RESOURCE_TYPES),
+            "source": "https://example.org/resources/" + str(i + 1),
+            "category": category,
+            "topics": topics,
+            "recommend_if": rnd.sample(CHALLENGES, 2),
+            "state": rnd.choice(STATES + [None]),
+            "organization": rnd.choice(ORGANIZATIONS),
+            "default_navigator_note": _sentences(rnd, CHILD_NOTES[:-1], 1),
+            "updated_at": 0.0,
+        })
+    return rows
+
+
+def generate_queries(count: int, seed: int = 3) -> List[str]:
+    """Next-step texts like those passed to get_similar_resources_for_next_step()."""
+    rnd = random.Random(seed)
+    return [f"{_sentences(rnd, SESSION_NOTES, 1)} {rnd.choice(CHALLENGES)} ({i})" for i in range(count)]
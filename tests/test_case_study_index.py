@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from app.api import similar_case_studies
+from app.api.similar_case_studies import WEIGHTS, CaseStudyRequest, calculate_case_similarity_detailed
+from app.similarity_calculations.case_study_index import SCORE_COLUMNS, CaseStudyIndex
+from app.similarity_calculations.label_bitsets import DIAGNOSIS_HIERARCHY
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.synthetic import generate_case_studies, generate_requests
+
+TEXT_FIELDS = ["first_session_notes", "additional_info", "child_notes"]
+# float32 embedding matrices vs float64 scalar cosine; the scalar scorer rounds to 3 places
+TOLERANCE = 0.001 + 1e-5
+
+vectors = FakeEmbeddings(dim=32)
+
+
+def embeddings_for(record):
+    """{field: vector} for the non-blank text fields of a case study or request."""
+    embeddings = {}
+    for field in TEXT_FIELDS:
+        text = (record.get(field) if isinstance(record, dict) else getattr(record, field)) or ""
+        if text.strip():
+            embeddings[field] = vectors.vector(text.strip())
+    return embeddings
+
+
+def corpus():
+    case_studies = generate_case_studies(300)
+    # Nulls, blanks and spelling variants the scalar scorer has to cope with
+    case_studies[0].update(child_diagnoses=None, current_challenges=None, child_age=None)
+    case_studies[1].update(child_diagnoses=[], current_challenges=["", "  "], state="")
+    case_studies[2].update(state=" MAINE ", child_stage=None, child_diagnoses=[" adhd", "ADHD"])
+    case_studies[3].update(first_session_notes="", additional_info="   ", child_notes=None)
+    return case_studies
+
+
+def requests():
+    bodies = generate_requests(6)
+    bodies[0].update(child_diagnoses=[], current_challenges=[], child_notes="")
+    bodies[1].update(state="maine", child_diagnoses=["Anxiety", "OCD"])
+    return [CaseStudyRequest(**body) for body in bodies]
+
+
+@pytest.fixture(params=[{}, {"child_diagnoses": DIAGNOSIS_HIERARCHY}], ids=["flat", "hierarchy"])
+def hierarchies(request, monkeypatch):
+    # The scalar scorer reads the module-level setting
+    monkeypatch.setattr(similar_case_studies, "LABEL_HIERARCHIES", request.param)
+    return request.param
+
+
+@pytest.fixture
+def case_studies():
+    return corpus()
+
+
+@pytest.fixture
+def index(case_studies, hierarchies):
+    case_embeddings = {case_study["id"]: embeddings_for(case_study) for case_study in case_studies}
+    return CaseStudyIndex(case_studies, case_embeddings, hierarchies)
+
+
+def test_score_matches_scalar_scorer(index, case_studies):
+    for req in requests():
+        input_embeddings = embeddings_for(req)
+        scores = index.score(req, input_embeddings, WEIGHTS)
+        for row, case_study in enumerate(case_studies):
+            expected = calculate_case_similarity_detailed(req, case_study, input_embeddings, embeddings_for(case_study))
+            for column in list(SCORE_COLUMNS.values()) + ["weighted_total"]:
+                assert abs(round(float(scores[column][row]), 3) - expected[column]) <= TOLERANCE, (case_study["id"], column)
+
+
+def test_search_matches_exhaustive_top_k(index):
+    for req in requests():
+        input_embeddings = embeddings_for(req)
+        scores = index.score(req, input_embeddings, WEIGHTS)
+        for rows in (None, index.candidate_rows(state=req.state), index.candidate_rows(age=req.child_age, max_age_gap=3)):
+            top_rows, top_totals = index.search(req, input_embeddings, WEIGHTS, 5, rows)
+            expected_rows = index.top_k(scores, 5, rows)
+            assert list(top_rows) == list(expected_rows)
+            assert list(top_totals) == list(scores["weighted_total"][expected_rows])
+
+
+def test_score_batch_matches_score(index):
+    reqs = requests()
+    input_embeddings = [embeddings_for(req) for req in reqs]
+    batch = index.score_batch(reqs, input_embeddings, WEIGHTS)
+    for position, req in enumerate(reqs):
+        single = index.score(req, input_embeddings[position], WEIGHTS)
+        for column, values in single.items():
+            np.testing.assert_allclose(batch[column][position], values, atol=1e-6)
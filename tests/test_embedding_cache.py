@@ -0,0 +1,54 @@
+import threading
+
+import numpy as np
+
+from app.similarity_calculations.embedding_cache import EmbeddingCache
+
+
+def test_disk_tier_keeps_the_newest_rows(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path=path, disk_max_items=100)
+    for i in range(250):
+        cache.put("model", "text %d" % i, [float(i)] * 4)
+
+    rows = cache._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert rows == 100
+    assert cache.snapshot_stats()["disk_evictions"] == 150
+
+    # A fresh process only finds the newest entries on disk
+    reopened = EmbeddingCache(path=path, disk_max_items=100)
+    assert reopened.get("model", "text 149") is None
+    np.testing.assert_array_equal(reopened.get("model", "text 150"), [150.0] * 4)
+    np.testing.assert_array_equal(reopened.get("model", "text 249"), [249.0] * 4)
+
+
+def test_rewritten_entry_counts_as_new(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), disk_max_items=3)
+    for text in ["a", "b", "c", "a", "d"]:
+        cache.put("model", text, [1.0])
+    cache.clear_memory()
+
+    assert cache.get("model", "b") is None
+    assert all(cache.get("model", text) is not None for text in ["a", "c", "d"])
+
+
+def test_stats_are_exact_under_concurrent_use(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_items=10)
+    threads = 8
+    per_thread = 50
+
+    def worker(n):
+        for i in range(per_thread):
+            text = "text %d %d" % (n, i)
+            cache.get("model", text)
+            cache.put("model", text, [float(i)])
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    stats = cache.snapshot_stats()
+    assert stats["misses"] == stats["writes"] == threads * per_thread
+    assert stats["disk_errors"] == 0
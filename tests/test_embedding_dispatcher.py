@@ -0,0 +1,184 @@
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.similarity_calculations import text_similarity
+from app.similarity_calculations.embedding_cache import EmbeddingCache, cache_key
+from app.similarity_calculations.text_similarity import EmbeddingDispatcher
+from benchmarks.fakes import FakeEmbeddings
+
+WINDOW = 0.02
+# Long enough that everything submitted after the first request is sent while it is in flight
+LATENCY = 0.2
+
+
+class RejectingEmbeddings(FakeEmbeddings):
+    """Rejects any request containing `bad_text` with a 400, as the API does for an invalid input."""
+
+    def __init__(self, bad_text: str):
+        super().__init__(dim=8, latency_seconds=LATENCY)
+        self.bad_text = bad_text
+
+    def create(self, model, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        if self.bad_text in texts:
+            response = httpx.Response(400, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+            raise openai.BadRequestError("invalid input", response=response, body=None)
+        return super().create(model, input, **kwargs)
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    def create(self, model, input, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_seconds)
+        raise RuntimeError("embeddings unavailable")
+
+
+class Client:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = Client(FakeEmbeddings(dim=8, latency_seconds=LATENCY))
+    monkeypatch.setattr(text_similarity, "client", client)
+    monkeypatch.setattr(text_similarity, "embedding_cache", EmbeddingCache(path=None))
+    return client
+
+
+def start_request(dispatcher, embeddings, text="first"):
+    """Submit `text` on another thread and return its future once the request is in flight."""
+    # An idle dispatcher sends on the submitting thread, which is then busy until it returns
+    threading.Thread(target=dispatcher.submit, args=(text,), daemon=True).start()
+    deadline = time.monotonic() + 5
+    while embeddings.calls == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return dispatcher._in_flight[cache_key(text_similarity.EMBEDDING_MODEL, text)]
+
+
+def submit_concurrently(dispatcher, texts):
+    barrier = threading.Barrier(len(texts))
+    futures = [None] * len(texts)
+
+    def worker(i):
+        barrier.wait()
+        futures[i] = dispatcher.submit(texts[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return futures
+
+
+def test_submit_with_nothing_in_flight_does_not_wait_for_the_window(client):
+    client.embeddings.latency_seconds = 0
+    dispatcher = EmbeddingDispatcher(window=60)
+    future = dispatcher.submit("text")
+
+    assert future.done()
+    assert future.result() == client.embeddings.vector("text")
+    assert client.embeddings.calls == 1
+
+
+def test_concurrent_callers_for_one_text_share_a_request(client):
+    dispatcher = EmbeddingDispatcher(WINDOW)
+    first = start_request(dispatcher, client.embeddings, "same text")
+    futures = submit_concurrently(dispatcher, ["same text"] * 16)
+
+    assert all(future is first for future in futures)
+    assert first.result(timeout=5) == client.embeddings.vector("same text")
+    assert client.embeddings.calls == 1
+    assert client.embeddings.inputs == 1
+    assert dispatcher._in_flight == {}
+
+
+def test_texts_arriving_during_a_request_go_out_as_one_batch(client):
+    dispatcher = EmbeddingDispatcher(WINDOW)
+    first = start_request(dispatcher, client.embeddings)
+    texts = ["text %d" % i for i in range(12)]
+    futures = submit_concurrently(dispatcher, texts)
+
+    assert [future.result(timeout=5) for future in futures] == [client.embeddings.vector(text) for text in texts]
+    assert first.result(timeout=5) == client.embeddings.vector("first")
+    assert client.embeddings.calls == 2
+    assert client.embeddings.inputs == len(texts) + 1
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window(client):
+    dispatcher = EmbeddingDispatcher(window=60, max_batch=4)
+    start_request(dispatcher, client.embeddings)
+    futures = [dispatcher.submit("text %d" % i) for i in range(4)]
+
+    # The fourth submit sent the batch on this thread
+    assert all(future.done() for future in futures)
+    assert client.embeddings.calls == 2
+
+
+def test_failed_request_fails_every_caller_and_clears_in_flight(client, monkeypatch):
+    failing = FailingEmbeddings(dim=8, latency_seconds=LATENCY)
+    monkeypatch.setattr(client, "embeddings", failing)
+    dispatcher = EmbeddingDispatcher(WINDOW)
+    first = start_request(dispatcher, failing, "a")
+    futures = [first] + submit_concurrently(dispatcher, ["a", "b", "a", "c"])
+
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert failing.calls == 2
+    assert dispatcher._in_flight == {}
+    assert dispatcher._sending == 0
+
+    # A later caller for the same text starts a fresh request instead of joining the failed one
+    monkeypatch.setattr(client, "embeddings", FakeEmbeddings(dim=8))
+    assert dispatcher.submit("a").result(timeout=5) == client.embeddings.vector("a")
+
+
+def test_rejected_input_only_fails_its_own_callers(client, monkeypatch):
+    monkeypatch.setattr(client, "embeddings", RejectingEmbeddings("bad"))
+    dispatcher = EmbeddingDispatcher(WINDOW)
+    start_request(dispatcher, client.embeddings)
+    texts = ["good 1", "bad", "good 2", "bad", "good 3"]
+    futures = submit_concurrently(dispatcher, texts)
+
+    for text, future in zip(texts, futures):
+        if text == "bad":
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+        else:
+            assert future.result(timeout=5) == client.embeddings.vector(text)
+    assert dispatcher._in_flight == {}
+    assert text_similarity.embedding_cache.get(text_similarity.EMBEDDING_MODEL, "bad") is None
+
+
+def test_embed_returns_none_when_the_dispatcher_fails(client, monkeypatch):
+    monkeypatch.setattr(client, "embeddings", RejectingEmbeddings("bad"))
+    monkeypatch.setattr(text_similarity, "dispatcher", EmbeddingDispatcher(WINDOW))
+
+    assert text_similarity.embed("bad") is None
+    assert text_similarity.embed("good") == client.embeddings.vector("good")
+
+
+class StuckDispatcher(EmbeddingDispatcher):
+    """Takes batches but never resolves them, like a request that hangs."""
+
+    def _send(self, batch):
+        pass
+
+
+def test_embed_falls_back_to_a_direct_call_when_the_dispatcher_hangs(client, monkeypatch):
+    client.embeddings.latency_seconds = 0
+    dispatcher = StuckDispatcher(WINDOW)
+    monkeypatch.setattr(text_similarity, "dispatcher", dispatcher)
+    monkeypatch.setattr(text_similarity, "EMBEDDING_DISPATCH_TIMEOUT_SECONDS", 0.05)
+
+    assert text_similarity.embed("text") == client.embeddings.vector("text")
+    # The stuck request is forgotten, so the next caller doesn't join it
+    assert dispatcher._in_flight == {}
+    assert client.embeddings.calls == 1
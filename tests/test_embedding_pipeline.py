@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import Counter
+
+import httpx
+import openai
+import pytest
+from postgrest.exceptions import APIError
+
+from app import embedding_pipeline
+from app.embedding_pipeline import run_embedding_pipeline
+from app.retry import with_backoff
+from app.similarity_calculations import text_similarity
+from app.similarity_calculations.embedding_cache import EmbeddingCache
+from app.similarity_calculations.text_similarity import EmbeddingBatchResult
+from benchmarks.fakes import FakeEmbeddings, FakeSupabase
+
+RATE_LIMITED = {"resource 5", "resource 40", "resource 90"}
+REJECTED = {"resource 13", "resource 77"}
+# Upserts containing this row fail permanently; any other upsert is unavailable on its first attempt
+UNWRITABLE_ID = 101
+
+
+def api_error(status):
+    response = httpx.Response(status, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    if status == 429:
+        return openai.RateLimitError("rate limited", response=response, body=None)
+    return openai.BadRequestError("invalid input", response=response, body=None)
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """Answers 429 the first time each RATE_LIMITED text is sent and 400 whenever a REJECTED one is."""
+
+    def __init__(self):
+        super().__init__(dim=8)
+        self.rate_limited = set(RATE_LIMITED)
+
+    def create(self, model, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            limited = self.rate_limited & set(texts)
+            self.rate_limited -= limited
+            rejected = bool(REJECTED & set(texts))
+            if limited or rejected:
+                # FakeEmbeddings.create counts the calls that succeed
+                self.calls += 1
+        if limited:
+            raise api_error(429)
+        if rejected:
+            raise api_error(400)
+        return super().create(model, input, **kwargs)
+
+
+class FlakyWriter:
+    """Upserts into a FakeSupabase table, failing like PostgREST does under load."""
+
+    def __init__(self):
+        self.supabase = FakeSupabase()
+        self.attempted = set()
+        self.unavailable = 0
+        self.upserted = []
+
+    def __call__(self, rows):
+        ids = tuple(row["resource_id"] for row in rows)
+        if UNWRITABLE_ID in ids:
+            raise APIError({"message": "invalid input", "code": "400", "hint": None, "details": None})
+        if ids not in self.attempted:
+            self.attempted.add(ids)
+            self.unavailable += 1
+            raise APIError({"message": "unavailable", "code": "503", "hint": None, "details": None})
+        self.supabase.table("resource_embeddings").upsert(rows, on_conflict="resource_id").execute()
+        self.upserted.extend(ids)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays requested by the embedding client and the writer, without sleeping."""
+    sleeps = []
+    lock = threading.Lock()
+
+    def record(seconds):
+        with lock:
+            sleeps.append(seconds)
+
+    def no_sleep_backoff(fn):
+        return with_backoff(fn, sleep=record)
+
+    monkeypatch.setattr(text_similarity, "with_backoff", no_sleep_backoff)
+    monkeypatch.setattr(embedding_pipeline, "with_backoff", no_sleep_backoff)
+    return sleeps
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = FlakyEmbeddings()
+    monkeypatch.setattr(text_similarity, "client", type("Client", (), {"embeddings": embeddings})())
+    monkeypatch.setattr(text_similarity, "embedding_cache", EmbeddingCache(path=None))
+    return embeddings
+
+
+def test_pipeline_retries_transient_failures_and_writes_each_row_once(embeddings, sleeps):
+    items = [({"resource_id": i, "content_hash": "hash %d" % i}, "resource %d" % i) for i in range(1, 121)]
+    writer = FlakyWriter()
+
+    stats = run_embedding_pipeline(items, writer, batch_size=8, concurrency=4, upsert_size=10)
+
+    embed_failures = {row["resource_id"] for row, _ in stats.failures if row["resource_id"] in (13, 77)}
+    write_failures = [row["resource_id"] for row, _ in stats.failures if row["resource_id"] not in (13, 77)]
+    assert embed_failures == {13, 77}
+    assert stats.embedded == 118
+    assert stats.batches == 15
+    # The rejected upsert is one batch of at most upsert_size rows, including the bad row
+    assert UNWRITABLE_ID in write_failures and len(write_failures) <= 10
+    assert stats.failed == 2 + len(write_failures)
+    assert stats.written == 118 - len(write_failures)
+
+    # Every row that was written went in exactly once, despite the retried upserts
+    assert set(Counter(writer.upserted).values()) == {1}
+    assert set(writer.upserted) == set(range(1, 121)) - embed_failures - set(write_failures)
+    stored = writer.supabase.tables["resource_embeddings"].rows
+    assert sorted(row["resource_id"] for row in stored) == sorted(writer.upserted)
+
+    # One retry per 429 and per unavailable upsert; 400s are not retried
+    assert len(sleeps) == len(RATE_LIMITED) + writer.unavailable
+    assert embeddings.calls == stats.api_calls + len(RATE_LIMITED)
+
+
+class SlowStats(embedding_pipeline.PipelineStats):
+    """Yields to other threads between reading a counter and storing its new value."""
+
+    def __setattr__(self, name, value):
+        time.sleep(0.001)
+        super().__setattr__(name, value)
+
+
+def test_stats_are_exact_under_concurrent_updates(monkeypatch):
+    # The writer thread and the collecting thread update the same counters
+    monkeypatch.setattr(embedding_pipeline, "PipelineStats", SlowStats)
+
+    def embed_batch(texts):
+        result = EmbeddingBatchResult(embeddings=[[0.0]] * len(texts))
+        for index, text in enumerate(texts):
+            if text.endswith("7"):
+                result.embeddings[index] = None
+                result.errors[index] = "rejected"
+        result.api_calls = 1
+        return result
+
+    written = []
+
+    def write_rows(rows):
+        # A writer as slow as the collecting thread, so both update counters at once;
+        # both count failures: embedding failures there, write failures here
+        time.sleep(0.003)
+        if rows[0]["id"] % 10 == 3:
+            raise ValueError("rejected")
+        written.extend(rows)
+
+    items = [({"id": i}, "text %d" % i) for i in range(300)]
+    stats = run_embedding_pipeline(items, write_rows, embed_batch=embed_batch, batch_size=1, concurrency=8, upsert_size=1)
+
+    assert stats.batches == stats.api_calls == 300
+    assert stats.embedded == 270
+    assert stats.written == len(written) == 240
+    assert stats.failed == len(stats.failures) == 60
@@ -0,0 +1,37 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.similarity_calculations.array_overlap import array_overlap_score
+from app.similarity_calculations.label_bitsets import DIAGNOSIS_HIERARCHY, LabelBitsets
+
+# More than 64 distinct labels so rows span several bitset words
+LABELS = sorted(set(DIAGNOSIS_HIERARCHY) | set(DIAGNOSIS_HIERARCHY.values())) + ["label %d" % i for i in range(80)]
+
+
+def random_labels(rng):
+    if rng.random() < 0.1:
+        return None
+    labels = []
+    for label in rng.sample(LABELS, rng.randint(0, 6)):
+        variant = rng.choice([label, label.upper(), " %s " % label, label.title()])
+        labels.append(variant)
+    if rng.random() < 0.2:
+        labels.append(rng.choice(["", "  "]))
+    return labels
+
+
+@pytest.mark.parametrize("hierarchy", [None, DIAGNOSIS_HIERARCHY], ids=["flat", "hierarchy"])
+def test_jaccard_matches_array_overlap_score(hierarchy):
+    rng = random.Random(7)
+    rows = [random_labels(rng) for _ in range(400)]
+    bitsets = LabelBitsets(rows, hierarchy)
+    subset = np.array(sorted(rng.sample(range(len(rows)), 50)))
+
+    queries = [random_labels(rng) for _ in range(40)] + [None, [], ["  "], ["Unknown label"]]
+    for query in queries:
+        scores = bitsets.jaccard(query)
+        expected = [array_overlap_score(query, row or [], hierarchy) for row in rows]
+        np.testing.assert_allclose(scores, expected, atol=1e-12)
+        np.testing.assert_allclose(bitsets.jaccard(query, subset), np.array(expected)[subset], atol=1e-12)
@@ -0,0 +1,60 @@
+from app.response_cache import ResponseCache
+
+
+def response(case_id):
+    return {"similar_cases": [{"id": case_id, "similarity_score": 0.5}]}
+
+
+def test_new_version_invalidates_and_stale_versions_are_ignored():
+    cache = ResponseCache("test", max_items=10, ttl=60)
+    cache.put("a", (1, 1), response(1))
+    assert cache.get("a", (1, 1)) == response(1)
+
+    # The snapshot rolls over: the first new-version request drops the old entries
+    assert cache.get("a", (2, 1)) is None
+    cache.put("a", (2, 1), response(2))
+    cache.put("b", (2, 1), response(3))
+
+    # A request that still holds the old version neither switches back nor stores anything
+    assert cache.get("a", (1, 1)) is None
+    cache.put("c", (1, 1), response(4))
+    assert cache.get("a", (2, 1)) == response(2)
+    assert cache.get("b", (2, 1)) == response(3)
+    assert cache.get("c", (2, 1)) is None
+    assert len(cache) == 2
+
+
+def test_versions_need_not_be_ordered():
+    # Shared corpora are versioned by timestamp strings, private indexes by counters
+    cache = ResponseCache("test", max_items=10, ttl=60)
+    cache.put("a", (3, "20261018T120000000-42"), response(1))
+    cache.put("a", (3, 7), response(2))
+    assert cache.get("a", (3, 7)) == response(2)
+    assert cache.get("a", (3, "20261018T120000000-42")) is None
+
+
+def test_callers_cannot_mutate_cached_responses():
+    cache = ResponseCache("test", max_items=10, ttl=60)
+    stored = response(1)
+    cache.put("a", 1, stored)
+    stored["similar_cases"].append({"id": 9})
+
+    returned = cache.get("a", 1)
+    returned["similar_cases"][0]["similarity_score"] = 1.0
+    assert cache.get("a", 1) == response(1)
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = ResponseCache("test", max_items=2, ttl=60)
+    cache.put("a", 1, response(1))
+    cache.put("b", 1, response(2))
+    cache.get("a", 1)
+    cache.put("c", 1, response(3))
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == response(1)
+
+    clock = [1000.0]
+    monkeypatch.setattr("app.response_cache.time.monotonic", lambda: clock[0])
+    cache.put("d", 1, response(4))
+    clock[0] += 61
+    assert cache.get("d", 1) is None
@@ -0,0 +1,56 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import similar_resources
+from app.api.similar_resources import MAX_RESOURCE_RESULTS
+from app.deps import verify_key
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(similar_resources, "search_resources", lambda *args: calls.append(("search", args)) or [])
+    monkeypatch.setattr(similar_resources, "get_recommended_resources_for_user", lambda *args: calls.append(("user", args)) or [])
+    return calls
+
+
+@pytest.fixture
+def client(calls):
+    app = FastAPI()
+    app.include_router(similar_resources.router, prefix="/similar-resources")
+    app.dependency_overrides[verify_key] = lambda: None
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("body", [
+    {"text": ""},
+    {"text": "   \n\t"},
+    {"text": "speech therapy", "k": None},
+    {"text": "speech therapy", "k": 0},
+    {"text": "speech therapy", "k": MAX_RESOURCE_RESULTS + 1},
+])
+def test_search_rejects_invalid_requests_before_embedding(client, calls, body):
+    response = client.post("/similar-resources/search", json=body)
+    assert response.status_code == 422
+    assert calls == []
+
+
+def test_search_accepts_valid_requests(client, calls):
+    response = client.post("/similar-resources/search", json={"text": " speech therapy ", "k": MAX_RESOURCE_RESULTS})
+    assert response.status_code == 200
+    assert response.json() == {"similar_resources": []}
+    assert calls == [("search", (" speech therapy ", MAX_RESOURCE_RESULTS, None))]
+
+
+@pytest.mark.parametrize("k", ["", "null", "0", str(MAX_RESOURCE_RESULTS + 1)])
+def test_user_recommendations_reject_out_of_range_k(client, calls, k):
+    response = client.get("/similar-resources/users/user-1", params={"k": k})
+    assert response.status_code == 422
+    assert calls == []
+
+
+def test_user_recommendations_accept_valid_k(client, calls):
+    assert client.get("/similar-resources/users/user-1").status_code == 200
+    assert client.get("/similar-resources/users/user-1", params={"k": 3}).status_code == 200
+    assert calls == [("user", ("user-1", 5)), ("user", ("user-1", 3))]
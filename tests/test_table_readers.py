@@ -0,0 +1,101 @@
+import json
+from collections import Counter
+
+import httpx
+import pytest
+from postgrest import SyncPostgrestClient
+
+import app.supabase_client as supabase_client
+from app.retry import with_backoff
+from app.supabase_client import iter_table_pages
+from benchmarks.fakes import FakeSupabase
+
+ROWS = [{"id": i, "group": "even" if i % 2 == 0 else "odd", "value": "row %d" % i} for i in range(1, 258)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    monkeypatch.setattr(supabase_client, "with_backoff", lambda fn: with_backoff(fn, sleep=lambda seconds: None))
+
+
+def read_all(**kwargs):
+    return [row for page in iter_table_pages("items", ["value"], **kwargs) for row in page]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_pages_cover_a_table_larger_than_the_row_cap(monkeypatch, workers):
+    fake = FakeSupabase(max_rows=7)
+    fake.load("items", [dict(row) for row in reversed(ROWS)])
+    monkeypatch.setattr(supabase_client, "supabase", fake)
+
+    rows = read_all(page_size=10, workers=workers)
+    assert [row["id"] for row in rows] == [row["id"] for row in ROWS]
+    assert [row["value"] for row in rows] == [row["value"] for row in ROWS]
+
+    odd = read_all(filters={"group": "odd"}, page_size=10, workers=workers)
+    assert [row["id"] for row in odd] == [row["id"] for row in ROWS if row["group"] == "odd"]
+
+
+def test_empty_table_yields_no_pages(monkeypatch):
+    fake = FakeSupabase(max_rows=7)
+    fake.load("items", [])
+    monkeypatch.setattr(supabase_client, "supabase", fake)
+
+    assert list(iter_table_pages("items", ["value"], page_size=10)) == []
+
+
+class FlakyPostgrest:
+    """An in-memory PostgREST table behind httpx: caps every response at `max_rows`
+    and answers each distinct query with a 503 the first time it is sent."""
+
+    def __init__(self, rows, max_rows):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.seen = set()
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        self.requests.append(list(params.multi_items()))
+        if str(request.url) not in self.seen:
+            self.seen.add(str(request.url))
+            body = {"message": "unavailable", "code": "503", "hint": None, "details": None}
+            return httpx.Response(503, json=body, request=request)
+
+        rows = self.rows
+        for column, condition in params.multi_items():
+            if column in ("select", "order", "limit"):
+                continue
+            op, _, value = condition.partition(".")
+            rows = [row for row in rows if _compare(op, row[column], value)]
+        column, _, direction = params["order"].partition(".")
+        rows = sorted(rows, key=lambda row: row[column], reverse=direction == "desc")
+        rows = rows[:min(int(params["limit"]), self.max_rows)]
+        selected = params["select"].split(",")
+        body = [{column: row[column] for column in selected} for row in rows]
+        return httpx.Response(200, content=json.dumps(body), headers={"content-type": "application/json"}, request=request)
+
+
+def _compare(op, actual, value):
+    if op == "eq":
+        return str(actual) == value
+    actual, value = int(actual), int(value)
+    return {"gt": actual > value, "gte": actual >= value, "lte": actual <= value}[op]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_retried_pages_send_each_param_once(monkeypatch, workers):
+    server = FlakyPostgrest(ROWS, max_rows=7)
+    client = SyncPostgrestClient("http://postgrest.test", http_client=httpx.Client(transport=httpx.MockTransport(server)))
+    monkeypatch.setattr(supabase_client, "supabase", client)
+
+    rows = read_all(filters={"group": "even"}, page_size=10, workers=workers)
+
+    assert [row["id"] for row in rows] == [row["id"] for row in ROWS if row["group"] == "even"]
+    # Every query was retried once, and a retry must not carry the failed attempt's params
+    assert len(server.requests) == 2 * len(server.seen)
+    for params in server.requests:
+        names = Counter(name for name, _ in params)
+        assert names["select"] == names["order"] == names["limit"] == names["group"] == 1
+        assert names["id"] <= 2
+        assert len(set(params)) == len(params)
@@ -0,0 +1,71 @@
+import pytest
+from postgrest.exceptions import APIError
+
+import app.supabase_client as supabase_client
+from app.supabase_client import table_watermark
+from benchmarks.fakes import FakeQuery, FakeSupabase
+
+
+class FailingQuery(FakeQuery):
+    def __init__(self, table, max_rows, error):
+        super().__init__(table, max_rows)
+        self.error = error
+
+    def execute(self):
+        if self.error is not None:
+            raise self.error
+        return super().execute()
+
+
+class FlakySupabase(FakeSupabase):
+    """FakeSupabase whose queries raise `error` while it is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.error = None
+
+    def table(self, name):
+        super().table(name)
+        return FailingQuery(self.tables[name], self.max_rows, self.error)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FlakySupabase()
+    db.load("with_updated_at", [{"id": i, "updated_at": "2026-10-%02dT00:00:00" % i} for i in range(1, 6)])
+    db.load("without_updated_at", [{"id": i} for i in range(1, 8)])
+    monkeypatch.setattr(supabase_client, "supabase", db)
+    monkeypatch.setattr(supabase_client, "_watermark_unsupported", set())
+    return db
+
+
+def test_watermark_uses_updated_at(db):
+    assert table_watermark("with_updated_at")() == ((5, "2026-10-05T00:00:00"),)
+    assert supabase_client._watermark_unsupported == set()
+
+
+def test_missing_updated_at_falls_back_to_the_key(db):
+    probe = table_watermark("with_updated_at", "without_updated_at")
+    assert probe() == ((5, "2026-10-05T00:00:00"), (7, 7))
+    assert supabase_client._watermark_unsupported == {"without_updated_at"}
+
+    db.tables["without_updated_at"].rows.append({"id": 8})
+    assert probe() == ((5, "2026-10-05T00:00:00"), (8, 8))
+
+
+@pytest.mark.parametrize("error", [
+    ConnectionError("connection reset by peer"),
+    APIError({"message": "upstream timeout", "code": "504", "hint": None, "details": None}),
+    APIError({"message": "permission denied for table without_updated_at", "code": "42501", "hint": None, "details": None}),
+], ids=["network", "server", "permission"])
+def test_other_errors_propagate_without_falling_back(db, error):
+    probe = table_watermark("without_updated_at", "with_updated_at")
+    db.error = error
+    with pytest.raises(type(error)):
+        probe()
+    assert supabase_client._watermark_unsupported == set()
+
+    # Once the error clears, updated_at is still used where it exists
+    db.error = None
+    assert probe() == ((7, 7), (5, "2026-10-05T00:00:00"))
+    assert supabase_client._watermark_unsupported == {"without_updated_at"}
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import app.supabase_client as supabase_client
+from app import user_recommendations
+from app.similarity_calculations import text_similarity
+from app.similarity_calculations.embedding_cache import EmbeddingCache
+from app.supabase_client import SUPABASE_IN_FILTER_SIZE, user_profile_text
+from app.user_recommendations import RECOMMENDATIONS_TABLE, get_user_recommendations, update_user_recommendations
+from benchmarks.fakes import FakeOpenAI, FakeQuery, FakeSupabase, to_pgvector
+from benchmarks.synthetic import generate_resources
+
+DIM = 16
+K = 5
+
+
+class RecordingQuery(FakeQuery):
+    def __init__(self, table, max_rows, in_sizes):
+        super().__init__(table, max_rows)
+        self.in_sizes = in_sizes
+
+    def in_(self, column, values):
+        self.in_sizes.append(len(values))
+        return super().in_(column, values)
+
+
+class RecordingSupabase(FakeSupabase):
+    """FakeSupabase that records the number of values in every `in` filter."""
+
+    def __init__(self):
+        super().__init__()
+        self.in_sizes = []
+
+    def table(self, name):
+        super().table(name)
+        return RecordingQuery(self.tables[name], self.max_rows, self.in_sizes)
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    client = FakeOpenAI(dim=DIM)
+    monkeypatch.setattr(text_similarity, "client", client)
+    monkeypatch.setattr(text_similarity, "embedding_cache", EmbeddingCache(path=None))
+    return client
+
+
+@pytest.fixture
+def db(monkeypatch, openai):
+    db = RecordingSupabase()
+    resources = generate_resources(40)
+    db.load("resources", resources)
+    db.load("resource_embeddings", [
+        {"resource_id": resource["id"], "content_hash": "v1", "embedding": to_pgvector(openai.embeddings.vector("resource %s" % resource["id"]))}
+        for resource in resources
+    ])
+    db.load("users", [
+        {"user_id": "user-%03d" % i, "current_challenges": ["sleep"] if i % 2 else None, "first_session_notes": "notes %d" % i, "additional_info": "info"}
+        for i in range(250)
+    ])
+    db.load("user_childs", [{"id": i, "user_id": "user-%03d" % (i % 250), "diagnoses": ["ADHD", "Anxiety"][:i % 3]} for i in range(300)])
+    monkeypatch.setattr(supabase_client, "supabase", db)
+    return db
+
+
+def exact_scores(db, openai, user):
+    """{resource id: cosine similarity} of a user's profile to every resource, in float64."""
+    rows = db.tables["resource_embeddings"].rows
+    matrix = np.array([supabase_client.parse_embedding(row["embedding"]) for row in rows], dtype=np.float64)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    diagnoses = supabase_client.get_all_child_diagnoses().get(user["user_id"], [])
+    query = np.array(openai.embeddings.vector(user_profile_text(user, diagnoses)), dtype=np.float64)
+    scores = matrix @ (query / np.linalg.norm(query))
+    return {row["resource_id"]: score for row, score in zip(rows, scores)}
+
+
+def check_against_exact_scoring(db, openai):
+    # The index scores in float32, so near-ties may come out in either order
+    tolerance = 1e-5
+    for user in db.tables["users"].rows:
+        exact = exact_scores(db, openai, user)
+        kth_best = sorted(exact.values(), reverse=True)[K - 1]
+        stored = get_user_recommendations(user["user_id"])
+        assert len({row["resource_id"] for row in stored}) == len(stored) == K
+        for row in stored:
+            assert abs(row["score"] - exact[row["resource_id"]]) <= tolerance
+            assert exact[row["resource_id"]] >= kth_best - tolerance
+        scores = [row["score"] for row in stored]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_stored_top_k_matches_exact_scoring(db, openai):
+    update_user_recommendations(k=K)
+
+    assert len(db.tables[RECOMMENDATIONS_TABLE].rows) == 250
+    check_against_exact_scoring(db, openai)
+    assert get_user_recommendations("no-such-user") is None
+
+    # Unchanged profiles and catalog: nothing is embedded again
+    calls = openai.embeddings.calls
+    update_user_recommendations(k=K)
+    assert openai.embeddings.calls == calls
+
+
+def test_in_filters_are_chunked(db, openai):
+    update_user_recommendations(k=K)
+    assert db.in_sizes == []
+
+    # A re-embedded resource makes every stored row stale, and 130 users are deleted:
+    # the 120 remaining users' stored embeddings and the 130 orphaned rows are each
+    # looked up or deleted in more than one `in` filter
+    db.tables["resource_embeddings"].rows[0].update(content_hash="v2", embedding=to_pgvector(openai.embeddings.vector("new text")))
+    db.tables["users"].rows = db.tables["users"].rows[:120]
+    calls = openai.embeddings.calls
+    update_user_recommendations(k=K)
+
+    assert db.in_sizes and max(db.in_sizes) <= SUPABASE_IN_FILTER_SIZE
+    assert sorted(db.in_sizes) == sorted([100, 20] + [100, 30])
+    # Catalog-only changes reuse the stored profile embeddings
+    assert openai.embeddings.calls == calls
+    assert sorted(row["user_id"] for row in db.tables[RECOMMENDATIONS_TABLE].rows) == ["user-%03d" % i for i in range(120)]
+    check_against_exact_scoring(db, openai)
@@ -0,0 +1,61 @@
+import struct
+
+import numpy as np
+import pytest
+
+from app.similarity_calculations.vector_codec import decode_embeddings, parse_embedding
+from benchmarks.fakes import to_pgvector
+
+
+def to_pgvector_binary(values):
+    return struct.pack(">hh", len(values), 0) + np.asarray(values, dtype=">f4").tobytes()
+
+
+VECTORS = np.random.default_rng(3).standard_normal((5, 4)).astype(np.float32)
+
+
+def test_text_rows_decode_to_one_matrix():
+    matrix, present = decode_embeddings([to_pgvector(row) for row in VECTORS])
+    assert present.all()
+    np.testing.assert_allclose(matrix, VECTORS, rtol=1e-6)
+
+
+def test_mixed_width_text_rows_are_rejected_even_when_the_total_divides_evenly():
+    # 3 + 5 = 8 components would reshape into two rows of 4 without the per-row check
+    values = [to_pgvector(VECTORS[0][:3]), to_pgvector(np.concatenate([VECTORS[1], VECTORS[2][:1]]))]
+    with pytest.raises(ValueError, match="dimensions"):
+        decode_embeddings(values)
+    with pytest.raises(ValueError, match="dimensions"):
+        decode_embeddings([to_pgvector(VECTORS[0][:3]), to_pgvector(VECTORS[1][:3])], dim=4)
+
+
+def test_binary_payloads_and_wrappers_decode_like_text():
+    values = [
+        to_pgvector_binary(VECTORS[0]),
+        {"embedding": to_pgvector(VECTORS[1])},
+        [{"embedding": to_pgvector_binary(VECTORS[2])}],
+        VECTORS[3].tolist(),
+        [{"embedding": to_pgvector(VECTORS[4])}],
+    ]
+    matrix, present = decode_embeddings(values)
+    assert present.all()
+    np.testing.assert_allclose(matrix, VECTORS, rtol=1e-6)
+
+
+def test_missing_rows_are_zero_and_masked():
+    values = [None, to_pgvector(VECTORS[0]), {"embedding": None}, [{"embedding": to_pgvector(VECTORS[1])}], None]
+    matrix, present = decode_embeddings(values)
+    assert present.tolist() == [False, True, False, True, False]
+    np.testing.assert_allclose(matrix[present], VECTORS[:2], rtol=1e-6)
+    assert not matrix[~present].any()
+
+    matrix, present = decode_embeddings([None, None], dim=4)
+    assert matrix.shape == (2, 4) and not present.any()
+
+
+def test_parse_embedding_unwraps_every_format():
+    expected = VECTORS[0].tolist()
+    for value in (to_pgvector(VECTORS[0]), to_pgvector_binary(VECTORS[0]), {"embedding": to_pgvector(VECTORS[0])}, [{"embedding": expected}]):
+        np.testing.assert_allclose(parse_embedding(value), expected, rtol=1e-6)
+    assert parse_embedding(None) is None
+    assert parse_embedding([{"embedding": None}]) is None